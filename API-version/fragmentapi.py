@@ -1,7 +1,7 @@
 import asyncio
 import base64
-import re
 import httpx
+from functools import lru_cache
 from tonutils.client import TonapiClient
 from tonutils.wallet import WalletV5R1
 
@@ -52,6 +52,16 @@ def fix_base64_padding(b64_string: str) -> str:
     return b64_string
 
 
+# Таблица для bytes.translate: печатный ASCII как есть, остальное -> пробел
+PRINTABLE_TABLE = bytes(b if 32 <= b < 127 else 32 for b in range(256))
+
+
+@lru_cache(maxsize=1024)
+def stars_marker(stars_count: int) -> str:
+    """Начало нужной части payload ("X Telegram Stars")"""
+    return f"{stars_count} Telegram Stars"
+
+
 # FRAGMENT CLIENT 
 class FragmentClient:
     # Клиент для работы с Fragment API
@@ -171,14 +181,14 @@ class TonTransaction:
         decoded_bytes = base64.b64decode(fix_base64_padding(payload_base64))
         
         # Преобразование в читаемый текст
-        decoded_text = "".join(chr(b) if 32 <= b < 127 else " " for b in decoded_bytes)
+        decoded_text = decoded_bytes.translate(PRINTABLE_TABLE).decode("ascii")
         
         # Очистка от лишних пробелов
-        clean_text = re.sub(r"\s+", " ", decoded_text).strip()
+        clean_text = " ".join(decoded_text.split())
         
         # Извлечение нужной части (от "X Telegram Stars")
-        match = re.search(rf"{stars_count} Telegram Stars.*", clean_text)
-        return match.group(0) if match else clean_text
+        start = clean_text.find(stars_marker(stars_count))
+        return clean_text[start:] if start >= 0 else clean_text
     
     async def send_transaction(self, recipient_address: str, amount_nano: float, 
                               payload: str, stars_count: int):
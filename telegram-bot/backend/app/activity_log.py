@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.database import activity_row, log_user_activity_batch
+from app.db_async import async_db
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityLogBuffer:
+    """
+    Буфер журнала запросов (user_activity_logs) для SecurityMiddleware.
+
+    log() только добавляет строку в память. Фоновая задача пишет накопленное
+    одним executemany в одной транзакции - как только набралось batch_size
+    строк или прошло flush_interval секунд. Буфер ограничен max_rows:
+    при переполнении overflow="drop_oldest" вытесняет самые старые строки,
+    "drop_newest" отбрасывает новые. Остаток дописывается при остановке.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_rows: int = 10000, overflow: str = "drop_oldest"):
+        if overflow not in ("drop_oldest", "drop_newest"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.overflow = overflow
+        self._rows: Deque[tuple] = deque()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Без cancel: начатая запись должна завершиться и попасть в счетчики
+        if self._task is not None:
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        while self._rows:
+            if not await self.flush():
+                break
+
+    def stats(self) -> Dict:
+        return {
+            "buffered": len(self._rows),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes
+        }
+
+    def log(self, **activity):
+        """Аргументы как у database.log_user_activity"""
+        if len(self._rows) >= self.max_rows:
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                return
+            self._rows.popleft()
+
+        self._rows.append(activity_row(**activity))
+        if len(self._rows) >= self.batch_size:
+            self._full.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+
+            try:
+                while self._rows and await self.flush() and len(self._rows) >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"❌ Activity log flush failed: {e}")
+
+    async def flush(self) -> bool:
+        """Пишет до batch_size строк. False - запись не удалась, строки вернулись в буфер"""
+        batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+        if not batch:
+            return True
+
+        try:
+            await async_db.write(log_user_activity_batch, batch)
+        except Exception as e:
+            logger.error(f"❌ Failed to write {len(batch)} activity rows: {e}")
+            # Возвращаем в начало буфера, сколько поместится
+            free = self.max_rows - len(self._rows)
+            self.dropped += max(0, len(batch) - free)
+            self._rows.extendleft(reversed(batch[:max(0, free)]))
+            return False
+
+        self.written += len(batch)
+        self.flushes += 1
+        return True
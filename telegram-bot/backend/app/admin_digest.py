@@ -0,0 +1,149 @@
+import html
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+from datetime import datetime
+from typing import Deque, Dict, Optional
+
+from app.telegram_notifier import TelegramNotifier
+
+logger = logging.getLogger(__name__)
+
+
+class AdminDigest:
+    """
+    Уведомления админу о покупках с переходом в режим сводки.
+
+    Пока покупок за последнюю минуту не больше threshold, каждая покупка -
+    отдельное сообщение (notify_purchase_success). Выше порога покупки
+    копятся и раз в interval секунд уходят одним сообщением: количество,
+    сумма Stars, топ получателей и ошибки заказов. Когда поток падает
+    ниже порога, уведомления снова идут по одному.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, telegram_notifier: TelegramNotifier, threshold: int = 30,
+                 interval: float = 60.0, top: int = 5):
+        self.notifier = telegram_notifier
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.active = False
+        self._recent: Deque[float] = deque()
+        self._reset()
+        self._task: Optional[asyncio.Task] = None
+        self.digests_sent = 0
+
+    def _reset(self):
+        self.count = 0
+        self.stars = 0
+        self.recipients: Counter = Counter()
+        self.failures: Counter = Counter()
+        self.started_at = datetime.now()
+
+    async def start(self):
+        if self._task is None and self.threshold > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Накопленное не теряем
+        await self.flush()
+
+    def rate(self) -> int:
+        """Покупок за последнюю минуту"""
+        deadline = time.monotonic() - self.WINDOW
+        while self._recent and self._recent[0] < deadline:
+            self._recent.popleft()
+        return len(self._recent)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": "digest" if self.active else "per_purchase",
+            "purchases_per_minute": self.rate(),
+            "threshold": self.threshold,
+            "pending": self.count,
+            "pending_failures": sum(self.failures.values()),
+            "digests_sent": self.digests_sent
+        }
+
+    async def purchase(self, **purchase) -> bool:
+        """Обработчик события outbox admin_purchase"""
+        self._recent.append(time.monotonic())
+
+        if not self.active and self.threshold > 0 and self.rate() > self.threshold:
+            self.active = True
+            logger.info(f"📦 Admin notifications: digest mode ({self.rate()} purchases/min)")
+
+        if not self.active:
+            return await self.notifier.notify_purchase_success(**purchase)
+
+        self.count += 1
+        self.stars += purchase["amount"]
+        self.recipients[purchase["recipient_username"]] += 1
+        return True
+
+    def failure(self, order_id: int, error: str):
+        """Ошибка заказа. Попадает только в сводку - по одной админу не отправляются"""
+        if self.active:
+            self.failures[error] += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+                if self.active and self.rate() <= self.threshold:
+                    self.active = False
+                    logger.info(f"📨 Admin notifications: per-purchase mode ({self.rate()} purchases/min)")
+            except Exception as e:
+                logger.error(f"❌ Admin digest failed: {e}")
+
+    async def flush(self) -> bool:
+        """Отправляет сводку, если есть что отправлять"""
+        if not self.count and not self.failures:
+            return True
+
+        # Покупки, пришедшие во время отправки, попадут уже в следующую сводку
+        message = self._format()
+        count, stars, recipients, failures, started_at = (
+            self.count, self.stars, self.recipients, self.failures, self.started_at
+        )
+        self._reset()
+
+        if not await self.notifier.send_message(self.notifier.admin_id, message):
+            # Сводка уйдет в следующий раз вместе с новыми покупками
+            self.count += count
+            self.stars += stars
+            self.recipients.update(recipients)
+            self.failures.update(failures)
+            self.started_at = started_at
+            return False
+
+        self.digests_sent += 1
+        return True
+
+    def _format(self) -> str:
+        message = (
+            "📦 <b>СВОДКА ПОКУПОК STARS</b>\n\n"
+            f"🕐 {self.started_at.strftime('%H:%M:%S')} — {datetime.now().strftime('%H:%M:%S')}\n"
+            f"🛒 Покупок: <b>{self.count}</b>\n"
+            f"⭐ Всего: <b>{self.stars} Stars</b>\n"
+        )
+
+        if self.recipients:
+            message += "\n🎯 Топ получателей:\n"
+            for username, count in self.recipients.most_common(self.top):
+                message += f"• <code>@{username}</code> — {count}\n"
+
+        if self.failures:
+            message += f"\n❌ Ошибок: <b>{sum(self.failures.values())}</b>\n"
+            for error, count in self.failures.most_common(self.top):
+                message += f"• {html.escape(error)} — {count}\n"
+
+        return message
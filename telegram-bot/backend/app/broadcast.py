@@ -0,0 +1,170 @@
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from app.telegram_notifier import TelegramNotifier, TokenBucket
+from app.db_async import async_db
+from app.database import (
+    get_purchase_user_ids,
+    count_purchase_users,
+    create_broadcast,
+    get_broadcast,
+    get_broadcasts,
+    checkpoint_broadcast,
+    finish_broadcast
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    """
+    Рассылка сообщения всем покупателям.
+
+    Получатели читаются из purchase_users (множество покупателей, которое
+    ведется при записи покупки) страницами по page_size с курсором по
+    user_id: WHERE user_id > cursor ORDER BY user_id по первичному ключу,
+    весь список в памяти не держится. Отправка идет через
+    TelegramNotifier со своим темпом rate (ниже общего лимита бота, чтобы
+    уведомления о покупках не ждали рассылку) и не больше concurrency
+    сообщений в очереди отправки. После каждой страницы курсор и счетчики
+    сохраняются (при остановке - до последнего отправленного подряд), поэтому
+    после рестарта рассылка продолжается с места остановки. По окончании
+    админ получает отчет.
+    """
+
+    def __init__(self, telegram_notifier: TelegramNotifier, rate: float = 20.0,
+                 concurrency: int = 20, page_size: int = 200):
+        self.notifier = telegram_notifier
+        self.rate = rate
+        self.page_size = page_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rate)
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def running(self) -> List[int]:
+        return list(self._tasks)
+
+    async def start_broadcast(self, text: str) -> int:
+        total = await async_db.read(count_purchase_users)
+        broadcast_id = await async_db.write(create_broadcast, text, total)
+        logger.info(f"📣 Broadcast #{broadcast_id} started: {total} recipients")
+        self._spawn(await async_db.read(get_broadcast, broadcast_id))
+        return broadcast_id
+
+    async def resume(self):
+        """Продолжает рассылки, прерванные рестартом"""
+        for broadcast in await async_db.read(get_broadcasts, "running"):
+            logger.info(
+                f"🔄 Broadcast #{broadcast['id']} resumed after user {broadcast['cursor_user_id']} "
+                f"({broadcast['sent'] + broadcast['failed']}/{broadcast['total']})"
+            )
+            self._spawn(broadcast)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        if not await async_db.write(finish_broadcast, broadcast_id, "cancelled"):
+            return False
+
+        task = self._tasks.pop(broadcast_id, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        logger.info(f"🛑 Broadcast #{broadcast_id} cancelled")
+        return True
+
+    async def stop(self):
+        # Статус остается running - после рестарта рассылка продолжится
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _spawn(self, broadcast: Dict):
+        task = asyncio.create_task(self._run(broadcast))
+        self._tasks[broadcast["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast["id"], None))
+
+    async def _paced_send(self, user_id: int, text: str) -> bool:
+        async with self._semaphore:
+            while (delay := self._bucket.delay()) > 0:
+                await asyncio.sleep(delay)
+            self._bucket.take()
+            return await self.notifier.send_message(user_id, text)
+
+    async def _run(self, broadcast: Dict):
+        broadcast_id = broadcast["id"]
+        cursor = broadcast["cursor_user_id"]
+        sent = broadcast["sent"]
+        failed = broadcast["failed"]
+        started_at = time.monotonic()
+
+        try:
+            while True:
+                user_ids = await async_db.read(get_purchase_user_ids, cursor, self.page_size)
+                if not user_ids:
+                    break
+
+                sends = [asyncio.create_task(self._paced_send(user_id, broadcast["text"])) for user_id in user_ids]
+                try:
+                    await asyncio.gather(*sends)
+                except asyncio.CancelledError:
+                    # Остановка посреди страницы: сохраняем непрерывно отправленное начало
+                    done = 0
+                    while done < len(sends) and sends[done].done() and not sends[done].cancelled():
+                        done += 1
+                    for task in sends[done:]:
+                        task.cancel()
+                    if done:
+                        delivered = sum(1 for task in sends[:done] if task.result())
+                        await async_db.write(checkpoint_broadcast, broadcast_id, user_ids[done - 1],
+                                             sent + delivered, failed + done - delivered)
+                    raise
+
+                delivered = sum(1 for task in sends if task.result())
+                sent += delivered
+                failed += len(sends) - delivered
+
+                cursor = user_ids[-1]
+                await async_db.write(checkpoint_broadcast, broadcast_id, cursor, sent, failed)
+                logger.info(f"📣 Broadcast #{broadcast_id}: {sent + failed}/{broadcast['total']} processed")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Broadcast #{broadcast_id} failed: {e}")
+            await async_db.write(finish_broadcast, broadcast_id, "failed")
+            return
+
+        if await async_db.write(finish_broadcast, broadcast_id, "done"):
+            elapsed = time.monotonic() - started_at
+            logger.info(f"✅ Broadcast #{broadcast_id} done: {sent} sent, {failed} failed in {elapsed:.0f}s")
+            await self.notifier.send_message(
+                self.notifier.admin_id,
+                "📣 <b>РАССЫЛКА ЗАВЕРШЕНА</b>\n\n"
+                f"🆔 Рассылка: #{broadcast_id}\n"
+                f"👥 Получателей: {sent + failed}\n"
+                f"✅ Доставлено: <b>{sent}</b>\n"
+                f"❌ Не доставлено: <b>{failed}</b>\n"
+                f"⏱ Время: {elapsed:.0f} с"
+            )
+
+    @staticmethod
+    def report(broadcast_id: int) -> Optional[Dict]:
+        broadcast = get_broadcast(broadcast_id)
+        if not broadcast:
+            return None
+
+        processed = broadcast["sent"] + broadcast["failed"]
+        return {
+            "id": broadcast["id"],
+            "status": broadcast["status"],
+            "total": broadcast["total"],
+            "sent": broadcast["sent"],
+            "failed": broadcast["failed"],
+            "progress": round(processed / broadcast["total"], 4) if broadcast["total"] else 1.0,
+            "cursor_user_id": broadcast["cursor_user_id"],
+            "created_at": broadcast["created_at"],
+            "finished_at": broadcast["finished_at"]
+        }
@@ -13,6 +13,26 @@ class Settings(BaseSettings):
     fragment_wallets: str
     fragment_address: str
     
+    # Fragment HTTP pool (keep-alive / HTTP/2)
+    fragment_http2: bool = True
+    fragment_max_connections: int = 20
+    fragment_max_keepalive_connections: int = 10
+    fragment_keepalive_expiry: float = 30.0
+    fragment_connect_timeout: float = 5.0
+    fragment_request_timeout: float = 10.0
+    fragment_buy_link_timeout: float = 15.0
+    
+    # Кэш searchStarsRecipient (TTL в секундах)
+    recipient_cache_size: int = 1000
+    recipient_cache_ttl: float = 300.0
+    
+    # Кэш ненайденных username (Bloom filter + TTL, снапшот на диск)
+    negative_cache_ttl: float = 600.0
+    negative_cache_capacity: int = 100000
+    negative_cache_error_rate: float = 0.001
+    negative_cache_path: str = "data/negative_usernames.json"
+    negative_cache_snapshot_interval: float = 60.0
+    
     # Fragment Cookies
     stel_ssid: str
     stel_dt: str
@@ -22,6 +42,29 @@ class Settings(BaseSettings):
     # TON Wallet Mnemonic
     mnemonic: str  # Comma-separated words
     
+    # Отправка с кошелька: ожидание продвижения seqno в сети
+    wallet_confirm_timeout: float = 60.0
+    wallet_seqno_poll_interval: float = 1.0
+    
+    # Пакетная отправка: до N сообщений (макс. 255) или окно в миллисекундах
+    wallet_batch_max_messages: int = 100
+    wallet_batch_window_ms: int = 200
+    
+    # Пул горячих кошельков: дополнительные мнемоники через ";" (слова через ",")
+    pool_mnemonics: str = ""
+    # Кошелек с балансом ниже порога (TON) не получает заказы
+    wallet_min_balance: float = 0.5
+    # Ошибок отправки подряд до исключения кошелька из пула
+    wallet_max_failures: int = 3
+    
+    # Кэш баланса: фоновое обновление (секунды) и порог для уведомления админу (TON)
+    wallet_balance_refresh_interval: float = 30.0
+    wallet_low_balance_threshold: float = 5.0
+    # Резерв баланса под заказ снимается, если заказ не отправлен за N секунд
+    wallet_reservation_ttl: float = 900.0
+    # Запас на комиссию сети (TON), добавляется к резерву каждого перевода
+    wallet_fee_margin: float = 0.01
+    
     # TON Wallet Address (куда приходят платежи)
     wallet_address: str = "UQB-09E7MDYhYmkuubv0gsOL0Zpll4MwbuKfu5TB4XOG_dn3"
 
@@ -30,6 +73,10 @@ class Settings(BaseSettings):
     bot_token: str = ""
     admin_telegram_id: int = 0
     admin_token: str = ""  # Токен для доступа к /admin/* endpoints
+    # Лимиты Bot API: сообщений в секунду на бота и на один чат, размер очереди отправки
+    telegram_global_rate: float = 30.0
+    telegram_chat_rate: float = 1.0
+    telegram_send_queue: int = 10000
     
     # Web App URL (для кнопок)
     web_app_url: str = "https://webstorstars.duckdns.org"
@@ -45,6 +92,49 @@ class Settings(BaseSettings):
     min_stars: int = 50
     max_stars: int = 1000000
     
+    # Подтверждение отправленных транзакций в сети (опрос tonapi)
+    confirmation_interval: float = 5.0
+    confirmation_page_size: int = 100
+    confirmation_max_pages: int = 10
+    confirmation_timeout: float = 300.0
+    confirmation_seqno_grace: float = 30.0
+    
+    # Входящие платежи TON на wallet_address (опрос tonapi)
+    payment_watch_interval: float = 5.0
+    payment_timeout: float = 1800.0
+    
+    # Защита от повторов: окно в памяти (секунды), лимит записей, хранение в БД (дни)
+    replay_window: float = 3600.0
+    replay_memory_max: int = 100000
+    replay_retention_days: int = 30
+    
+    # Очередь покупок
+    purchase_workers: int = 4
+    purchase_queue_size: int = 1000
+    
+    # Сводка для админа: больше admin_digest_threshold покупок в минуту (0 - выключено)
+    # уведомления объединяются в одно сообщение раз в admin_digest_interval секунд
+    admin_digest_threshold: int = 30
+    admin_digest_interval: float = 60.0
+    
+    # Рассылки: сообщений в секунду (ниже telegram_global_rate), в очереди отправки, страница получателей
+    broadcast_rate: float = 20.0
+    broadcast_concurrency: int = 20
+    broadcast_page_size: int = 200
+    
+    # Журнал запросов: пачка строк, интервал записи (с), лимит буфера, drop_oldest | drop_newest
+    activity_log_batch_size: int = 200
+    activity_log_flush_interval: float = 0.5
+    activity_log_max_rows: int = 10000
+    activity_log_overflow: str = "drop_oldest"
+    
+    # Outbox уведомлений: пачка, параллельность, попытки до dead, базовая задержка повтора
+    outbox_interval: float = 2.0
+    outbox_batch_size: int = 50
+    outbox_concurrency: int = 10
+    outbox_max_attempts: int = 8
+    outbox_retry_base: float = 5.0
+    
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -55,6 +145,14 @@ class Settings(BaseSettings):
     def mnemonic_list(self) -> List[str]:
         return [word.strip() for word in self.mnemonic.split(",")]
     
+    @property
+    def pool_mnemonic_lists(self) -> List[List[str]]:
+        return [
+            [word.strip() for word in phrase.split(",")]
+            for phrase in self.pool_mnemonics.split(";")
+            if phrase.strip()
+        ]
+    
     @property
     def fragment_data(self) -> dict:
         return {
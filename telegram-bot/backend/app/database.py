@@ -1,109 +1,412 @@
 import sqlite3
 import logging
+import threading
 from datetime import datetime
 from typing import Optional, List, Dict
 from contextlib import contextmanager
 import json
 
+from app.migrations import Migration, run_migrations
+
 logger = logging.getLogger(__name__)
 
 DATABASE_PATH = "telegram_stars.db"
 
+# WAL: читатели не блокируют писателя; synchronous=NORMAL в WAL не теряет
+# целостность, fsync только на checkpoint
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",      # 16 MB
+    "PRAGMA mmap_size=268435456",    # 256 MB
+    "PRAGMA temp_store=MEMORY",
+)
+# Кэш подготовленных выражений sqlite3 на соединение
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения SQLite.
+    
+    У каждого потока одно соединение для записи и отдельное соединение
+    только для чтения (query_only): соединения не открываются на каждый
+    запрос, а подготовленные выражения переиспользуются из кэша sqlite3.
+    close() закрывает все соединения; потоки откроют новые при следующем
+    обращении (как и при смене DATABASE_PATH).
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._generation = 0
+    
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            DATABASE_PATH,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False  # закрывается из потока lifespan
+        )
+        conn.row_factory = sqlite3.Row  # Возвращаем результаты как dict
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+    
+    def connection(self, readonly: bool = False) -> sqlite3.Connection:
+        key = (DATABASE_PATH, self._generation)
+        if getattr(self._local, "key", None) != key:
+            self._local.key = key
+            self._local.writer = None
+            self._local.reader = None
+            self._local.depth = 0
+        
+        name = "reader" if readonly else "writer"
+        conn = getattr(self._local, name)
+        if conn is None:
+            conn = self._connect(readonly)
+            setattr(self._local, name, conn)
+        return conn
+    
+    @property
+    def local(self) -> threading.local:
+        return self._local
+    
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Failed to close database connection: {e}")
+
+
+connections = ConnectionManager()
+
 
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row  # Возвращаем результаты как dict
+    """Соединение для записи: commit при выходе из внешнего блока, rollback при ошибке"""
+    conn = connections.connection()
+    local = connections.local
+    local.depth += 1
     try:
         yield conn
-        conn.commit()
+        if local.depth == 1:
+            conn.commit()
     except Exception as e:
-        conn.rollback()
+        if local.depth == 1:
+            conn.rollback()
         logger.error(f"Database error: {e}")
         raise
     finally:
-        conn.close()
+        local.depth -= 1
+
+
+@contextmanager
+def get_read_db():
+    """Соединение только для чтения (в WAL не ждет писателя)"""
+    conn = connections.connection(readonly=True)
+    try:
+        yield conn
+    except Exception as e:
+        logger.error(f"Database error: {e}")
+        raise
+
+
+def close_database():
+    connections.close()
+
+
+def _ensure_columns(cursor, table: str, columns: Dict[str, str]):
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {row['name'] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+def _add_order_state_columns(cursor):
+    # Колонки состояния заказа для баз, созданных до их появления
+    _ensure_columns(cursor, 'orders', {
+        'recipient': 'TEXT',
+        'req_id': 'TEXT',
+        'tx_address': 'TEXT',
+        'amount_nano': 'TEXT',
+        'payload': 'TEXT',
+        'send_attempted_at': 'DATETIME',
+        'wallet_address': 'TEXT',
+        'seqno': 'INTEGER',
+        'payment_comment': 'TEXT',
+        'payment_amount_nano': 'TEXT',
+        'payment_tx_hash': 'TEXT'
+    })
+
+
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description="base schema",
+        statements=(
+            # Таблица для логов действий пользователей
+            '''
+                CREATE TABLE IF NOT EXISTS user_activity_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    user_id INTEGER,
+                    username TEXT,
+                    action TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    user_agent TEXT,
+                    request_data TEXT,
+                    response_status INTEGER,
+                    response_time REAL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Таблица для истории покупок
+            '''
+                CREATE TABLE IF NOT EXISTS purchases (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    username TEXT,
+                    first_name TEXT,
+                    recipient_username TEXT NOT NULL,
+                    amount INTEGER NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    tx_hash TEXT NOT NULL,
+                    ton_viewer_link TEXT NOT NULL,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    timestamp TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Таблица для подозрительной активности
+            '''
+                CREATE TABLE IF NOT EXISTS suspicious_activity (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    user_agent TEXT,
+                    endpoint TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    request_data TEXT,
+                    blocked BOOLEAN DEFAULT 0,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Таблица для проверок username
+            '''
+                CREATE TABLE IF NOT EXISTS username_checks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username_checked TEXT NOT NULL,
+                    found BOOLEAN NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    user_agent TEXT,
+                    timestamp TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Таблица заказов (очередь покупок)
+            '''
+                CREATE TABLE IF NOT EXISTS orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username TEXT,
+                    first_name TEXT,
+                    recipient_username TEXT NOT NULL,
+                    amount INTEGER NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    payment_comment TEXT,
+                    payment_amount_nano TEXT,
+                    payment_tx_hash TEXT,
+                    recipient TEXT,
+                    req_id TEXT,
+                    tx_address TEXT,
+                    amount_nano TEXT,
+                    payload TEXT,
+                    send_attempted_at DATETIME,
+                    wallet_address TEXT,
+                    seqno INTEGER,
+                    tx_hash TEXT,
+                    ton_viewer_link TEXT,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Служебное состояние (курсоры фоновых задач)
+            '''
+                CREATE TABLE IF NOT EXISTS app_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Обработанные платежные сообщения (защита от повторного использования)
+            '''
+                CREATE TABLE IF NOT EXISTS processed_transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tx_hash TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Исходящие события (уведомления), записываются вместе с заказом
+            '''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    last_error TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Рассылки админа: курсор по user_id и счетчики для продолжения после рестарта
+            '''
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    cursor_user_id INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    finished_at DATETIME
+                )
+            ''',
+        ),
+        apply=_add_order_state_columns
+    ),
+    Migration(
+        version=2,
+        description="base indexes",
+        statements=(
+            # Индексы для быстрого поиска
+            'CREATE INDEX IF NOT EXISTS idx_user_id ON user_activity_logs(user_id)',
+            'CREATE INDEX IF NOT EXISTS idx_ip ON user_activity_logs(ip_address)',
+            'CREATE INDEX IF NOT EXISTS idx_purchases_user ON purchases(user_id)',
+            'CREATE INDEX IF NOT EXISTS idx_suspicious_ip ON suspicious_activity(ip_address)',
+            'CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_payment_comment ON orders(payment_comment)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_processed_tx_hash ON processed_transactions(tx_hash)',
+            'CREATE INDEX IF NOT EXISTS idx_processed_tx_created ON processed_transactions(created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)',
+        )
+    ),
+    Migration(
+        version=3,
+        description="composite indexes for hot queries",
+        statements=(
+            # get_user_purchases: user_id = ? ORDER BY created_at DESC (и курсор рассылки по user_id)
+            'CREATE INDEX IF NOT EXISTS idx_purchases_user_created ON purchases(user_id, created_at)',
+            'DROP INDEX IF EXISTS idx_purchases_user',
+            # get_user_activity: по user_id, по ip_address или все - ORDER BY created_at DESC
+            'CREATE INDEX IF NOT EXISTS idx_activity_user_created ON user_activity_logs(user_id, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_activity_ip_created ON user_activity_logs(ip_address, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_activity_created ON user_activity_logs(created_at)',
+            'DROP INDEX IF EXISTS idx_user_id',
+            'DROP INDEX IF EXISTS idx_ip',
+            # get_suspicious_activity: ORDER BY created_at DESC
+            'CREATE INDEX IF NOT EXISTS idx_suspicious_created ON suspicious_activity(created_at)',
+            # get_broadcasts: status = ? ORDER BY id
+            'CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)',
+        )
+    ),
+    Migration(
+        version=4,
+        description="incremental statistics counters",
+        statements=(
+            # Счетчики для get_statistics, обновляются в транзакции каждой записи
+            '''
+                CREATE TABLE IF NOT EXISTS stats_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            ''',
+            # Точное множество покупателей: уникальные пользователи и курсор рассылки
+            '''
+                CREATE TABLE IF NOT EXISTS purchase_users (
+                    user_id INTEGER PRIMARY KEY,
+                    first_purchase_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Однократный пересчет по уже накопленным данным
+            '''
+                INSERT OR IGNORE INTO purchase_users (user_id, first_purchase_at)
+                SELECT user_id, MIN(created_at) FROM purchases
+                WHERE user_id IS NOT NULL
+                GROUP BY user_id
+            ''',
+            '''
+                INSERT OR REPLACE INTO stats_counters (name, value)
+                SELECT 'total_purchases', COUNT(*) FROM purchases
+                UNION ALL SELECT 'total_stars_sold', COALESCE(SUM(amount), 0) FROM purchases
+                UNION ALL SELECT 'unique_users', COUNT(*) FROM purchase_users
+                UNION ALL SELECT 'suspicious_activity_count', COUNT(*) FROM suspicious_activity
+                UNION ALL SELECT 'username_checks_count', COUNT(*) FROM username_checks
+            ''',
+        )
+    ),
+    Migration(
+        version=5,
+        description="payment issues for operator review",
+        statements=(
+            # Платежи, которые нельзя засчитать заказу (недоплата, после таймаута,
+            # оплаченный заказ не выполнен) - деньги получены, оператор решает вопрос возврата
+            '''
+                CREATE TABLE IF NOT EXISTS payment_issues (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER,
+                    tx_hash TEXT NOT NULL UNIQUE,
+                    amount_nano TEXT NOT NULL,
+                    expected_nano TEXT,
+                    reason TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'open',
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    resolved_at DATETIME
+                )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_payment_issues_status ON payment_issues(status)',
+        )
+    ),
+]
+
+# Ключи get_statistics() = имена строк stats_counters
+STATISTICS_COUNTERS = (
+    'total_purchases',
+    'total_stars_sold',
+    'unique_users',
+    'suspicious_activity_count',
+    'username_checks_count'
+)
 
 
 def init_database():
     with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Таблица для логов действий пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_activity_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                user_id INTEGER,
-                username TEXT,
-                action TEXT NOT NULL,
-                endpoint TEXT NOT NULL,
-                method TEXT NOT NULL,
-                ip_address TEXT NOT NULL,
-                user_agent TEXT,
-                request_data TEXT,
-                response_status INTEGER,
-                response_time REAL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица для истории покупок
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS purchases (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                first_name TEXT,
-                recipient_username TEXT NOT NULL,
-                amount INTEGER NOT NULL,
-                payment_method TEXT NOT NULL,
-                tx_hash TEXT NOT NULL,
-                ton_viewer_link TEXT NOT NULL,
-                ip_address TEXT,
-                user_agent TEXT,
-                timestamp TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица для подозрительной активности
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS suspicious_activity (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                ip_address TEXT NOT NULL,
-                user_agent TEXT,
-                endpoint TEXT NOT NULL,
-                reason TEXT NOT NULL,
-                request_data TEXT,
-                blocked BOOLEAN DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица для проверок username
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS username_checks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username_checked TEXT NOT NULL,
-                found BOOLEAN NOT NULL,
-                ip_address TEXT NOT NULL,
-                user_agent TEXT,
-                timestamp TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Индексы для быстрого поиска
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON user_activity_logs(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ip ON user_activity_logs(ip_address)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_purchases_user ON purchases(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_suspicious_ip ON suspicious_activity(ip_address)')
-        
-        conn.commit()
-        logger.info("✅ Database initialized successfully")
+        version = run_migrations(conn, MIGRATIONS)
+        logger.info(f"✅ Database initialized successfully (schema v{version})")
 
 
 def log_user_activity(
@@ -121,29 +424,59 @@ def log_user_activity(
     try:
         with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO user_activity_logs 
-                (timestamp, user_id, username, action, endpoint, method, 
-                 ip_address, user_agent, request_data, response_status, response_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                datetime.now().isoformat(),
-                user_id,
-                username,
-                action,
-                endpoint,
-                method,
-                ip_address,
-                user_agent,
-                json.dumps(request_data) if request_data else None,
-                response_status,
-                response_time
+            cursor.execute(ACTIVITY_INSERT, activity_row(
+                action, endpoint, method, ip_address, user_agent,
+                user_id, username, request_data, response_status, response_time
             ))
             logger.info(f"📝 Logged: {action} from {ip_address}")
     except Exception as e:
         logger.error(f"Failed to log activity: {e}")
 
 
+ACTIVITY_INSERT = '''
+    INSERT INTO user_activity_logs 
+    (timestamp, user_id, username, action, endpoint, method, 
+     ip_address, user_agent, request_data, response_status, response_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def activity_row(
+    action: str,
+    endpoint: str,
+    method: str,
+    ip_address: str,
+    user_agent: Optional[str] = None,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    request_data: Optional[Dict] = None,
+    response_status: Optional[int] = None,
+    response_time: Optional[float] = None
+) -> tuple:
+    """Строка user_activity_logs с временем вызова (для ACTIVITY_INSERT)"""
+    return (
+        datetime.now().isoformat(),
+        user_id,
+        username,
+        action,
+        endpoint,
+        method,
+        ip_address,
+        user_agent,
+        json.dumps(request_data) if request_data else None,
+        response_status,
+        response_time
+    )
+
+
+def log_user_activity_batch(rows: List[tuple]) -> int:
+    """Пачка строк activity_row одной транзакцией"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(ACTIVITY_INSERT, rows)
+        return len(rows)
+
+
 def log_purchase(
     user_id: int,
     recipient_username: str,
@@ -158,30 +491,61 @@ def log_purchase(
 ):
     try:
         with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO purchases 
-                (user_id, username, first_name, recipient_username, amount, 
-                 payment_method, tx_hash, ton_viewer_link, ip_address, user_agent, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                username,
-                first_name,
-                recipient_username,
-                amount,
-                payment_method,
-                tx_hash,
-                ton_viewer_link,
-                ip_address,
-                user_agent,
-                datetime.now().isoformat()
-            ))
+            _insert_purchase(
+                conn.cursor(),
+                user_id=user_id,
+                recipient_username=recipient_username,
+                amount=amount,
+                payment_method=payment_method,
+                tx_hash=tx_hash,
+                ton_viewer_link=ton_viewer_link,
+                ip_address=ip_address,
+                username=username,
+                first_name=first_name,
+                user_agent=user_agent
+            )
             logger.info(f"💾 Purchase saved: {amount} Stars → @{recipient_username} (User {user_id})")
     except Exception as e:
         logger.error(f"Failed to save purchase: {e}")
 
 
+def _insert_purchase(cursor, user_id: int, recipient_username: str, amount: int, payment_method: str,
+                     tx_hash: str, ton_viewer_link: str, ip_address: str, username: Optional[str] = None,
+                     first_name: Optional[str] = None, user_agent: Optional[str] = None):
+    cursor.execute('''
+        INSERT INTO purchases 
+        (user_id, username, first_name, recipient_username, amount, 
+         payment_method, tx_hash, ton_viewer_link, ip_address, user_agent, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        user_id,
+        username,
+        first_name,
+        recipient_username,
+        amount,
+        payment_method,
+        tx_hash,
+        ton_viewer_link,
+        ip_address,
+        user_agent,
+        datetime.now().isoformat()
+    ))
+
+    new_user = 0
+    if user_id is not None:
+        cursor.execute('INSERT OR IGNORE INTO purchase_users (user_id) VALUES (?)', (user_id,))
+        new_user = cursor.rowcount
+    _bump_counters(cursor, total_purchases=1, total_stars_sold=amount or 0, unique_users=new_user)
+
+
+def _bump_counters(cursor, **deltas: int):
+    """Прибавляет deltas к stats_counters в текущей транзакции"""
+    cursor.executemany('''
+        INSERT INTO stats_counters (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    ''', [(name, delta) for name, delta in deltas.items() if delta])
+
+
 def log_suspicious_activity(
     ip_address: str,
     endpoint: str,
@@ -206,6 +570,7 @@ def log_suspicious_activity(
                 json.dumps(request_data) if request_data else None,
                 blocked
             ))
+            _bump_counters(cursor, suspicious_activity_count=1)
             logger.warning(f"⚠️ Suspicious activity logged: {reason} from {ip_address}")
     except Exception as e:
         logger.error(f"Failed to log suspicious activity: {e}")
@@ -233,13 +598,402 @@ def log_username_check(
                 user_agent,
                 datetime.now().isoformat()
             ))
+            _bump_counters(cursor, username_checks_count=1)
     except Exception as e:
         logger.error(f"Failed to log username check: {e}")
 
 
-def get_user_purchases(user_id: int, limit: int = 50) -> List[Dict]:
+def create_order(
+    recipient_username: str,
+    amount: int,
+    payment_method: str,
+    ip_address: str,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    first_name: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    status: str = "queued",
+    payment_comment: Optional[str] = None,
+    payment_amount_nano: Optional[int] = None
+) -> int:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO orders 
+            (user_id, username, first_name, recipient_username, amount, 
+             payment_method, status, ip_address, user_agent,
+             payment_comment, payment_amount_nano)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            username,
+            first_name,
+            recipient_username,
+            amount,
+            payment_method,
+            status,
+            ip_address,
+            user_agent,
+            payment_comment,
+            str(payment_amount_nano) if payment_amount_nano is not None else None
+        ))
+        order_id = cursor.lastrowid
+        logger.info(f"🧾 Order #{order_id} created: {amount} Stars → @{recipient_username}")
+        return order_id
+
+
+def update_order_status(
+    order_id: int,
+    status: str,
+    error: Optional[str] = None,
+    tx_hash: Optional[str] = None,
+    ton_viewer_link: Optional[str] = None
+):
     try:
         with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE orders 
+                SET status = ?, 
+                    error = COALESCE(?, error), 
+                    tx_hash = COALESCE(?, tx_hash), 
+                    ton_viewer_link = COALESCE(?, ton_viewer_link), 
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, error, tx_hash, ton_viewer_link, order_id))
+            logger.info(f"🧾 Order #{order_id} → {status}")
+    except Exception as e:
+        logger.error(f"Failed to update order {order_id}: {e}")
+
+
+# Поля заказа, которые может записать переход состояния
+ORDER_STATE_FIELDS = (
+    'recipient', 'req_id', 'tx_address', 'amount_nano', 'payload',
+    'send_attempted_at', 'wallet_address', 'seqno', 'tx_hash', 'ton_viewer_link', 'error',
+    'payment_tx_hash'
+)
+
+
+def transition_order(order_id: int, from_status: str, to_status: str, **fields) -> bool:
+    """
+    Атомарный переход заказа from_status → to_status вместе с данными стадии.
+    
+    Returns:
+        False если заказ уже не в from_status (переход сделал кто-то другой)
+    """
+    unknown = set(fields) - set(ORDER_STATE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown order fields: {unknown}")
+    
+    assignments = ''.join(f', {name} = ?' for name in fields)
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            UPDATE orders 
+            SET status = ?{assignments}, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+        ''', (to_status, *fields.values(), order_id, from_status))
+        
+        if cursor.rowcount != 1:
+            logger.warning(f"⚠️ Order #{order_id}: transition {from_status} → {to_status} rejected")
+            return False
+        
+        logger.info(f"🧾 Order #{order_id}: {from_status} → {to_status}")
+        return True
+
+
+def claim_order_send(order_id: int, status: str, attempted_at: str) -> bool:
+    """Помечает начало отправки TON. Только один вызов для заказа вернет True"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE orders 
+            SET send_attempted_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ? AND send_attempted_at IS NULL
+        ''', (attempted_at, order_id, status))
+        return cursor.rowcount == 1
+
+
+def complete_order(order_id: int, from_status: str, to_status: str,
+                   purchase: Optional[Dict] = None, events: Optional[List[tuple]] = None) -> bool:
+    """
+    Финальный переход заказа, запись покупки и событий outbox одной транзакцией.
+    
+    Args:
+        purchase: поля для log_purchase (None - покупку не записывать)
+        events: список (kind, payload) для диспетчера уведомлений
+    
+    Returns:
+        False если заказ уже не в from_status - тогда ничего не записано
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE orders 
+            SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+        ''', (to_status, order_id, from_status))
+        
+        if cursor.rowcount != 1:
+            logger.warning(f"⚠️ Order #{order_id}: transition {from_status} → {to_status} rejected")
+            return False
+        
+        if purchase:
+            _insert_purchase(cursor, **purchase)
+        
+        cursor.executemany(
+            'INSERT INTO outbox (order_id, kind, payload) VALUES (?, ?, ?)',
+            [(order_id, kind, json.dumps(payload, ensure_ascii=False)) for kind, payload in events or []]
+        )
+        
+        logger.info(f"🧾 Order #{order_id}: {from_status} → {to_status} ({len(events or [])} outbox events)")
+        return True
+
+
+def claim_outbox_events(limit: int, lease_seconds: int) -> List[Dict]:
+    """
+    Забирает готовые к доставке события. next_attempt_at сдвигается на
+    lease_seconds, поэтому событие не заберет второй воркер, а если процесс
+    упадет посреди доставки - оно вернется в работу после lease.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE outbox 
+            SET attempts = attempts + 1,
+                next_attempt_at = datetime('now', ?),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM outbox 
+                WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+                ORDER BY next_attempt_at 
+                LIMIT ?
+            )
+            RETURNING *
+        ''', (f'+{lease_seconds} seconds', limit))
+        
+        events = []
+        for row in cursor.fetchall():
+            event = dict(row)
+            event['payload'] = json.loads(event['payload'])
+            events.append(event)
+        return events
+
+
+def mark_outbox_sent(event_id: int):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE outbox 
+            SET status = 'sent', last_error = NULL, updated_at = CURRENT_TIMESTAMP 
+            WHERE id = ?
+        ''', (event_id,))
+
+
+def mark_outbox_failed(event_id: int, error: str, retry_in: Optional[float]):
+    """retry_in=None - попытки исчерпаны, событие уходит в dead"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if retry_in is None:
+            cursor.execute('''
+                UPDATE outbox 
+                SET status = 'dead', last_error = ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            ''', (error, event_id))
+        else:
+            cursor.execute('''
+                UPDATE outbox 
+                SET last_error = ?, next_attempt_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            ''', (error, f'+{int(retry_in)} seconds', event_id))
+
+
+def get_outbox_stats() -> Dict[str, int]:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) AS total FROM outbox GROUP BY status')
+        return {row['status']: row['total'] for row in cursor.fetchall()}
+
+
+def get_purchase_user_ids(after_user_id: int, limit: int) -> List[int]:
+    """Следующая страница покупателей по возрастанию user_id (из множества purchase_users)"""
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id FROM purchase_users 
+            WHERE user_id > ? 
+            ORDER BY user_id 
+            LIMIT ?
+        ''', (after_user_id, limit))
+        return [row['user_id'] for row in cursor.fetchall()]
+
+
+def count_purchase_users() -> int:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM stats_counters WHERE name = 'unique_users'")
+        row = cursor.fetchone()
+        return row['value'] if row else 0
+
+
+def create_broadcast(text: str, total: int) -> int:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO broadcasts (text, total) VALUES (?, ?)', (text, total))
+        return cursor.lastrowid
+
+
+def get_broadcast(broadcast_id: int) -> Optional[Dict]:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def get_broadcasts(status: str) -> List[Dict]:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM broadcasts WHERE status = ? ORDER BY id', (status,))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def checkpoint_broadcast(broadcast_id: int, cursor_user_id: int, sent: int, failed: int):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts 
+            SET cursor_user_id = ?, sent = ?, failed = ?, updated_at = CURRENT_TIMESTAMP 
+            WHERE id = ?
+        ''', (cursor_user_id, sent, failed, broadcast_id))
+
+
+def finish_broadcast(broadcast_id: int, status: str) -> bool:
+    """Закрывает рассылку, если она еще идет. False - уже завершена или отменена"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts 
+            SET status = ?, finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP 
+            WHERE id = ? AND status = 'running'
+        ''', (status, broadcast_id))
+        return cursor.rowcount == 1
+
+
+def get_inflight_orders(final_statuses: tuple) -> List[Dict]:
+    """Заказы, которые не дошли до финальной стадии (для восстановления после рестарта)"""
+    placeholders = ', '.join('?' for _ in final_statuses)
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT * FROM orders 
+            WHERE status NOT IN ({placeholders})
+            ORDER BY id
+        ''', final_statuses)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def record_processed_transaction(tx_hash: str) -> bool:
+    """False - хэш уже был записан (этим или другим процессом)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR IGNORE INTO processed_transactions (tx_hash) VALUES (?)',
+            (tx_hash,)
+        )
+        return cursor.rowcount == 1
+
+
+def prune_processed_transactions(retention_days: int) -> int:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM processed_transactions WHERE created_at < datetime('now', ?)",
+            (f'-{retention_days} days',)
+        )
+        return cursor.rowcount
+
+
+def get_state(key: str) -> Optional[str]:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT value FROM app_state WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row['value'] if row else None
+
+
+def set_state(key: str, value: str):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO app_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        ''', (key, value))
+
+
+def get_order(order_id: int) -> Optional[Dict]:
+    try:
+        with get_read_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Failed to get order {order_id}: {e}")
+        return None
+
+
+def get_order_by_payment_comment(comment: str) -> Optional[Dict]:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM orders WHERE payment_comment = ?', (comment,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def record_payment_issue(order_id: Optional[int], tx_hash: str, amount_nano: int,
+                         expected_nano: Optional[int], reason: str) -> bool:
+    """False - платеж с этим tx_hash уже записан (повторная обработка)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO payment_issues (order_id, tx_hash, amount_nano, expected_nano, reason)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            order_id,
+            tx_hash,
+            str(amount_nano),
+            str(expected_nano) if expected_nano is not None else None,
+            reason
+        ))
+        return cursor.rowcount == 1
+
+
+def get_payment_issues(status: str = "open", limit: int = 100) -> List[Dict]:
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT * FROM payment_issues WHERE status = ? ORDER BY id DESC LIMIT ?',
+            (status, limit)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def resolve_payment_issue(issue_id: int) -> bool:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE payment_issues 
+            SET status = 'resolved', resolved_at = CURRENT_TIMESTAMP 
+            WHERE id = ? AND status = 'open'
+        ''', (issue_id,))
+        return cursor.rowcount == 1
+
+
+def get_user_purchases(user_id: int, limit: int = 50) -> List[Dict]:
+    try:
+        with get_read_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM purchases 
@@ -257,7 +1011,7 @@ def get_user_purchases(user_id: int, limit: int = 50) -> List[Dict]:
 
 def get_user_activity(user_id: int = None, ip_address: str = None, limit: int = 100) -> List[Dict]:
     try:
-        with get_db() as conn:
+        with get_read_db() as conn:
             cursor = conn.cursor()
             
             if user_id:
@@ -290,7 +1044,7 @@ def get_user_activity(user_id: int = None, ip_address: str = None, limit: int =
 
 def get_suspicious_activity(limit: int = 100) -> List[Dict]:
     try:
-        with get_db() as conn:
+        with get_read_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM suspicious_activity 
@@ -306,37 +1060,21 @@ def get_suspicious_activity(limit: int = 100) -> List[Dict]:
 
 
 def get_statistics() -> Dict:
+    """
+    Статистика из stats_counters - чтение нескольких строк по ключу,
+    не зависит от размера purchases и журналов. Счетчики обновляются
+    в той же транзакции, что и сама запись (_bump_counters).
+    """
     try:
-        with get_db() as conn:
+        with get_read_db() as conn:
             cursor = conn.cursor()
-            
-            # Общее количество покупок
-            cursor.execute('SELECT COUNT(*) as total FROM purchases')
-            total_purchases = cursor.fetchone()['total']
-            
-            # Общая сумма Stars
-            cursor.execute('SELECT SUM(amount) as total FROM purchases')
-            total_stars = cursor.fetchone()['total'] or 0
-            
-            # Уникальные пользователи
-            cursor.execute('SELECT COUNT(DISTINCT user_id) as total FROM purchases')
-            unique_users = cursor.fetchone()['total']
-            
-            # Подозрительная активность
-            cursor.execute('SELECT COUNT(*) as total FROM suspicious_activity')
-            suspicious_count = cursor.fetchone()['total']
-            
-            # Проверки username
-            cursor.execute('SELECT COUNT(*) as total FROM username_checks')
-            username_checks = cursor.fetchone()['total']
-            
-            return {
-                'total_purchases': total_purchases,
-                'total_stars_sold': total_stars,
-                'unique_users': unique_users,
-                'suspicious_activity_count': suspicious_count,
-                'username_checks_count': username_checks
-            }
+            placeholders = ', '.join('?' for _ in STATISTICS_COUNTERS)
+            cursor.execute(
+                f'SELECT name, value FROM stats_counters WHERE name IN ({placeholders})',
+                STATISTICS_COUNTERS
+            )
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+            return {name: counters.get(name, 0) for name in STATISTICS_COUNTERS}
     except Exception as e:
         logger.error(f"Failed to get statistics: {e}")
         return {}
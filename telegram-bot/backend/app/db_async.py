@@ -0,0 +1,107 @@
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from app.database import close_database
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад к функциям app.database.
+
+    Записи выполняет один поток-писатель по очереди: SQLite все равно
+    допускает одного писателя, а так запросы не ждут друг друга на
+    busy_timeout. Чтения идут в небольшой пул потоков (у каждого свое
+    соединение только для чтения, в WAL они не ждут писателя). Event loop
+    только ставит задачу и ждет future - задержка диска на него не влияет.
+    """
+
+    def __init__(self, read_workers: int = 4):
+        self.read_workers = read_workers
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.reads = 0
+
+    def start(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+                self._writer.start()
+            if self._readers is None:
+                self._readers = ThreadPoolExecutor(max_workers=self.read_workers, thread_name_prefix="db-read")
+
+    async def stop(self):
+        """Дожидается уже поставленных записей и закрывает соединения"""
+        writer, readers = self._writer, self._readers
+        self._writer = self._readers = None
+
+        if writer is not None:
+            self._queue.put(None)
+            await asyncio.to_thread(writer.join)
+        if readers is not None:
+            readers.shutdown(wait=True)
+        close_database()
+
+    def stats(self) -> Dict:
+        return {
+            "write_queue": self._queue.qsize(),
+            "read_workers": self.read_workers,
+            "writes": self.writes,
+            "reads": self.reads
+        }
+
+    async def write(self, fn: Callable, *args, **kwargs) -> Any:
+        """Выполняет fn в потоке-писателе"""
+        if self._writer is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((partial(fn, *args, **kwargs), future, loop))
+        return await future
+
+    async def read(self, fn: Callable, *args, **kwargs) -> Any:
+        """Выполняет fn в пуле потоков чтения"""
+        if self._readers is None:
+            self.start()
+        self.reads += 1
+        return await asyncio.get_running_loop().run_in_executor(self._readers, partial(fn, *args, **kwargs))
+
+    def _write_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            call, future, loop = job
+            try:
+                result, error = call(), None
+            except Exception as e:
+                result, error = None, e
+            self.writes += 1
+
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, result, error)
+            except RuntimeError:
+                # Event loop уже закрыт - ответ некому передать
+                logger.warning("⚠️ Database write finished after event loop was closed")
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any, error: Optional[Exception]):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,117 @@
+import base64
+import string
+from dataclasses import dataclass
+from typing import List, Optional
+
+from pytoniq_core import Address, Cell, ExternalMsgInfo, InternalMsgInfo, MessageAny, begin_cell
+
+# Глубина поиска внутренних сообщений в теле кошелька (v3/v4: 1, v5: 2+)
+MAX_DEPTH = 8
+HEX_DIGITS = frozenset(string.hexdigits)
+
+
+@dataclass
+class OutgoingTransfer:
+    destination: Address
+    amount_nano: int
+    comment: Optional[str]
+
+
+@dataclass
+class SignedMessage:
+    """Разобранное внешнее сообщение кошелька (результат TonConnect sendTransaction)"""
+    message_hash: str
+    wallet: Address
+    transfers: List[OutgoingTransfer]
+
+
+def decode_boc(tx_boc: str) -> bytes:
+    """BOC в base64 (TonConnect) или hex"""
+    tx_boc = tx_boc.strip()
+    if len(tx_boc) % 2 == 0 and HEX_DIGITS.issuperset(tx_boc):
+        return bytes.fromhex(tx_boc)
+    tx_boc += "=" * (-len(tx_boc) % 4)
+    return base64.urlsafe_b64decode(tx_boc.replace("+", "-").replace("/", "_"))
+
+
+def normalized_hash(dest: Address, body: Cell) -> str:
+    """
+    Хэш внешнего сообщения по TEP-467: src и import_fee обнулены, init
+    отброшен, тело всегда в ref. Не зависит от кодировки BOC и от того,
+    приложил ли кошелек state_init, - поэтому годится для дедупликации.
+    """
+    return (
+        begin_cell()
+        .store_uint(0b10, 2)   # ext_in_msg_info$10
+        .store_uint(0, 2)      # src: addr_none
+        .store_address(dest)
+        .store_coins(0)        # import_fee
+        .store_bit(0)          # init: nothing
+        .store_bit(1)          # body: ^X
+        .store_ref(body)
+        .end_cell()
+        .hash.hex()
+    )
+
+
+def _comment(body: Optional[Cell]) -> Optional[str]:
+    if body is None or len(body.bits) < 32:
+        return None
+    try:
+        slice_ = body.begin_parse()
+        if slice_.load_uint(32) != 0:
+            return None
+        return slice_.load_snake_string()
+    except Exception:
+        return None
+
+
+def _internal_messages(cell: Cell, depth: int = 0) -> List[MessageAny]:
+    """Внутренние сообщения (MessageRelaxed, src = addr_none) в дереве тела"""
+    messages = []
+    for ref in cell.refs:
+        try:
+            message = MessageAny.deserialize(ref.begin_parse())
+        except Exception:
+            message = None
+
+        if message is not None and isinstance(message.info, InternalMsgInfo) and message.info.src is None:
+            messages.append(message)
+        elif depth < MAX_DEPTH:
+            messages.extend(_internal_messages(ref, depth + 1))
+    return messages
+
+
+def parse_signed_message(tx_boc: str) -> SignedMessage:
+    """
+    Разбирает подписанное внешнее сообщение кошелька локально, без tonapi.
+
+    Подпись кошелька не проверяется, и сообщение не доказывает, что перевод
+    попал в сеть: результат годится только как подсказка, оплату засчитывает
+    PaymentWatcher по транзакции в сети.
+
+    Raises:
+        ValueError: BOC не является внешним сообщением
+    """
+    try:
+        message = MessageAny.deserialize(Cell.one_from_boc(decode_boc(tx_boc)).begin_parse())
+    except Exception as e:
+        raise ValueError(f"Invalid BOC: {e}")
+
+    if not isinstance(message.info, ExternalMsgInfo):
+        raise ValueError("BOC is not an external message")
+
+    transfers = [
+        OutgoingTransfer(
+            destination=internal.info.dest,
+            amount_nano=internal.info.value_coins,
+            comment=_comment(internal.body)
+        )
+        for internal in _internal_messages(message.body)
+    ]
+
+    return SignedMessage(
+        message_hash=normalized_hash(message.info.dest, message.body),
+        wallet=message.info.dest,
+        transfers=transfers
+    )
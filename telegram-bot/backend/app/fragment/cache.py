@@ -0,0 +1,72 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_username(username: str) -> str:
+    """Username в Telegram не зависит от регистра и @"""
+    return username.strip().lstrip('@').lower()
+
+
+class RecipientCache:
+    """
+    TTL + LRU кэш результатов searchStarsRecipient.
+
+    Хранит распарсенный профиль (вместе с recipient токеном) по
+    нормализованному username, поэтому /api/check_user и /api/purchase
+    используют один и тот же ответ Fragment.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[Dict]:
+        key = normalize_username(username)
+        item = self._items.get(key)
+
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, profile = item
+        if expires_at < time.monotonic():
+            # Запись устарела
+            del self._items[key]
+            self.misses += 1
+            return None
+
+        # Помечаем как недавно использованную
+        self._items.move_to_end(key)
+        self.hits += 1
+        return dict(profile)
+
+    def set(self, username: str, profile: Dict):
+        key = normalize_username(username)
+        self._items[key] = (time.monotonic() + self.ttl, dict(profile))
+        self._items.move_to_end(key)
+
+        # Вытесняем самые старые записи
+        while len(self._items) > self.max_size:
+            evicted, _ = self._items.popitem(last=False)
+            logger.debug(f"Recipient cache evicted: {evicted}")
+
+    def invalidate(self, username: str):
+        self._items.pop(normalize_username(username), None)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
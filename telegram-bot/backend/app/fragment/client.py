@@ -1,7 +1,12 @@
 import httpx
+import asyncio
 import logging
 from typing import Optional, Tuple, Dict
 
+from app.fragment.cache import RecipientCache, normalize_username
+from app.fragment.negative_cache import NegativeCache
+from app.fragment.singleflight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,44 +25,192 @@ class FragmentClient:
     
     def __init__(self, fragment_hash: str, fragment_data: dict, 
                  fragment_address: str, fragment_publickey: str, 
-                 fragment_wallets: str):
-        self.url = f"https://fragment.com/api?hash={fragment_hash}"
+                 fragment_wallets: str,
+                 base_url: str = "https://fragment.com",
+                 http2: bool = True,
+                 max_connections: int = 20,
+                 max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0,
+                 request_timeout: float = 10.0,
+                 buy_link_timeout: float = 15.0,
+                 cache_size: int = 1000,
+                 cache_ttl: float = 300.0,
+                 negative_cache_ttl: float = 600.0,
+                 negative_cache_capacity: int = 100_000,
+                 negative_cache_error_rate: float = 0.001,
+                 negative_cache_path: Optional[str] = None,
+                 negative_cache_snapshot_interval: float = 60.0):
+        self.url = f"{base_url}/api?hash={fragment_hash}"
         self.fragment_data = fragment_data
         self.fragment_address = fragment_address
         self.fragment_publickey = fragment_publickey
         self.fragment_wallets = fragment_wallets
+        
+        # Один keep-alive пул соединений на весь процесс
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        # Таймауты по типу операции
+        self.request_timeout = httpx.Timeout(request_timeout, connect=connect_timeout)
+        self.buy_link_timeout = httpx.Timeout(buy_link_timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Общий кэш searchStarsRecipient (профиль + recipient токен)
+        self.cache = RecipientCache(max_size=cache_size, ttl=cache_ttl)
+        self.inflight = SingleFlight()
+        
+        # Кэш "не найден" (Bloom filter + точный TTL словарь, снапшот на диск)
+        self.negative_cache = NegativeCache(
+            ttl=negative_cache_ttl,
+            capacity=negative_cache_capacity,
+            error_rate=negative_cache_error_rate,
+            snapshot_path=negative_cache_path
+        )
+        self.negative_cache_snapshot_interval = negative_cache_snapshot_interval
+        self._snapshot_task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Открывает пул соединений (вызывается из lifespan)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.request_timeout,
+                cookies=get_cookies(self.fragment_data)
+            )
+            logger.info(f"🔌 Fragment connection pool opened (http2={self.http2})")
+        
+        if self._snapshot_task is None:
+            self.negative_cache.load()
+            # Чистка истекших записей нужна и без файла снимка
+            if self.negative_cache_snapshot_interval > 0:
+                self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+    
+    async def close(self):
+        """Закрывает пул соединений при остановке приложения"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("🔌 Fragment connection pool closed")
+        
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+            await self.negative_cache.compact(save=True)
+    
+    async def _snapshot_loop(self):
+        """Периодически чистит negative cache и сохраняет его на диск (в отдельном потоке)"""
+        while True:
+            await asyncio.sleep(self.negative_cache_snapshot_interval)
+            try:
+                await self.negative_cache.compact(save=True)
+            except Exception as e:
+                logger.error(f"Failed to save negative cache: {e}")
+    
+    async def _post(self, data: dict, timeout: httpx.Timeout, 
+                    headers: Optional[dict] = None) -> httpx.Response:
+        # Если клиент используется вне lifespan - открываем пул лениво
+        if self._client is None:
+            await self.start()
+        
+        return await self._client.post(
+            self.url, 
+            headers=headers, 
+            data=data, 
+            timeout=timeout
+        )
+    
+    async def _search_recipient(self, query: str) -> Optional[Dict]:
+        """Общий searchStarsRecipient для fetch_recipient и fetch_user_profile (через кэш)"""
+        
+        cached = self.cache.get(query)
+        if cached:
+            logger.info(f"⚡ Recipient cache hit: {query}")
+            cached["username"] = query
+            return cached
+        
+        # Недавно уже искали и не нашли - не ходим в Fragment
+        if self.negative_cache.contains(query):
+            logger.info(f"🚫 Negative cache hit: {query}")
+            return None
+        
+        # Одновременные запросы одного username ждут один общий вызов Fragment
+        user_profile = await self.inflight.do(
+            ("searchStarsRecipient", normalize_username(query)),
+            lambda: self._request_recipient(query)
+        )
+        if user_profile:
+            user_profile = dict(user_profile, username=query)
+        return user_profile
+    
+    async def _request_recipient(self, query: str) -> Optional[Dict]:
+        
+        data = {"query": query, "method": "searchStarsRecipient"}
+        
+        response = await self._post(data, self.request_timeout)
+        
+        logger.info(f"Fragment API response for {query}: {response.status_code}")
+        
+        if response.status_code != 200:
+            logger.error(f"Fragment API error: {response.status_code}")
+            return None
+        
+        result = response.json()
+        logger.debug(f"📥 Full Fragment API response: {result}")
+        
+        found = result.get("found", {})
+        
+        if not found:
+            logger.warning(f"❌ No 'found' data for {query}")
+            self.negative_cache.add(query)
+            return None
+        
+        # Извлекаем photo_url из HTML тега
+        photo_html = found.get("photo", "")
+        photo_url = None
+        if photo_html and 'src="' in photo_html:
+            # Парсим: <img src="URL" />
+            start = photo_html.find('src="') + 5
+            end = photo_html.find('"', start)
+            if start > 4 and end > start:
+                photo_url = photo_html[start:end]
+                logger.info(f"📸 Extracted photo URL: {photo_url}")
+        
+        # Парсим данные
+        user_profile = {
+            "username": query,  # Оригинальный username
+            "recipient": found.get("recipient"),  # Токен для транзакций
+            "user_id": found.get("user_id") or found.get("id"),
+            "first_name": found.get("name") or found.get("first_name") or found.get("firstName"),
+            "last_name": found.get("last_name") or found.get("lastName"),
+            "photo_url": photo_url,
+            "is_premium": found.get("is_premium") or found.get("isPremium", False)
+        }
+        
+        logger.info(f"✅ Profile parsed for {query}: {user_profile}")
+        self.cache.set(query, user_profile)
+        return user_profile
     
     async def fetch_recipient(self, query: str) -> Optional[str]:
 
         query = query.lstrip('@')
-        data = {"query": query, "method": "searchStarsRecipient"}
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    self.url, 
-                    cookies=get_cookies(self.fragment_data), 
-                    data=data
-                )
-                
-                logger.info(f"Fragment API response for {query}: {response.status_code}")
-                
-                if response.status_code != 200:
-                    logger.error(f"Fragment API error: {response.status_code}")
-                    return None
-                
-                result = response.json()
-                logger.debug(f"Fragment response: {result}")
-                
-                recipient = result.get("found", {}).get("recipient")
-                
-                if recipient:
-                    logger.info(f"✅ User found: {recipient}")
-                else:
-                    logger.warning(f"❌ User not found: {query}")
-                
-                return recipient
-                
+            user_profile = await self._search_recipient(query)
+            recipient = user_profile.get("recipient") if user_profile else None
+            
+            if recipient:
+                logger.info(f"✅ User found: {recipient}")
+            else:
+                logger.warning(f"❌ User not found: {query}")
+            
+            return recipient
+            
         except Exception as e:
             logger.error(f"Error checking user {query}: {e}")
             return None
@@ -65,59 +218,13 @@ class FragmentClient:
     async def fetch_user_profile(self, query: str) -> Optional[Dict]:
 
         query = query.lstrip('@')
-        data = {"query": query, "method": "searchStarsRecipient"}
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    self.url, 
-                    cookies=get_cookies(self.fragment_data), 
-                    data=data
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Fragment API error: {response.status_code}")
-                    return None
-                
-                result = response.json()
-                logger.info(f"📥 Full Fragment API response: {result}")
-                
-                found = result.get("found", {})
-                logger.info(f"📦 Found data: {found}")
-                
-                if not found:
-                    logger.warning(f"❌ No 'found' data for {query}")
-                    return None
-                
-                # Извлекаем photo_url из HTML тега
-                photo_html = found.get("photo", "")
-                photo_url = None
-                if photo_html and 'src="' in photo_html:
-                    # Парсим: <img src="URL" />
-                    start = photo_html.find('src="') + 5
-                    end = photo_html.find('"', start)
-                    if start > 4 and end > start:
-                        photo_url = photo_html[start:end]
-                        logger.info(f"📸 Extracted photo URL: {photo_url}")
-                
-                # Парсим данные
-                user_profile = {
-                    "username": query,  # Оригинальный username
-                    "recipient": found.get("recipient"),  # Токен для транзакций
-                    "user_id": found.get("user_id") or found.get("id"),
-                    "first_name": found.get("name") or found.get("first_name") or found.get("firstName"),
-                    "last_name": found.get("last_name") or found.get("lastName"),
-                    "photo_url": photo_url,
-                    "is_premium": found.get("is_premium") or found.get("isPremium", False)
-                }
-                
-                logger.info(f"✅ Profile parsed for {query}: {user_profile}")
-                return user_profile
-                
+            return await self._search_recipient(query)
+            
         except Exception as e:
             logger.error(f"Error fetching profile for {query}: {e}")
             return None
-            return None
     
     async def fetch_req_id(self, recipient: str, quantity: int) -> Optional[str]:
 
@@ -128,27 +235,22 @@ class FragmentClient:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    self.url, 
-                    cookies=get_cookies(self.fragment_data), 
-                    data=data
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Failed to get req_id: {response.status_code}")
-                    return None
-                
-                result = response.json()
-                req_id = result.get("req_id")
-                
-                if req_id:
-                    logger.info(f"✅ Request ID obtained: {req_id}")
-                else:
-                    logger.error(f"No req_id in response: {result}")
-                
-                return req_id
-                
+            response = await self._post(data, self.request_timeout)
+            
+            if response.status_code != 200:
+                logger.error(f"Failed to get req_id: {response.status_code}")
+                return None
+            
+            result = response.json()
+            req_id = result.get("req_id")
+            
+            if req_id:
+                logger.info(f"✅ Request ID obtained: {req_id}")
+            else:
+                logger.error(f"No req_id in response: {result}")
+            
+            return req_id
+            
         except Exception as e:
             logger.error(f"Error getting req_id: {e}")
             return None
@@ -182,40 +284,34 @@ class FragmentClient:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.post(
-                    self.url, 
-                    headers=headers, 
-                    cookies=get_cookies(self.fragment_data), 
-                    data=data
-                )
+            response = await self._post(data, self.buy_link_timeout, headers=headers)
+            
+            if response.status_code != 200:
+                logger.error(f"Failed to get buy link: {response.status_code}")
+                return None, None, None
+            
+            json_data = response.json()
+            logger.debug(f"Buy link response: {json_data}")
+            
+            if json_data.get("ok") and "transaction" in json_data:
+                transaction = json_data["transaction"]
+                messages = transaction.get("messages", [])
                 
-                if response.status_code != 200:
-                    logger.error(f"Failed to get buy link: {response.status_code}")
+                if not messages:
+                    logger.error("No messages in transaction")
                     return None, None, None
                 
-                json_data = response.json()
-                logger.debug(f"Buy link response: {json_data}")
+                first_message = messages[0]
+                address = first_message.get("address")
+                amount = first_message.get("amount")
+                payload = first_message.get("payload")
+                
+                logger.info(f"✅ Transaction params obtained")
+                return address, amount, payload
+            else:
+                logger.error(f"Invalid response: {json_data}")
+                return None, None, None
                 
-                if json_data.get("ok") and "transaction" in json_data:
-                    transaction = json_data["transaction"]
-                    messages = transaction.get("messages", [])
-                    
-                    if not messages:
-                        logger.error("No messages in transaction")
-                        return None, None, None
-                    
-                    first_message = messages[0]
-                    address = first_message.get("address")
-                    amount = first_message.get("amount")
-                    payload = first_message.get("payload")
-                    
-                    logger.info(f"✅ Transaction params obtained")
-                    return address, amount, payload
-                else:
-                    logger.error(f"Invalid response: {json_data}")
-                    return None, None, None
-                    
         except Exception as e:
             logger.error(f"Error getting buy link: {e}")
             return None, None, None
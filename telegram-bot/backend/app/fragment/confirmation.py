@@ -0,0 +1,261 @@
+import time
+import base64
+import string
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_hash(value: Optional[str]) -> str:
+    """Хэш сообщения в hex нижнем регистре (tonapi и кошельки отдают hex или base64)"""
+    value = (value or "").strip()
+    if len(value) == 64 and all(c in string.hexdigits for c in value):
+        return value.lower()
+
+    try:
+        raw = base64.urlsafe_b64decode(value.replace("+", "-").replace("/", "_") + "=" * (-len(value) % 4))
+    except ValueError:
+        return value.lower()
+    return raw.hex() if len(raw) == 32 else value.lower()
+
+
+@dataclass
+class PendingTransfer:
+    order_id: int
+    tx_hash: str
+    wallet_address: Optional[str]
+    seqno: Optional[int]
+    sent_at: float
+    # Когда seqno кошелька в сети впервые ушел дальше seqno заказа
+    seqno_passed_at: Optional[float] = None
+
+
+class ConfirmationTracker:
+    """
+    Подтверждение отправленных переводов в сети.
+
+    Раз в interval секунд для каждого горячего кошелька читает seqno в сети
+    и, если он ушел дальше seqno ожидающих заказов, их транзакции из tonapi
+    страницами (один проход покрывает все такие заказы кошелька). Входящие
+    внешние сообщения сопоставляются с заказами только по хэшу сообщения:
+    seqno после таймаута переиспользуется следующей отправкой.
+
+    Пока seqno кошелька не дошел до заказа, сообщение еще не принято и
+    транзакции не читаются. Если seqno прошел, а хэш не найден за
+    seqno_grace (или заказ не найден за confirm_timeout), сообщение уже не
+    попадет в сеть: заказ передается в on_unresolved на ручную проверку и
+    больше не отслеживается. Повторной отправки TON никогда не происходит.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://tonapi.io",
+        interval: float = 5.0,
+        page_size: int = 100,
+        max_pages: int = 10,
+        confirm_timeout: float = 300.0,
+        seqno_grace: float = 30.0,
+        request_timeout: float = 10.0
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.interval = interval
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.confirm_timeout = confirm_timeout
+        # Запас на отставание индекса транзакций tonapi от состояния кошелька
+        self.seqno_grace = seqno_grace
+        self.request_timeout = request_timeout
+        # Кошелек для заказов, отправленных до появления wallet_address
+        self.default_address: Optional[str] = None
+        self.on_confirmed: Optional[Callable[[int, Dict], Awaitable[None]]] = None
+        self.on_failed: Optional[Callable[[int, str], Awaitable[None]]] = None
+        self.on_unresolved: Optional[Callable[[int, str], Awaitable[None]]] = None
+        self.pending: Dict[int, PendingTransfer] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self.requests = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.unresolved = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.request_timeout
+            )
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Confirmation tracker started")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def track(self, order_id: int, tx_hash: str, wallet_address: Optional[str],
+              seqno: Optional[int], sent_at: float):
+        self.pending[order_id] = PendingTransfer(
+            order_id=order_id,
+            tx_hash=normalize_hash(tx_hash),
+            wallet_address=wallet_address or self.default_address,
+            seqno=seqno,
+            sent_at=sent_at
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self.pending),
+            "awaiting_seqno": sum(1 for p in self.pending.values() if p.seqno_passed_at is None),
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "unresolved": self.unresolved,
+            "requests": self.requests
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"❌ Confirmation check failed: {e}")
+
+    async def check(self):
+        """Один проход: seqno и (при необходимости) серия страниц на каждый кошелек"""
+        by_wallet: Dict[str, List[PendingTransfer]] = defaultdict(list)
+        for pending in self.pending.values():
+            if pending.wallet_address:
+                by_wallet[pending.wallet_address].append(pending)
+
+        for address, transfers in by_wallet.items():
+            try:
+                await self._check_wallet(address, transfers)
+            except Exception as e:
+                logger.error(f"❌ Failed to check transactions of {address}: {e}")
+
+        now = time.time()
+        for pending in list(self.pending.values()):
+            if pending.seqno_passed_at is not None and now - pending.seqno_passed_at > self.seqno_grace:
+                await self._unresolved(pending, f"wallet seqno passed {pending.seqno} but tx {pending.tx_hash} is not on-chain")
+            elif now - pending.sent_at > self.confirm_timeout:
+                await self._unresolved(pending, f"tx {pending.tx_hash} not found on-chain after {self.confirm_timeout:.0f}s")
+
+    async def _fetch_seqno(self, address: str) -> int:
+        response = await self._client.get(f"/v2/wallet/{address}/seqno")
+        self.requests += 1
+        response.raise_for_status()
+        return int(response.json()["seqno"])
+
+    async def _fetch_page(self, address: str, before_lt: Optional[int]) -> List[Dict]:
+        params = {"limit": self.page_size}
+        if before_lt:
+            params["before_lt"] = before_lt
+
+        response = await self._client.get(f"/v2/blockchain/accounts/{address}/transactions", params=params)
+        self.requests += 1
+        response.raise_for_status()
+        return response.json().get("transactions", [])
+
+    async def _check_wallet(self, address: str, transfers: List[PendingTransfer]):
+        # seqno читается ДО транзакций: все, что он покрывает, уже есть в списке
+        wallet_seqno = await self._fetch_seqno(address)
+        now = time.time()
+
+        # Сообщение могло попасть в сеть, только если seqno кошелька его прошел
+        landed = []
+        for pending in transfers:
+            if pending.seqno is None or pending.seqno < wallet_seqno:
+                if pending.seqno is not None and pending.seqno_passed_at is None:
+                    pending.seqno_passed_at = now
+                landed.append(pending)
+        if not landed:
+            return
+
+        # В пачке у нескольких заказов один хэш
+        by_hash: Dict[str, List[PendingTransfer]] = defaultdict(list)
+        for pending in landed:
+            by_hash[pending.tx_hash].append(pending)
+
+        # Транзакции старше самой ранней отправки (с запасом) уже не нужны
+        oldest = min(p.sent_at for p in landed) - 60
+        before_lt = None
+
+        for _ in range(self.max_pages):
+            transactions = await self._fetch_page(address, before_lt)
+
+            for tx in transactions:
+                for pending in self._match(tx, by_hash):
+                    await self._resolve(pending, tx)
+
+            if (
+                not by_hash
+                or len(transactions) < self.page_size
+                or transactions[-1].get("utime", 0) < oldest
+            ):
+                break
+            before_lt = transactions[-1]["lt"]
+
+    @staticmethod
+    def _match(tx: Dict, by_hash: Dict) -> List[PendingTransfer]:
+        in_msg = tx.get("in_msg") or {}
+        if in_msg.get("msg_type") != "ext_in_msg":
+            return []
+        return by_hash.pop(normalize_hash(in_msg.get("hash")), [])
+
+    def _done(self, pending: PendingTransfer):
+        """Снимает перевод с отслеживания - только после успешного обработчика"""
+        if self.pending.get(pending.order_id) is pending:
+            del self.pending[pending.order_id]
+
+    async def _unresolved(self, pending: PendingTransfer, reason: str):
+        logger.error(f"🔎 Order #{pending.order_id}: {reason} - needs manual review (no resend)")
+
+        try:
+            if self.on_unresolved:
+                await self.on_unresolved(pending.order_id, reason)
+        except Exception as e:
+            # Перевод остается в pending - повтор на следующем проходе
+            logger.error(f"❌ Order #{pending.order_id}: unresolved handler failed: {e}")
+            return
+
+        self._done(pending)
+        self.unresolved += 1
+
+    async def _resolve(self, pending: PendingTransfer, tx: Dict):
+        action_phase = tx.get("action_phase") or {}
+        success = tx.get("success") and not tx.get("aborted") and action_phase.get("success", True)
+
+        try:
+            if success:
+                logger.info(f"✅ Order #{pending.order_id}: confirmed on-chain in tx {tx.get('hash')}")
+                if self.on_confirmed:
+                    await self.on_confirmed(pending.order_id, tx)
+            else:
+                exit_code = (tx.get("compute_phase") or {}).get("exit_code")
+                logger.error(f"❌ Order #{pending.order_id}: transaction failed on-chain (exit code {exit_code})")
+                if self.on_failed:
+                    await self.on_failed(pending.order_id, f"Transaction failed on-chain (exit code {exit_code})")
+        except Exception as e:
+            # Перевод остается в pending: на следующем проходе транзакция найдется снова
+            logger.error(f"❌ Order #{pending.order_id}: confirmation handler failed: {e}")
+            return
+
+        self._done(pending)
+        if success:
+            self.confirmed += 1
+        else:
+            self.failed += 1
@@ -0,0 +1,107 @@
+import time
+import logging
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceLedger:
+    """
+    Резервы баланса горячих кошельков под принятые заказы.
+
+    Сумма из fetch_buy_link резервируется при приеме заказа, списывается
+    (commit) после успешной отправки и возвращается (release) при ошибке.
+    Проверка "хватит ли денег" - сравнение с кэшированным балансом в памяти,
+    без запроса к tonapi. Резервы старше ttl считаются потерянными и
+    снимаются при сверке с балансом. К каждому резерву и отправке
+    добавляется fee_margin_nano - запас на комиссию сети за сообщение.
+
+    Отправленные, но еще не подтвержденные переводы остаются в ledger
+    (in flight) до settle: баланс из сети может их еще не учитывать, поэтому
+    при обновлении кэша их сумма вычитается из баланса кошелька.
+    """
+
+    def __init__(self, ttl: float = 900.0, fee_margin_nano: int = 0):
+        self.ttl = ttl
+        self.fee_margin_nano = fee_margin_nano
+        # order_id -> (amount_nano, время резерва)
+        self._reservations: Dict[int, Tuple[int, float]] = {}
+        # order_id -> (адрес кошелька, amount_nano, время отправки)
+        self._sent: Dict[int, Tuple[str, int, float]] = {}
+        self.reserved_nano = 0
+        self.rejected = 0
+        self.committed = 0
+        self.released = 0
+        self.expired = 0
+
+    def reserve(self, order_id: int, amount_nano: int, balance_nano: int) -> bool:
+        """Резервирует сумму, если свободного баланса хватает"""
+        if order_id in self._reservations:
+            return True
+
+        amount_nano += self.fee_margin_nano
+        if self.reserved_nano + amount_nano > balance_nano:
+            self.rejected += 1
+            return False
+
+        self._reservations[order_id] = (amount_nano, time.monotonic())
+        self.reserved_nano += amount_nano
+        return True
+
+    def _remove(self, order_id: int) -> bool:
+        reservation = self._reservations.pop(order_id, None)
+        if reservation is None:
+            return False
+        self.reserved_nano -= reservation[0]
+        return True
+
+    def commit(self, order_id: int, address: str, amount_nano: int):
+        """Перевод ушел - резерв переходит в in flight до подтверждения в сети"""
+        if self._remove(order_id):
+            self.committed += 1
+        self._sent[order_id] = (address, amount_nano + self.fee_margin_nano, time.monotonic())
+
+    def settle(self, order_id: int):
+        """Исход перевода известен - баланс из сети его уже учитывает"""
+        self._sent.pop(order_id, None)
+
+    def in_flight_nano(self, address: str) -> int:
+        """Сумма отправленных с кошелька переводов, которых еще может не быть в сети"""
+        return sum(amount for sent_from, amount, _ in self._sent.values() if sent_from == address)
+
+    def release(self, order_id: int):
+        """Заказ не дошел до отправки - возвращаем сумму в свободный баланс"""
+        if self._remove(order_id):
+            self.released += 1
+
+    def reconcile(self, balance_nano: int):
+        """Сверка с балансом из сети: снимает зависшие резервы"""
+        deadline = time.monotonic() - self.ttl
+        for order_id, (_, reserved_at) in list(self._reservations.items()):
+            if reserved_at < deadline:
+                logger.warning(f"⚠️ Reservation for order #{order_id} expired, released")
+                self._remove(order_id)
+                self.expired += 1
+
+        # За ttl перевод точно попал в сеть или пропал - баланс из сети верен
+        for order_id, (_, _, sent_at) in list(self._sent.items()):
+            if sent_at < deadline:
+                del self._sent[order_id]
+
+        if self.reserved_nano > balance_nano:
+            logger.warning(
+                f"⚠️ Reserved {self.reserved_nano / 1_000_000_000:.4f} TON "
+                f"exceeds wallet balance {balance_nano / 1_000_000_000:.4f} TON"
+            )
+
+    def stats(self) -> Dict:
+        return {
+            "reservations": len(self._reservations),
+            "reserved": self.reserved_nano / 1_000_000_000,
+            "in_flight": len(self._sent),
+            "in_flight_amount": sum(amount for _, amount, _ in self._sent.values()) / 1_000_000_000,
+            "rejected": self.rejected,
+            "committed": self.committed,
+            "released": self.released,
+            "expired": self.expired
+        }
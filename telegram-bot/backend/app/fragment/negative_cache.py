@@ -0,0 +1,279 @@
+import os
+import json
+import asyncio
+import math
+import time
+import base64
+import heapq
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.fragment.cache import normalize_username
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Простой Bloom filter с двойным хэшированием (blake2b)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Оптимальные размеры: m = -n*ln(p)/ln(2)^2, k = m/n*ln(2)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> bool:
+        """True - элемент новый. count растет только для новых, повторы не заполняют фильтр"""
+        positions = list(self._positions(item))
+        if all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+            return False
+
+        for pos in positions:
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+        return True
+
+    def copy(self) -> "BloomFilter":
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        bloom.bits = bytearray(self.bits)
+        bloom.count = self.count
+        return bloom
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_dict(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "count": self.count,
+            "bits": base64.b64encode(bytes(self.bits)).decode()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BloomFilter":
+        bloom = cls(data["capacity"], data["error_rate"])
+        bits = base64.b64decode(data["bits"])
+        if len(bits) != len(bloom.bits):
+            raise ValueError("Bloom filter size mismatch")
+        bloom.bits = bytearray(bits)
+        bloom.count = data.get("count", 0)
+        return bloom
+
+
+class NegativeCache:
+    """
+    Кэш "username не найден в Fragment".
+
+    Bloom filter отсекает обычные (существующие) username без обращения к
+    словарю, а точный словарь username -> срок истечения дает короткий TTL
+    и убирает ложные срабатывания фильтра. Состояние сохраняется на диск,
+    чтобы после рестарта кэш не начинался с нуля.
+
+    Очистка истекших записей, пересборка фильтра и сериализация снимка
+    (compact) идут в отдельном потоке над копией состояния: в event loop
+    остаются только копирование и применение результата.
+    """
+
+    SNAPSHOT_VERSION = 1
+    # Записей на один вызов json.dumps: между кусками поток отдает GIL event loop
+    SNAPSHOT_CHUNK = 2000
+
+    def __init__(self, ttl: float = 600.0, capacity: int = 100_000,
+                 error_rate: float = 0.001, snapshot_path: Optional[str] = None):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.snapshot_path = snapshot_path
+        self.bloom = BloomFilter(capacity, error_rate)
+        # username -> unix time истечения (wall clock, т.к. переживает рестарт)
+        self._expiry: Dict[str, float] = {}
+        self.hits = 0
+        self.false_positives = 0
+        self.rebuilds = 0
+        self._compaction: Optional[asyncio.Task] = None
+        self._compact_lock = asyncio.Lock()
+        # Ключи, добавленные пока идет compact (None - compact не идет)
+        self._added_during_compaction: Optional[List[str]] = None
+
+    def contains(self, username: str) -> bool:
+        key = normalize_username(username)
+
+        if key not in self.bloom:
+            return False
+
+        expires_at = self._expiry.get(key)
+        if expires_at is None:
+            self.false_positives += 1
+            return False
+
+        if expires_at < time.time():
+            del self._expiry[key]
+            return False
+
+        self.hits += 1
+        return True
+
+    def add(self, username: str):
+        key = normalize_username(username)
+        self._expiry[key] = time.time() + self.ttl
+        self.bloom.add(key)
+        if self._added_during_compaction is not None:
+            self._added_during_compaction.append(key)
+
+        # Фильтр переполнен - пересобираем из живых записей в фоне
+        if self.bloom.count > self.capacity:
+            self._schedule_compaction()
+
+    def discard(self, username: str):
+        self._expiry.pop(normalize_username(username), None)
+
+    def _schedule_compaction(self):
+        if self._compaction is not None and not self._compaction.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Без event loop (скрипты) - синхронно
+            entries = self._entries_copy()
+            self._apply(entries, *self._build(entries, self.bloom.copy(), save=False))
+            return
+
+        self._compaction = loop.create_task(self.compact())
+        self._compaction.add_done_callback(self._log_compaction_error)
+
+    @staticmethod
+    def _log_compaction_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Negative cache compaction failed: {task.exception()}")
+
+    def _entries_copy(self) -> Dict[str, float]:
+        return dict(self._expiry)
+
+    def _build(self, entries: Dict[str, float], bloom: BloomFilter,
+               save: bool) -> Tuple[List[str], Optional[BloomFilter]]:
+        """
+        Тяжелая часть compact, работает над копиями (в отдельном потоке).
+
+        Returns:
+            (ключи для удаления, новый фильтр или None если пересборка не нужна)
+        """
+        now = time.time()
+        live = {k: v for k, v in entries.items() if v >= now}
+
+        # Живых записей больше емкости - оставляем самые свежие (с запасом 10%)
+        if len(live) > self.capacity:
+            live = dict(heapq.nlargest(int(self.capacity * 0.9), live.items(), key=lambda kv: kv[1]))
+
+        removed = [k for k in entries if k not in live]
+
+        rebuilt = None
+        if removed or bloom.count > self.capacity:
+            rebuilt = BloomFilter(self.capacity, self.error_rate)
+            for key in live:
+                rebuilt.add(key)
+
+        if save:
+            self.write_snapshot({
+                "version": self.SNAPSHOT_VERSION,
+                "bloom": (rebuilt or bloom).to_dict(),
+                "entries": live
+            })
+        return removed, rebuilt
+
+    def _apply(self, entries: Dict[str, float], removed: List[str], rebuilt: Optional[BloomFilter],
+               added: List[str] = ()):
+        # Удаляем только записи, не обновленные после копирования
+        for key in removed:
+            if key in self._expiry and self._expiry[key] == entries[key]:
+                del self._expiry[key]
+
+        if rebuilt is not None:
+            for key in added:
+                if key in self._expiry:
+                    rebuilt.add(key)
+            self.bloom = rebuilt
+            self.rebuilds += 1
+
+    async def compact(self, save: bool = False):
+        """Чистит истекшие записи и (при save) пишет снимок, тяжелая работа - в потоке"""
+        async with self._compact_lock:
+            entries = self._entries_copy()
+            self._added_during_compaction = []
+            try:
+                removed, rebuilt = await asyncio.to_thread(self._build, entries, self.bloom.copy(), save)
+            finally:
+                added, self._added_during_compaction = self._added_during_compaction, None
+            self._apply(entries, removed, rebuilt, added)
+
+    def write_snapshot(self, snapshot: Dict):
+        if not self.snapshot_path:
+            return
+
+        path = Path(self.snapshot_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Атомарная запись: tmp файл + rename
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        header = {k: v for k, v in snapshot.items() if k != "entries"}
+        items = list(snapshot["entries"].items())
+        chunks = [
+            json.dumps(dict(items[start:start + self.SNAPSHOT_CHUNK]))[1:-1]
+            for start in range(0, len(items), self.SNAPSHOT_CHUNK)
+        ]
+        tmp_path.write_text(json.dumps(header)[:-1] + ', "entries": {' + ", ".join(chunks) + "}}", encoding="utf-8")
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Negative cache saved: {len(snapshot['entries'])} usernames")
+
+    def load(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+
+            if data.get("version") != self.SNAPSHOT_VERSION:
+                logger.warning("⚠️ Negative cache snapshot version mismatch - ignored")
+                return
+
+            bloom = BloomFilter.from_dict(data["bloom"])
+            if bloom.capacity != self.capacity or bloom.error_rate != self.error_rate:
+                # Параметры изменились - фильтр строим заново из записей
+                now = time.time()
+                self._expiry = {k: v for k, v in data["entries"].items() if v >= now}
+                self.bloom = BloomFilter(self.capacity, self.error_rate)
+                for key in self._expiry:
+                    self.bloom.add(key)
+            else:
+                self.bloom = bloom
+                now = time.time()
+                self._expiry = {k: v for k, v in data["entries"].items() if v >= now}
+
+            logger.info(f"✅ Negative cache loaded: {len(self._expiry)} usernames")
+        except Exception as e:
+            logger.error(f"Failed to load negative cache: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._expiry),
+            "ttl": self.ttl,
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "hits": self.hits,
+            "bloom_false_positives": self.false_positives,
+            "bloom_fill": self.bloom.count,
+            "rebuilds": self.rebuilds
+        }
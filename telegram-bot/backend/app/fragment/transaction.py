@@ -1,10 +1,18 @@
+import time
 import base64
-import re
+import asyncio
 import logging
-from typing import Optional, Tuple
+from datetime import datetime
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from tonutils.client import TonapiClient
 from tonutils.wallet import WalletV5R1
 
+from app.fragment.wallet_sender import WalletSender
+from app.fragment.wallet_pool import WalletPool
+from app.fragment.ledger import BalanceLedger
+from app.fragment.singleflight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,13 +23,64 @@ def fix_base64_padding(b64_string: str) -> str:
     return b64_string
 
 
+# Печатный ASCII (32..126) остается как есть, остальные байты -> пробел
+PRINTABLE_TABLE = bytes(b if 32 <= b < 127 else 32 for b in range(256))
+
+
+@lru_cache(maxsize=1024)
+def stars_marker(stars: int) -> str:
+    return f"{stars} Telegram Stars"
+
+
+def decode_payload_text(encoded_payload: str, stars: int) -> str:
+    """Текст комментария из payload Fragment (начиная с "N Telegram Stars")"""
+    decoded_bytes = base64.b64decode(fix_base64_padding(encoded_payload))
+    # После translate пробельные символы - только пробелы, split() схлопывает их без regex
+    clean_text = " ".join(decoded_bytes.translate(PRINTABLE_TABLE).decode("ascii").split())
+    start = clean_text.find(stars_marker(stars))
+    return clean_text[start:] if start >= 0 else clean_text
+
+
 class TonTransaction:
     
-    def __init__(self, api_key: str, mnemonic: list):
+    def __init__(self, api_key: str, mnemonic: list, 
+                 confirm_timeout: float = 60.0, poll_interval: float = 1.0,
+                 batch_max_messages: int = 100, batch_window: float = 0.2,
+                 pool_mnemonics: Optional[List[list]] = None,
+                 min_wallet_balance: float = 0.0, max_wallet_failures: int = 3,
+                 balance_refresh_interval: float = 30.0, low_balance_threshold: float = 0.0,
+                 reservation_ttl: float = 900.0, fee_margin: float = 0.0):
         self.api_key = api_key
         self.mnemonic = mnemonic
+        # Основной кошелек + дополнительные горячие кошельки
+        self.mnemonics = [mnemonic] + list(pool_mnemonics or [])
         self.client = None
         self.wallet = None
+        # У каждого кошелька пула свой WalletSender (отправка по очереди)
+        self.pool = WalletPool(
+            min_balance_nano=int(min_wallet_balance * 1_000_000_000),
+            max_failures=max_wallet_failures
+        )
+        self.confirm_timeout = confirm_timeout
+        self.poll_interval = poll_interval
+        self.batch_max_messages = batch_max_messages
+        self.batch_window = batch_window
+        # Кэш баланса: обновляется в фоне и локально после отправок
+        self.balance_refresh_interval = balance_refresh_interval
+        self.low_balance_threshold = low_balance_threshold
+        self.balance_updated_at: Optional[float] = None
+        # Вызывается один раз при падении баланса ниже порога (баланс в TON)
+        self.on_low_balance: Optional[Callable[[float], Awaitable[None]]] = None
+        self._low_balance = False
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._hook_task: Optional[asyncio.Task] = None
+        # Первое чтение баланса - одно на всех одновременных вызывающих
+        self._refresh_flight = SingleFlight()
+        # Резервы под принятые, но еще не отправленные заказы
+        self.ledger = BalanceLedger(
+            ttl=reservation_ttl,
+            fee_margin_nano=int(fee_margin * 1_000_000_000)
+        )
     
     async def initialize_wallet(self):
       
@@ -31,29 +90,99 @@ class TonTransaction:
                 is_testnet=False
             )
             
-            self.wallet, public_key, private_key, mnemonic = WalletV5R1.from_mnemonic(
-                self.client, 
-                self.mnemonic
-            )
+            for words in self.mnemonics:
+                try:
+                    await self.add_wallet(WalletV5R1.from_mnemonic(self.client, words)[0])
+                except Exception as e:
+                    logger.error(f"❌ Failed to initialize hot wallet: {e}")
+            
+            if not self.pool.wallets:
+                return False
+            
+            self.wallet = self.pool.wallets[0].wallet
+            
+            # Баланс читаем в фоне, старт приложения его не ждет
+            if self._refresh_task is None:
+                self._refresh_task = asyncio.create_task(self._balance_refresh_loop())
             
-            logger.info("✅ TON Wallet initialized successfully")
+            logger.info(f"✅ TON Wallet initialized successfully ({len(self.pool.wallets)} hot wallet(s))")
             return True
             
         except Exception as e:
             logger.error(f"❌ Failed to initialize wallet: {e}")
             return False
     
+    async def add_wallet(self, wallet):
+        """Добавляет кошелек в пул и запускает его отправителя"""
+        sender = WalletSender(
+            wallet,
+            confirm_timeout=self.confirm_timeout,
+            poll_interval=self.poll_interval,
+            batch_max_messages=self.batch_max_messages,
+            batch_window=self.batch_window
+        )
+        await sender.start()
+        return self.pool.add(wallet, sender)
+    
+    async def refresh_balances(self):
+        """Перечитывает балансы кошельков пула из сети"""
+        refreshed = False
+        for hot in self.pool.wallets:
+            try:
+                balance_nano = await hot.wallet.client.get_account_balance(hot.address)
+                # Неподтвержденные переводы сеть может еще не учитывать
+                self.pool.update_balance(hot, balance_nano - self.ledger.in_flight_nano(hot.address))
+                refreshed = True
+            except Exception as e:
+                logger.error(f"Failed to get balance of {hot.address}: {e}")
+        
+        if refreshed:
+            self.balance_updated_at = time.time()
+            self.ledger.reconcile(self.pool.spendable_balance_nano())
+            self._check_low_balance()
+    
+    async def ensure_balances(self):
+        """Заполняет пустой кэш баланса (один запрос на всех ожидающих)"""
+        if self.balance_updated_at is None:
+            await self._refresh_flight.do("balances", self.refresh_balances)
+    
+    async def reserve_balance(self, order_id: int, amount_nano: int) -> bool:
+        """Резервирует сумму заказа в памяти (tonapi - только если кэш пуст)"""
+        await self.ensure_balances()
+        
+        return self.ledger.reserve(order_id, amount_nano, self.pool.spendable_balance_nano())
+    
+    async def _balance_refresh_loop(self):
+        while True:
+            await self._refresh_flight.do("balances", self.refresh_balances)
+            await asyncio.sleep(self.balance_refresh_interval)
+    
+    def _check_low_balance(self):
+        balance_ton = self.pool.total_balance_nano() / 1_000_000_000
+        
+        if balance_ton >= self.low_balance_threshold:
+            self._low_balance = False
+            return
+        
+        # Срабатывает один раз, пока баланс не поднимется выше порога
+        if self._low_balance:
+            return
+        self._low_balance = True
+        logger.warning(f"🪫 Wallet balance {balance_ton:.4f} TON is below {self.low_balance_threshold} TON")
+        
+        if self.on_low_balance:
+            self._hook_task = asyncio.create_task(self._fire_low_balance(balance_ton))
+    
+    async def _fire_low_balance(self, balance_ton: float):
+        try:
+            await self.on_low_balance(balance_ton)
+        except Exception as e:
+            logger.error(f"Low balance hook failed: {e}")
+    
     def decode_payload(self, encoded_payload: str, stars: int) -> str:
       
         try:
-            decoded_bytes = base64.b64decode(fix_base64_padding(encoded_payload))
-            decoded_text = ''.join(
-                chr(b) if 32 <= b < 127 else ' ' 
-                for b in decoded_bytes
-            )
-            clean_text = re.sub(r'\s+', ' ', decoded_text).strip()
-            match = re.search(rf"{stars} Telegram Stars.*", clean_text)
-            final_text = match.group(0) if match else clean_text
+            final_text = decode_payload_text(encoded_payload, stars)
             
             logger.info(f"Decoded payload: {final_text[:50]}...")
             return final_text
@@ -68,20 +197,28 @@ class TonTransaction:
         amount_ton: float, 
         payload: str, 
         stars: int
-    ) -> Tuple[bool, Optional[bytes], Optional[str]]:
-      
+    ) -> Tuple[bool, Optional[bytes], Optional[str], Optional[Tuple[str, int]]]:
+        """
+        Returns:
+            (success, tx_hash, error, (адрес кошелька-отправителя, seqno))
+            success=False - перевод отклонен до отправки, TON не ушел.
+        
+        Raises:
+            Exception: ошибка после передачи перевода в WalletSender -
+            сообщение могло уйти в сеть, исход неизвестен.
+        """
         if not self.wallet:
             initialized = await self.initialize_wallet()
             if not initialized:
-                return False, None, "Failed to initialize wallet"
+                return False, None, "Failed to initialize wallet", None
         
         if not recipient:
             logger.error("❌ Recipient address is empty")
-            return False, None, "Recipient address is required"
+            return False, None, "Recipient address is required", None
         
         if amount_ton <= 0:
             logger.error("❌ Invalid amount")
-            return False, None, "Amount must be greater than 0"
+            return False, None, "Amount must be greater than 0", None
         
         try:
             decoded_payload = self.decode_payload(payload, stars)
@@ -91,45 +228,77 @@ class TonTransaction:
             logger.info(f"   Amount: {amount_ton} TON")
             logger.info(f"   Stars: {stars}")
             
-            tx_hash = await self.wallet.transfer(
-                destination=recipient,
-                amount=amount_ton,
-                body=decoded_payload,
-            )
-            
-            logger.info(f"✅ Transaction sent successfully!")
-            
-            # Проверяем тип tx_hash и конвертируем в bytes если нужно
-            if isinstance(tx_hash, str):
-                # Если строка, конвертируем hex в bytes
-                tx_hash_bytes = bytes.fromhex(tx_hash)
-                logger.info(f"   TX Hash: {tx_hash}")
-            else:
-                # Если уже bytes
-                tx_hash_bytes = tx_hash
-                logger.info(f"   TX Hash: {tx_hash.hex()}")
-            
-            return True, tx_hash_bytes, None
+            # Кэш еще не заполнен фоновой задачей
+            await self.ensure_balances()
             
+            amount_nano = int(round(amount_ton * 1_000_000_000))
+            hot = self.pool.acquire(amount_nano)
+            if not hot:
+                logger.error("❌ No hot wallet with enough balance")
+                return False, None, "No hot wallet with enough balance", None
         except Exception as e:
             error_msg = f"Transaction failed: {str(e)}"
             logger.error(f"❌ {error_msg}")
-            return False, None, error_msg
+            return False, None, error_msg, None
+        
+        logger.info(f"   From: {hot.address}")
+        
+        # Дальше ошибка не означает, что TON не ушел - пробрасываем ее вызывающему
+        try:
+            tx_hash, seqno = await hot.sender.transfer(
+                destination=recipient,
+                amount=amount_ton,
+                body=decoded_payload,
+            )
+        except BaseException:
+            self.pool.release(hot, amount_nano, success=False)
+            raise
+        self.pool.release(hot, amount_nano, success=True)
+        self._check_low_balance()
+        
+        logger.info(f"✅ Transaction sent successfully!")
+        
+        # Проверяем тип tx_hash и конвертируем в bytes если нужно
+        if isinstance(tx_hash, str):
+            # Если строка, конвертируем hex в bytes
+            tx_hash_bytes = bytes.fromhex(tx_hash)
+            logger.info(f"   TX Hash: {tx_hash}")
+        else:
+            # Если уже bytes
+            tx_hash_bytes = tx_hash
+            logger.info(f"   TX Hash: {tx_hash.hex()}")
+        
+        return True, tx_hash_bytes, None, (hot.address, seqno)
+    
+    async def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        for hot in self.pool.wallets:
+            await hot.sender.stop()
     
     async def get_balance(self) -> Optional[float]:
-
+        """Баланс всех кошельков пула из кэша (без запроса к tonapi)"""
         if not self.wallet:
             await self.initialize_wallet()
         
-        try:
-            # Конвертируем address в строку
-            address_str = self.wallet.address.to_str()
-            balance_nano = await self.client.get_account_balance(address_str)
-            balance_ton = balance_nano / 1_000_000_000
-            
-            logger.info(f"💰 Wallet balance: {balance_ton:.4f} TON")
-            return balance_ton
-            
-        except Exception as e:
-            logger.error(f"Failed to get balance: {e}")
+        await self.ensure_balances()
+        
+        if self.balance_updated_at is None:
             return None
+        
+        return self.pool.total_balance_nano() / 1_000_000_000
+    
+    def balance_info(self) -> Dict:
+        """Кэшированный баланс с отметкой свежести"""
+        if self.balance_updated_at is None:
+            return {"balance": None, "updated_at": None, "age_seconds": None, "stale": True}
+        
+        age = time.time() - self.balance_updated_at
+        return {
+            "balance": self.pool.total_balance_nano() / 1_000_000_000,
+            "updated_at": datetime.fromtimestamp(self.balance_updated_at).isoformat(),
+            "age_seconds": round(age, 1),
+            "stale": age > self.balance_refresh_interval * 2
+        }
@@ -0,0 +1,153 @@
+import time
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.fragment.wallet_sender import WalletSender
+
+logger = logging.getLogger(__name__)
+
+
+class HotWallet:
+    """Кошелек пула: отправитель, кэш баланса и метрики"""
+
+    # Окно для подсчета пропускной способности
+    THROUGHPUT_WINDOW = 60.0
+
+    def __init__(self, wallet, sender: WalletSender):
+        self.wallet = wallet
+        self.sender = sender
+        self.address = wallet.address.to_str()
+        self.balance_nano: Optional[int] = None
+        self.balance_updated_at: Optional[float] = None
+        self.in_flight = 0
+        self.in_flight_nano = 0
+        self.sent = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.drained = False
+        self._sent_at = deque()
+
+    @property
+    def load(self) -> int:
+        return self.in_flight + self.sender.queue.qsize()
+
+    def available_nano(self) -> int:
+        return (self.balance_nano or 0) - self.in_flight_nano
+
+    def record_sent(self):
+        now = time.monotonic()
+        self._sent_at.append(now)
+        while self._sent_at and self._sent_at[0] < now - self.THROUGHPUT_WINDOW:
+            self._sent_at.popleft()
+
+    def throughput_per_minute(self) -> int:
+        now = time.monotonic()
+        return sum(1 for t in self._sent_at if t >= now - self.THROUGHPUT_WINDOW)
+
+    def stats(self) -> Dict:
+        return {
+            "address": self.address,
+            "balance": self.balance_nano / 1_000_000_000 if self.balance_nano is not None else None,
+            "balance_age": round(time.time() - self.balance_updated_at, 1) if self.balance_updated_at else None,
+            "in_flight": self.in_flight,
+            "queued": self.sender.queue.qsize(),
+            "sent": self.sent,
+            "errors": self.errors,
+            "sent_per_minute": self.throughput_per_minute(),
+            "healthy": self.healthy,
+            "drained": self.drained,
+            "seqno": self.sender.seqno
+        }
+
+
+class WalletPool:
+    """
+    Пул горячих кошельков.
+
+    Заказ уходит на наименее загруженный здоровый кошелек, у которого
+    кэшированного баланса хватает на перевод (при равной загрузке - по кругу).
+    Кошелек с балансом ниже min_balance_nano считается опустошенным, а после
+    max_failures ошибок подряд - нездоровым; такие кошельки не получают
+    заказы, пока обновление баланса или успешная отправка не вернут их в пул.
+    """
+
+    def __init__(self, min_balance_nano: int = 0, max_failures: int = 3):
+        self.min_balance_nano = min_balance_nano
+        self.max_failures = max_failures
+        self.wallets: List[HotWallet] = []
+        self._next = 0
+
+    def add(self, wallet, sender: WalletSender) -> HotWallet:
+        hot = HotWallet(wallet, sender)
+        self.wallets.append(hot)
+        return hot
+
+    def acquire(self, amount_nano: int) -> Optional[HotWallet]:
+        """Выбирает кошелек для перевода и резервирует под него сумму"""
+        candidates = [
+            hot for hot in self.wallets
+            if hot.healthy and not hot.drained and hot.available_nano() >= amount_nano
+        ]
+        if not candidates:
+            return None
+
+        # Round-robin среди одинаково загруженных
+        count = len(self.wallets)
+        order = {id(hot): (i - self._next) % count for i, hot in enumerate(self.wallets)}
+        hot = min(candidates, key=lambda h: (h.load, order[id(h)]))
+        self._next = (self.wallets.index(hot) + 1) % count
+
+        hot.in_flight += 1
+        hot.in_flight_nano += amount_nano
+        return hot
+
+    def release(self, hot: HotWallet, amount_nano: int, success: bool):
+        hot.in_flight -= 1
+        hot.in_flight_nano -= amount_nano
+
+        if success:
+            hot.sent += 1
+            hot.consecutive_failures = 0
+            hot.healthy = True
+            hot.record_sent()
+            if hot.balance_nano is not None:
+                hot.balance_nano -= amount_nano
+                self._check_drained(hot)
+        else:
+            hot.errors += 1
+            hot.consecutive_failures += 1
+            if hot.healthy and hot.consecutive_failures >= self.max_failures:
+                hot.healthy = False
+                logger.error(f"🚫 Hot wallet {hot.address} disabled after {hot.consecutive_failures} failures")
+
+    def update_balance(self, hot: HotWallet, balance_nano: int):
+        hot.balance_nano = balance_nano
+        hot.balance_updated_at = time.time()
+        # Обновление баланса прошло - кошелек снова доступен
+        hot.healthy = True
+        hot.consecutive_failures = 0
+        self._check_drained(hot)
+
+    def _check_drained(self, hot: HotWallet):
+        drained = hot.balance_nano is not None and hot.balance_nano < self.min_balance_nano
+        if drained and not hot.drained:
+            logger.warning(f"🪫 Hot wallet {hot.address} drained, removed from dispatch")
+        elif hot.drained and not drained:
+            logger.info(f"🔋 Hot wallet {hot.address} refilled, back in dispatch")
+        hot.drained = drained
+
+    def total_balance_nano(self) -> int:
+        return sum(hot.balance_nano or 0 for hot in self.wallets)
+
+    def spendable_balance_nano(self) -> int:
+        """Сколько можно потратить с доступных кошельков (выше min_balance)"""
+        return sum(
+            max(0, hot.balance_nano - self.min_balance_nano)
+            for hot in self.wallets
+            if hot.healthy and not hot.drained and hot.balance_nano is not None
+        )
+
+    def stats(self) -> List[Dict]:
+        return [hot.stats() for hot in self.wallets]
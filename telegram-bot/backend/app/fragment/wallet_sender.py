@@ -0,0 +1,159 @@
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from tonutils.wallet.data import TransferData
+
+logger = logging.getLogger(__name__)
+
+
+class WalletSender:
+    """
+    Последовательная отправка транзакций с одного кошелька.
+
+    Единственная задача-владелец кошелька берет переводы из asyncio.Queue,
+    сама ведет seqno и отправляет строго по порядку. Перед следующей
+    отправкой ждет, пока seqno в сети не продвинется, поэтому два перевода
+    никогда не уходят с одним seqno, даже при сотнях параллельных заказов.
+
+    Готовые переводы собираются в пачку (до batch_max_messages штук или
+    batch_window секунд) и уходят одним внешним сообщением WalletV5R1
+    с несколькими внутренними - хэш пачки получает каждый заказ.
+    """
+
+    # Лимит действий в одном сообщении WalletV5R1
+    MAX_MESSAGES = 255
+
+    def __init__(
+        self,
+        wallet,
+        max_queue: int = 1000,
+        confirm_timeout: float = 60.0,
+        poll_interval: float = 1.0,
+        batch_max_messages: int = 100,
+        batch_window: float = 0.2
+    ):
+        self.wallet = wallet
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.confirm_timeout = confirm_timeout
+        self.poll_interval = poll_interval
+        self.batch_max_messages = max(1, min(batch_max_messages, self.MAX_MESSAGES))
+        self.batch_window = batch_window
+        self.seqno: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.batches = 0
+        self.errors = 0
+
+    async def start(self):
+        if self._task is None:
+            await self._sync_seqno()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"✅ Wallet sender started (seqno={self.seqno})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def transfer(self, destination: str, amount: float, body: Optional[str] = None) -> Tuple[str, int]:
+        """Ставит перевод в очередь кошелька и ждет (хэш, seqno) отправленного сообщения"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((TransferData(destination=destination, amount=amount, body=body), future))
+        return await future
+
+    def stats(self) -> Dict:
+        return {
+            "seqno": self.seqno,
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "batches": self.batches,
+            "avg_batch_size": round(self.sent / self.batches, 2) if self.batches else 0.0,
+            "errors": self.errors
+        }
+
+    async def _chain_seqno(self) -> int:
+        return await self.wallet.get_seqno(self.wallet.client, self.wallet.address)
+
+    async def _sync_seqno(self):
+        try:
+            self.seqno = await self._chain_seqno()
+        except Exception as e:
+            # Кошелек еще не задеплоен
+            logger.warning(f"⚠️ Failed to get wallet seqno, assuming 0: {e}")
+            self.seqno = 0
+
+    async def _wait_seqno_advance(self, sent_seqno: int) -> bool:
+        """Ждет, пока сеть примет сообщение с sent_seqno"""
+        deadline = time.monotonic() + self.confirm_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if await self._chain_seqno() > sent_seqno:
+                    return True
+            except Exception as e:
+                logger.warning(f"⚠️ Seqno check failed: {e}")
+        return False
+
+    async def _collect_batch(self) -> List[Tuple[TransferData, asyncio.Future]]:
+        """Первый перевод + все, что успело прийти за batch_window"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.batch_window
+
+        while len(batch) < self.batch_max_messages:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            taken = len(batch)
+            try:
+                # Заказы, которые перестали ждать, не отправляем
+                batch = [(data, future) for data, future in batch if not future.cancelled()]
+                if not batch:
+                    continue
+
+                seqno = self.seqno
+                tx_hash, error = await self._send([data for data, _ in batch], seqno)
+
+                for _, future in batch:
+                    if future.cancelled():
+                        continue
+                    if error:
+                        future.set_exception(error)
+                    else:
+                        future.set_result((tx_hash, seqno))
+
+                # Следующее сообщение отправляем только после того, как сеть приняла это
+                if not error and not await self._wait_seqno_advance(seqno):
+                    logger.warning(f"⚠️ Seqno {seqno} not confirmed in {self.confirm_timeout}s, resyncing")
+                    await self._sync_seqno()
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+
+    async def _send(self, data_list: List[TransferData], seqno: int) -> Tuple[Optional[str], Optional[Exception]]:
+        try:
+            tx_hash = await self.wallet.batch_transfer(data_list, seqno=seqno)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Send with seqno {seqno} failed: {e}")
+            # Состояние в сети могло измениться - перечитываем seqno
+            await self._sync_seqno()
+            return None, e
+
+        self.sent += len(data_list)
+        self.batches += 1
+        self.seqno = seqno + 1
+        logger.info(f"📤 Sent {len(data_list)} message(s) with seqno {seqno}: {tx_hash}")
+        return tx_hash, None
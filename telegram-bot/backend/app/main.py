@@ -1,12 +1,12 @@
 import logging
 import base64
 from datetime import datetime
-import hashlib
 from typing import Dict, List, Optional
 from fastapi import FastAPI, HTTPException, Request, Header, Depends
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from pytoniq_core import Address
 
 from app.config import settings
 from app.models import (
@@ -15,19 +15,37 @@ from app.models import (
     PurchaseRequest,
     PurchaseResponse,
     PriceCalculation,
-    CalculatePriceRequest
+    CalculatePriceRequest,
+    OrderStatusResponse,
+    PaymentInstructions,
+    PaymentProofRequest,
+    BroadcastRequest
 )
 from app.fragment.client import FragmentClient
 from app.fragment.transaction import TonTransaction
+from app.fragment.boc import parse_signed_message
 from app.telegram_notifier import TelegramNotifier
 from app.telegram_security import verify_telegram_webapp_data, extract_user_id
 from app.middleware import SecurityMiddleware
+from app.purchase_queue import PurchaseQueue, OrderStatus
+from app.outbox import OutboxDispatcher
+from app.admin_digest import AdminDigest
+from app.broadcast import Broadcaster
+from app.fragment.confirmation import ConfirmationTracker
+from app.payment_watcher import PaymentWatcher, new_payment_comment, comment_payload
+from app.replay_store import ReplayStore
+from app.db_async import async_db
+from app.activity_log import ActivityLogBuffer
 from app.database import (
     init_database,
-    log_purchase,
     log_username_check,
     get_user_purchases,
-    get_statistics
+    get_statistics,
+    create_order,
+    update_order_status,
+    get_order,
+    get_payment_issues,
+    resolve_payment_issue
 )
 
 # Настройка логирования
@@ -41,17 +59,32 @@ logger = logging.getLogger(__name__)
 fragment_client: FragmentClient = None
 ton_transaction: TonTransaction = None
 telegram_notifier: TelegramNotifier = None
+purchase_queue: PurchaseQueue = None
+outbox_dispatcher: OutboxDispatcher = None
+admin_digest: AdminDigest = None
+broadcaster: Broadcaster = None
+confirmation_tracker: ConfirmationTracker = None
+payment_watcher: PaymentWatcher = None
+
+
+async def notify_low_balance(balance: float):
+    """Хук низкого баланса горячих кошельков"""
+    if telegram_notifier:
+        await telegram_notifier.notify_low_balance(balance, settings.wallet_low_balance_threshold)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle manager для инициализации клиентов"""
-    global fragment_client, ton_transaction, telegram_notifier
+    global fragment_client, ton_transaction, telegram_notifier, purchase_queue, confirmation_tracker, payment_watcher
+    global outbox_dispatcher, admin_digest, broadcaster
     
     logger.info("🚀 Starting application...")
     
     # Инициализация базы данных
     init_database()
+    async_db.start()
+    await activity_log.start()
     logger.info("✅ Database initialized")
     
     # Инициализация Fragment клиента
@@ -60,23 +93,47 @@ async def lifespan(app: FastAPI):
         fragment_data=settings.fragment_data,
         fragment_address=settings.fragment_address,
         fragment_publickey=settings.fragment_publickey,
-        fragment_wallets=settings.fragment_wallets
+        fragment_wallets=settings.fragment_wallets,
+        http2=settings.fragment_http2,
+        max_connections=settings.fragment_max_connections,
+        max_keepalive_connections=settings.fragment_max_keepalive_connections,
+        keepalive_expiry=settings.fragment_keepalive_expiry,
+        connect_timeout=settings.fragment_connect_timeout,
+        request_timeout=settings.fragment_request_timeout,
+        buy_link_timeout=settings.fragment_buy_link_timeout,
+        cache_size=settings.recipient_cache_size,
+        cache_ttl=settings.recipient_cache_ttl,
+        negative_cache_ttl=settings.negative_cache_ttl,
+        negative_cache_capacity=settings.negative_cache_capacity,
+        negative_cache_error_rate=settings.negative_cache_error_rate,
+        negative_cache_path=settings.negative_cache_path,
+        negative_cache_snapshot_interval=settings.negative_cache_snapshot_interval
     )
+    await fragment_client.start()
     logger.info("✅ Fragment client initialized")
     
     # Инициализация TON транзакций
     ton_transaction = TonTransaction(
         api_key=settings.api_ton,
-        mnemonic=settings.mnemonic_list
+        mnemonic=settings.mnemonic_list,
+        confirm_timeout=settings.wallet_confirm_timeout,
+        poll_interval=settings.wallet_seqno_poll_interval,
+        batch_max_messages=settings.wallet_batch_max_messages,
+        batch_window=settings.wallet_batch_window_ms / 1000,
+        pool_mnemonics=settings.pool_mnemonic_lists,
+        min_wallet_balance=settings.wallet_min_balance,
+        max_wallet_failures=settings.wallet_max_failures,
+        balance_refresh_interval=settings.wallet_balance_refresh_interval,
+        low_balance_threshold=settings.wallet_low_balance_threshold,
+        reservation_ttl=settings.wallet_reservation_ttl,
+        fee_margin=settings.wallet_fee_margin
     )
+    ton_transaction.on_low_balance = notify_low_balance
     
     # Инициализируем кошелек
     wallet_initialized = await ton_transaction.initialize_wallet()
     if wallet_initialized:
         logger.info("✅ TON Wallet initialized")
-        balance = await ton_transaction.get_balance()
-        if balance:
-            logger.info(f"💰 Wallet balance: {balance:.4f} TON")
     else:
         logger.error("❌ Failed to initialize TON wallet")
     
@@ -84,15 +141,103 @@ async def lifespan(app: FastAPI):
     if settings.has_telegram_notifications:
         telegram_notifier = TelegramNotifier(
             bot_token=settings.bot_token,
-            admin_id=settings.admin_telegram_id
+            admin_id=settings.admin_telegram_id,
+            global_rate=settings.telegram_global_rate,
+            chat_rate=settings.telegram_chat_rate,
+            max_queue=settings.telegram_send_queue
+        )
+        await telegram_notifier.start()
+        
+        # Сводки для админа при большом потоке покупок
+        admin_digest = AdminDigest(
+            telegram_notifier,
+            threshold=settings.admin_digest_threshold,
+            interval=settings.admin_digest_interval
+        )
+        await admin_digest.start()
+        
+        # Рассылки админа покупателям
+        broadcaster = Broadcaster(
+            telegram_notifier,
+            rate=settings.broadcast_rate,
+            concurrency=settings.broadcast_concurrency,
+            page_size=settings.broadcast_page_size
         )
         logger.info(f"✅ Telegram notifications enabled (Admin ID: {settings.admin_telegram_id})")
+        
+        # Доставка уведомлений о покупках из outbox
+        outbox_dispatcher = OutboxDispatcher(
+            telegram_notifier,
+            interval=settings.outbox_interval,
+            batch_size=settings.outbox_batch_size,
+            concurrency=settings.outbox_concurrency,
+            max_attempts=settings.outbox_max_attempts,
+            retry_base=settings.outbox_retry_base,
+            admin_digest=admin_digest
+        )
+        await outbox_dispatcher.start()
     else:
         logger.warning("⚠️  Telegram notifications disabled (BOT_TOKEN or ADMIN_TELEGRAM_ID not set)")
     
+    # Подтверждение отправленных транзакций в сети
+    confirmation_tracker = ConfirmationTracker(
+        api_key=settings.api_ton,
+        interval=settings.confirmation_interval,
+        page_size=settings.confirmation_page_size,
+        max_pages=settings.confirmation_max_pages,
+        confirm_timeout=settings.confirmation_timeout,
+        seqno_grace=settings.confirmation_seqno_grace
+    )
+    if ton_transaction.pool.wallets:
+        confirmation_tracker.default_address = ton_transaction.pool.wallets[0].address
+    await confirmation_tracker.start()
+    
+    # Входящие оплаты TON от покупателей
+    payment_watcher = PaymentWatcher(
+        api_key=settings.api_ton,
+        address=settings.wallet_address,
+        interval=settings.payment_watch_interval,
+        payment_timeout=settings.payment_timeout
+    )
+    
+    # Очередь покупок с пулом воркеров
+    purchase_queue = PurchaseQueue(
+        fragment_client=fragment_client,
+        ton_transaction=ton_transaction,
+        outbox=outbox_dispatcher,
+        workers=settings.purchase_workers,
+        max_size=settings.purchase_queue_size,
+        confirmation_tracker=confirmation_tracker,
+        payment_watcher=payment_watcher,
+        admin_digest=admin_digest
+    )
+    await purchase_queue.start()
+    
+    # Продолжаем заказы, прерванные рестартом
+    await purchase_queue.recover()
+    await payment_watcher.start()
+    if broadcaster:
+        await broadcaster.resume()
+    
     yield
     
     logger.info("👋 Shutting down application...")
+    
+    if broadcaster:
+        await broadcaster.stop()
+    await payment_watcher.stop()
+    await purchase_queue.stop()
+    await confirmation_tracker.stop()
+    if outbox_dispatcher:
+        await outbox_dispatcher.stop()
+    if admin_digest:
+        await admin_digest.stop()
+    if telegram_notifier:
+        await telegram_notifier.stop()
+    await ton_transaction.close()
+    await fragment_client.close()
+    await activity_log.stop()
+    await async_db.stop()
 
 
 # Создание FastAPI приложения
@@ -103,8 +248,16 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Журнал запросов пишется пачками (запуск и дозапись в lifespan)
+activity_log = ActivityLogBuffer(
+    batch_size=settings.activity_log_batch_size,
+    flush_interval=settings.activity_log_flush_interval,
+    max_rows=settings.activity_log_max_rows,
+    overflow=settings.activity_log_overflow
+)
+
 # Security middleware (добавляем ПЕРВЫМ)
-app.add_middleware(SecurityMiddleware)
+app.add_middleware(SecurityMiddleware, activity_log=activity_log)
 
 # CORS middleware - БЕЗОПАСНЫЙ
 app.add_middleware(
@@ -112,14 +265,18 @@ app.add_middleware(
     allow_origins=settings.origins_list,
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "X-Admin-Token"],
+    allow_headers=["Content-Type", "X-Admin-Token", "X-Telegram-Init-Data"],
 )
 
 
 # ============= UTILITY FUNCTIONS =============
 
-# Хранилище обработанных транзакций
-processed_transactions = set()
+# Хранилище обработанных транзакций (память + SQLite, общее для воркеров)
+replay_store = ReplayStore(
+    window=settings.replay_window,
+    max_entries=settings.replay_memory_max,
+    retention_days=settings.replay_retention_days
+)
 
 def calculate_price(amount: int, payment_method: str) -> PriceCalculation:
     """Рассчитывает цену в зависимости от способа оплаты"""
@@ -146,28 +303,54 @@ def calculate_price(amount: int, payment_method: str) -> PriceCalculation:
 
 
 
-class TransactionVerifier:
-    """Проверка TON транзакций"""
+class PaymentProofChecker:
+    """Предварительная проверка сообщения оплаты из TonConnect"""
     
     @staticmethod
-    def verify_transaction(tx_boc: str, expected_amount: int, username: str) -> dict:
-        """Проверяет TON транзакцию"""
+    async def check_payment_proof(tx_boc: str, expected_address: str, expected_amount_nano: int, expected_comment: str) -> dict:
+        """
+        Сверяет подписанное сообщение с заказом локально, без запросов к tonapi.
+        
+        Это не подтверждение оплаты: подпись не проверяется, а отправленное
+        сообщение может не попасть в сеть. Проверка только рано отклоняет
+        заведомо неверный перевод (адрес, сумма, комментарий) - заказ
+        оплачивается, когда PaymentWatcher видит транзакцию в сети.
+        """
         try:
             if not tx_boc:
-                return {"verified": False, "error": "BOC is empty"}
+                return {"matches": False, "error": "BOC is empty"}
             
-            tx_hash = hashlib.sha256(tx_boc.encode()).hexdigest()
+            message = parse_signed_message(tx_boc)
+            tx_hash = message.message_hash
             
-            if tx_hash in processed_transactions:
-                return {"verified": False, "error": "Already processed"}
+            # Переводы на кошелек магазина с комментарием заказа
+            destination = Address(expected_address)
+            paid = sum(
+                transfer.amount_nano
+                for transfer in message.transfers
+                if transfer.destination == destination
+                and (transfer.comment or "").strip() == expected_comment
+            )
+            
+            if not paid:
+                return {"matches": False, "error": "No transfer with the order comment"}
+            
+            if paid < expected_amount_nano:
+                return {"matches": False, "error": "Payment amount is too low"}
+            
+            # Атомарно: из двух одновременных запросов с одним сообщением новым будет один,
+            # повтор (ретрай клиента) - то же сообщение, что уже сверено
+            already_seen = not await async_db.write(replay_store.add, tx_hash)
             
-            logger.info(f"✅ Transaction verified: {tx_hash[:16]}... for {username}")
-            processed_transactions.add(tx_hash)
+            if not already_seen:
+                logger.info(f"📨 Payment message matches order: {tx_hash[:16]}... from {message.wallet.to_str()}")
             
-            return {"verified": True, "tx_hash": tx_hash, "amount": expected_amount}
+            return {"matches": True, "tx_hash": tx_hash, "amount": paid, "already_seen": already_seen}
+        except ValueError as e:
+            return {"matches": False, "error": str(e)}
         except Exception as e:
-            logger.error(f"Transaction verification error: {e}")
-            return {"verified": False, "error": str(e)}
+            logger.error(f"Payment proof check error: {e}")
+            return {"matches": False, "error": str(e)}
 
 # ============= API ENDPOINTS =============
 
@@ -216,16 +399,27 @@ async def admin_health_check(admin_token: str = Header(None, alias="X-Admin-Toke
     if not admin_token or admin_token != settings.admin_token:
         raise HTTPException(status_code=403, detail="Invalid admin token")
     
-    wallet_balance = None
-    if ton_transaction and ton_transaction.wallet:
-        wallet_balance = await ton_transaction.get_balance()
-    
     return {
         "status": "healthy",
         "fragment_client": fragment_client is not None,
         "ton_wallet": ton_transaction is not None and ton_transaction.wallet is not None,
-        "wallet_balance": wallet_balance,
-        "telegram_notifier": telegram_notifier is not None
+        "wallet_balance": ton_transaction.balance_info() if ton_transaction else None,
+        "hot_wallets": ton_transaction.pool.stats() if ton_transaction else None,
+        "balance_ledger": ton_transaction.ledger.stats() if ton_transaction else None,
+        "telegram_notifier": telegram_notifier is not None,
+        "telegram_send_queue": telegram_notifier.stats() if telegram_notifier else None,
+        "recipient_cache": fragment_client.cache.stats() if fragment_client else None,
+        "fragment_inflight": fragment_client.inflight.stats() if fragment_client else None,
+        "negative_cache": fragment_client.negative_cache.stats() if fragment_client else None,
+        "purchase_queue": purchase_queue.stats() if purchase_queue else None,
+        "outbox": await outbox_dispatcher.stats() if outbox_dispatcher else None,
+        "admin_digest": admin_digest.stats() if admin_digest else None,
+        "broadcasts_running": broadcaster.running() if broadcaster else None,
+        "confirmations": confirmation_tracker.stats() if confirmation_tracker else None,
+        "payments": payment_watcher.stats() if payment_watcher else None,
+        "replay_protection": replay_store.stats(),
+        "database": async_db.stats(),
+        "activity_log": activity_log.stats()
     }
 
 
@@ -241,7 +435,8 @@ async def check_user(request: CheckUsernameRequest, http_request: Request):
         user_profile = await fragment_client.fetch_user_profile(request.username)
         
         # Логируем в БД
-        log_username_check(
+        await async_db.write(
+            log_username_check,
             username_checked=request.username,
             found=user_profile is not None,
             ip_address=client_ip,
@@ -332,134 +527,79 @@ async def purchase_stars(request: PurchaseRequest, http_request: Request):
                 detail=f"Amount must be between {settings.min_stars} and {settings.max_stars}"
             )
         
-        # Проверяем пользователя
-        logger.info("1️⃣ Checking recipient in Fragment...")
-        recipient = await fragment_client.fetch_recipient(request.username)
-        
-        if not recipient:
-            return PurchaseResponse(
-                success=False,
-                error=f"User @{request.username} not found in Fragment"
-            )
-        
-        logger.info(f"✅ Recipient found: {recipient}")
-        
-        # Получаем request ID
-        logger.info("2️⃣ Getting request ID from Fragment...")
-        req_id = await fragment_client.fetch_req_id(recipient, request.amount)
-        
-        if not req_id:
-            return PurchaseResponse(
-                success=False,
-                error="Failed to initialize purchase request"
+        # Оплата TON: заказ ждет входящий платеж с уникальным комментарием
+        if request.payment_method == 'ton':
+            # Получателя проверяем до оплаты: иначе деньги придут за невыполнимый заказ
+            if not await fragment_client.fetch_recipient(request.username):
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"User @{request.username.lstrip('@')} not found in Fragment"
+                )
+            
+            price_calc = calculate_price(request.amount, 'ton')
+            amount_nano = int(round(price_calc.price * 1_000_000_000))
+            comment = new_payment_comment()
+            
+            order_id = await async_db.write(
+                create_order,
+                recipient_username=request.username,
+                amount=request.amount,
+                payment_method=request.payment_method,
+                ip_address=client_ip,
+                user_id=request.buyer.id if request.buyer else None,
+                username=request.buyer.username if request.buyer else None,
+                first_name=request.buyer.first_name if request.buyer else None,
+                user_agent=user_agent,
+                status=OrderStatus.AWAITING_PAYMENT,
+                payment_comment=comment,
+                payment_amount_nano=amount_nano
             )
-        
-        logger.info(f"✅ Request ID: {req_id}")
-        
-        # Получаем параметры транзакции
-        logger.info("3️⃣ Fetching transaction parameters...")
-        address, amount_nano, payload = await fragment_client.fetch_buy_link(
-            recipient, req_id, request.amount
-        )
-        
-        if not address or not amount_nano or not payload:
+            payment_watcher.expect(order_id, comment, amount_nano)
+            
             return PurchaseResponse(
-                success=False,
-                error="Failed to get transaction parameters"
+                success=True,
+                order_id=order_id,
+                status=OrderStatus.AWAITING_PAYMENT,
+                amount=request.amount,
+                recipient=request.username,
+                payment=PaymentInstructions(
+                    address=settings.wallet_address,
+                    amount_nano=str(amount_nano),
+                    amount_ton=price_calc.price,
+                    comment=comment,
+                    payload=comment_payload(comment),
+                    expires_in=int(settings.payment_timeout)
+                ),
+                wait_timeout=int(settings.payment_timeout + settings.confirmation_timeout)
             )
         
-        # Конвертируем amount из nano в TON
-        amount_ton = float(amount_nano) / 1_000_000_000
-        logger.info(f"✅ Transaction params: {amount_ton:.4f} TON → {address}")
-        
-        # Отправляем транзакцию
-        logger.info("4️⃣ Sending TON transaction...")
-        success, tx_hash, error = await ton_transaction.send_ton_transaction(
-            recipient=address,
-            amount_ton=amount_ton,
-            payload=payload,
-            stars=request.amount
+        # Создаем заказ и ставим в очередь - дальше работают воркеры
+        order_id = await async_db.write(
+            create_order,
+            recipient_username=request.username,
+            amount=request.amount,
+            payment_method=request.payment_method,
+            ip_address=client_ip,
+            user_id=request.buyer.id if request.buyer else None,
+            username=request.buyer.username if request.buyer else None,
+            first_name=request.buyer.first_name if request.buyer else None,
+            user_agent=user_agent
         )
         
-        if not success or not tx_hash:
-            return PurchaseResponse(
-                success=False,
-                error=error or "Transaction failed"
+        if not purchase_queue.submit(order_id):
+            await async_db.write(update_order_status, order_id, OrderStatus.FAILED, error="Purchase queue is full")
+            raise HTTPException(
+                status_code=503,
+                detail="Too many purchases in progress, try again later"
             )
         
-        logger.info(f"✅ Transaction sent successfully!")
-        
-        # tx_hash может быть bytes или str
-        if isinstance(tx_hash, str):
-            tx_hash_hex = tx_hash
-        else:
-            tx_hash_hex = tx_hash.hex()
-        
-        # TON Viewer принимает просто hex, без base64
-        ton_viewer_link = f"https://tonviewer.com/transaction/{tx_hash_hex}"
-        
-        logger.info(f"📊 TX Hash (hex): {tx_hash_hex}")
-        logger.info(f"🔗 TON Viewer: {ton_viewer_link}")
-        
-        # Отправляем уведомления в Telegram (если настроено)
-        if telegram_notifier:
-            try:
-                buyer_id = request.buyer.id if request.buyer else None
-                buyer_username = request.buyer.username if request.buyer else None
-                buyer_first_name = request.buyer.first_name if request.buyer else "User"
-                
-                logger.info(f"📬 Preparing notifications - Buyer ID: {buyer_id}, Username: {buyer_username}")
-                
-                # Уведомление админу
-                await telegram_notifier.notify_purchase_success(
-                    buyer_id=buyer_id,
-                    buyer_username=buyer_username,
-                    buyer_first_name=buyer_first_name,
-                    recipient_username=request.username,
-                    amount=request.amount,
-                    tx_hash=tx_hash_hex,
-                    ton_viewer_link=ton_viewer_link
-                )
-                
-                # Уведомление покупателю
-                if buyer_id:
-                    await telegram_notifier.notify_user_purchase(
-                        user_id=buyer_id,
-                        recipient_username=request.username,
-                        amount=request.amount,
-                        tx_hash=tx_hash_hex,
-                        ton_viewer_link=ton_viewer_link,
-                        web_app_url=settings.web_app_url if hasattr(settings, 'web_app_url') else None
-                    )
-                    
-                    # Сохраняем покупку в БД
-                    log_purchase(
-                        user_id=buyer_id,
-                        recipient_username=request.username,
-                        amount=request.amount,
-                        payment_method=request.payment_method,
-                        tx_hash=tx_hash_hex,
-                        ton_viewer_link=ton_viewer_link,
-                        ip_address=client_ip,
-                        username=request.buyer.username if request.buyer else None,
-                        first_name=request.buyer.first_name if request.buyer else None,
-                        user_agent=user_agent
-                    )
-                    logger.info(f"💾 Purchase saved to database for user {buyer_id}")
-                    
-                else:
-                    logger.warning("⚠️ Buyer ID not provided - user notification skipped. Make sure to open Mini-App through Telegram bot.")
-                    
-            except Exception as e:
-                logger.error(f"Failed to send Telegram notification: {e}")
-                # Продолжаем даже если уведомление не отправилось
-        
         return PurchaseResponse(
             success=True,
-            tx_hash=tx_hash_hex,
+            order_id=order_id,
+            status=OrderStatus.QUEUED,
             amount=request.amount,
             recipient=request.username,
-            ton_viewer_link=ton_viewer_link
+            wait_timeout=int(settings.confirmation_timeout)
         )
     
     except HTTPException:
@@ -469,6 +609,82 @@ async def purchase_stars(request: PurchaseRequest, http_request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def get_buyer_order(order_id: int, init_data: Optional[str]) -> Dict:
+    """
+    Заказ текущего покупателя.
+    
+    Номера заказов последовательные, поэтому владелец проверяется
+    по подписанному initData Telegram WebApp.
+    """
+    user_id = None
+    if settings.bot_token:
+        user_id = extract_user_id(init_data, settings.bot_token) if init_data else None
+        if user_id is None:
+            raise HTTPException(status_code=403, detail="Invalid Telegram WebApp signature")
+    
+    order = await async_db.read(get_order, order_id)
+    
+    # Чужой заказ неотличим от несуществующего
+    if not order or (settings.bot_token and order["user_id"] != user_id):
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    return order
+
+
+def order_status_response(order: Dict) -> OrderStatusResponse:
+    return OrderStatusResponse(
+        success=order["status"] == OrderStatus.CONFIRMED,
+        order_id=order["id"],
+        status=order["status"],
+        amount=order["amount"],
+        recipient=order["recipient_username"],
+        tx_hash=order["tx_hash"],
+        ton_viewer_link=order["ton_viewer_link"],
+        error=order["error"],
+        created_at=order["created_at"],
+        updated_at=order["updated_at"]
+    )
+
+
+@app.get("/api/orders/{order_id}", response_model=OrderStatusResponse)
+async def get_order_status(order_id: int, init_data: str = Header(None, alias="X-Telegram-Init-Data")):
+    """Текущая стадия заказа (success - только для подтвержденного)"""
+    return order_status_response(await get_buyer_order(order_id, init_data))
+
+
+@app.post("/api/orders/{order_id}/payment", response_model=OrderStatusResponse)
+async def submit_payment_proof(order_id: int, request: PaymentProofRequest,
+                               init_data: str = Header(None, alias="X-Telegram-Init-Data")):
+    """
+    Ранняя сверка сообщения оплаты из TonConnect с заказом.
+    
+    Заказ не переводится в оплаченные: это делает только PaymentWatcher,
+    когда перевод появляется в сети. Повторная отправка того же сообщения
+    (ретрай клиента) возвращает текущее состояние заказа, даже если оплата
+    уже засчитана.
+    """
+    order = await get_buyer_order(order_id, init_data)
+    
+    if not order["payment_comment"]:
+        raise HTTPException(status_code=409, detail="Order is not paid in TON")
+    
+    result = await PaymentProofChecker.check_payment_proof(
+        request.tx_boc,
+        expected_address=settings.wallet_address,
+        expected_amount_nano=int(order["payment_amount_nano"]),
+        expected_comment=order["payment_comment"]
+    )
+    
+    if not result["matches"]:
+        logger.warning(f"❌ Order #{order_id}: payment proof rejected - {result['error']}")
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    if result["already_seen"]:
+        logger.info(f"🔁 Order #{order_id}: payment proof resubmitted, returning current status")
+    
+    return order_status_response(await async_db.read(get_order, order_id))
+
+
 @app.get("/api/wallet/balance")
 async def get_wallet_balance():
     """Получает баланс TON кошелька"""
@@ -481,10 +697,13 @@ async def get_wallet_balance():
         if balance is None:
             raise HTTPException(status_code=500, detail="Failed to get balance")
         
+        info = ton_transaction.balance_info()
         return {
             "success": True,
             "balance": balance,
-            "currency": "TON"
+            "currency": "TON",
+            "updated_at": info["updated_at"],
+            "age_seconds": info["age_seconds"]
         }
     
     except HTTPException:
@@ -498,7 +717,7 @@ async def get_wallet_balance():
 async def get_user_purchases_endpoint(user_id: int):
     """Получить историю покупок пользователя из БД"""
     try:
-        purchases = get_user_purchases(user_id, limit=50)
+        purchases = await async_db.read(get_user_purchases, user_id, limit=50)
         
         logger.info(f"📋 Fetching purchase history for user {user_id}: {len(purchases)} purchases")
         
@@ -533,7 +752,7 @@ async def get_statistics_endpoint(admin_token: str = Header(None, alias="X-Admin
         raise HTTPException(status_code=403, detail="Invalid admin token")
     
     try:
-        stats = get_statistics()
+        stats = await async_db.read(get_statistics)
         logger.info("📊 Admin accessed statistics")
         return {
             "success": True,
@@ -544,6 +763,82 @@ async def get_statistics_endpoint(admin_token: str = Header(None, alias="X-Admin
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/admin/broadcast")
+async def start_broadcast_endpoint(request: BroadcastRequest, admin_token: str = Header(None, alias="X-Admin-Token")):
+    """Запускает рассылку всем покупателям (требует админский токен)"""
+    if not admin_token or admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    if not broadcaster:
+        raise HTTPException(status_code=503, detail="Telegram notifications disabled")
+    
+    if broadcaster.running():
+        raise HTTPException(status_code=409, detail="Another broadcast is running")
+    
+    broadcast_id = await broadcaster.start_broadcast(request.text)
+    return {
+        "success": True,
+        "broadcast": await async_db.read(Broadcaster.report, broadcast_id)
+    }
+
+
+@app.get("/admin/broadcast/{broadcast_id}")
+async def get_broadcast_endpoint(broadcast_id: int, admin_token: str = Header(None, alias="X-Admin-Token")):
+    """Прогресс и отчет рассылки (требует админский токен)"""
+    if not admin_token or admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    report = await async_db.read(Broadcaster.report, broadcast_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    
+    return {
+        "success": True,
+        "broadcast": report
+    }
+
+
+@app.post("/admin/broadcast/{broadcast_id}/cancel")
+async def cancel_broadcast_endpoint(broadcast_id: int, admin_token: str = Header(None, alias="X-Admin-Token")):
+    """Останавливает рассылку (требует админский токен)"""
+    if not admin_token or admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    if not broadcaster or not await broadcaster.cancel(broadcast_id):
+        raise HTTPException(status_code=409, detail="Broadcast is not running")
+    
+    return {
+        "success": True,
+        "broadcast": await async_db.read(Broadcaster.report, broadcast_id)
+    }
+
+
+@app.get("/admin/payment_issues")
+async def get_payment_issues_endpoint(status: str = "open", limit: int = 100,
+                                      admin_token: str = Header(None, alias="X-Admin-Token")):
+    """Полученные платежи, которые не засчитаны заказу - к возврату (требует админский токен)"""
+    if not admin_token or admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    return {
+        "success": True,
+        "issues": await async_db.read(get_payment_issues, status, min(limit, 1000))
+    }
+
+
+@app.post("/admin/payment_issues/{issue_id}/resolve")
+async def resolve_payment_issue_endpoint(issue_id: int, admin_token: str = Header(None, alias="X-Admin-Token")):
+    """Отмечает платеж как разобранный (возврат сделан вручную)"""
+    if not admin_token or admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    if not await async_db.write(resolve_payment_issue, issue_id):
+        raise HTTPException(status_code=404, detail="Open payment issue not found")
+    
+    logger.info(f"💸 Payment issue #{issue_id} resolved by admin")
+    return {"success": True}
+
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -5,13 +5,19 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from typing import Callable
 import json
 
-from app.database import log_user_activity, log_suspicious_activity
+from app.database import log_suspicious_activity
+from app.db_async import async_db
+from app.activity_log import ActivityLogBuffer
 
 logger = logging.getLogger(__name__)
 
 
 class SecurityMiddleware(BaseHTTPMiddleware):
     
+    def __init__(self, app, activity_log: ActivityLogBuffer):
+        super().__init__(app)
+        self.activity_log = activity_log
+    
     async def dispatch(self, request: Request, call_next: Callable):
         # Начало обработки запроса
         start_time = time.time()
@@ -36,8 +42,8 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             # Вычисляем время обработки
             process_time = time.time() - start_time
             
-            # Логируем в БД
-            log_user_activity(
+            # Логируем в БД (через буфер, пишется пачками)
+            self.activity_log.log(
                 action=f"{method} {path}",
                 endpoint=path,
                 method=method,
@@ -57,7 +63,7 @@ class SecurityMiddleware(BaseHTTPMiddleware):
             logger.error(f"❌ {method} {path} → Error: {e} ({process_time:.3f}s)")
             
             # Записываем ошибку
-            log_user_activity(
+            self.activity_log.log(
                 action=f"ERROR: {method} {path}",
                 endpoint=path,
                 method=method,
@@ -94,7 +100,8 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 reason = f"Attempt to access sensitive file: {sensitive}"
                 
                 # Логируем в БД как заблокированную активность
-                log_suspicious_activity(
+                await async_db.write(
+                    log_suspicious_activity,
                     ip_address=client_ip,
                     endpoint=path,
                     reason=reason,
@@ -123,7 +130,8 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 reason = f"Suspicious pattern detected: {pattern}"
                 
                 # Логируем в БД
-                log_suspicious_activity(
+                await async_db.write(
+                    log_suspicious_activity,
                     ip_address=client_ip,
                     endpoint=path,
                     reason=reason,
@@ -0,0 +1,72 @@
+import sqlite3
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Шаг схемы: SQL выражения и/или функция над курсором"""
+    version: int
+    description: str
+    statements: Tuple[str, ...] = ()
+    apply: Optional[Callable[[sqlite3.Cursor], None]] = None
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> int:
+    """
+    Применяет недостающие миграции по возрастанию версии.
+
+    Каждая миграция - отдельная транзакция BEGIN IMMEDIATE вместе с записью
+    в schema_migrations: либо применена целиком, либо нет. Версия
+    перепроверяется под блокировкой, поэтому несколько воркеров uvicorn
+    могут запускаться одновременно.
+
+    Returns:
+        Текущая версия схемы
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    for migration in sorted(migrations, key=lambda m: m.version):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            applied = conn.execute(
+                'SELECT 1 FROM schema_migrations WHERE version = ?', (migration.version,)
+            ).fetchone()
+            if applied:
+                conn.rollback()
+                continue
+
+            cursor = conn.cursor()
+            for statement in migration.statements:
+                cursor.execute(statement)
+            if migration.apply:
+                migration.apply(cursor)
+
+            cursor.execute(
+                'INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                (migration.version, migration.description)
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Migration {migration.version} ({migration.description}) failed: {e}")
+            raise
+
+        logger.info(f"🗂 Migration {migration.version} applied: {migration.description}")
+
+    return schema_version(conn)
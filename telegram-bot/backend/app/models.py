@@ -71,11 +71,50 @@ class PriceCalculation(BaseModel):
     payment_method: str
 
 
+class PaymentProofRequest(BaseModel):
+    """Подписанное сообщение из TonConnect sendTransaction"""
+    tx_boc: str = Field(..., min_length=1, description="BOC сообщения (base64)")
+
+
+class BroadcastRequest(BaseModel):
+    """Рассылка всем покупателям (HTML, как остальные сообщения бота)"""
+    text: str = Field(..., min_length=1, max_length=4096)
+
+
+class PaymentInstructions(BaseModel):
+    """Куда и с каким комментарием оплатить заказ в TON"""
+    address: str
+    amount_nano: str
+    amount_ton: float
+    comment: str
+    payload: str  # BOC комментария (base64) для TonConnect
+    expires_in: int
+
+
 class PurchaseResponse(BaseModel):
     """Ответ при покупке"""
     success: bool
+    order_id: Optional[int] = None
+    status: Optional[str] = None
+    payment: Optional[PaymentInstructions] = None
     tx_hash: Optional[str] = None
     amount: Optional[int] = None
     recipient: Optional[str] = None
     ton_viewer_link: Optional[str] = None
     error: Optional[str] = None
+    # Сколько секунд клиенту ждать финальной стадии заказа (оплата + подтверждение)
+    wait_timeout: Optional[int] = None
+
+
+class OrderStatusResponse(BaseModel):
+    """Текущее состояние заказа"""
+    success: bool
+    order_id: int
+    status: str
+    amount: int
+    recipient: str
+    tx_hash: Optional[str] = None
+    ton_viewer_link: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.database import claim_outbox_events, mark_outbox_sent, mark_outbox_failed, get_outbox_stats
+from app.telegram_notifier import TelegramNotifier
+from app.admin_digest import AdminDigest
+from app.db_async import async_db
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxDispatcher:
+    """
+    Доставка уведомлений о покупках из таблицы outbox.
+
+    События пишутся в одной транзакции с подтверждением заказа
+    (database.complete_order), поэтому воркер очереди не ждет Telegram.
+    Диспетчер забирает пачку готовых событий, доставляет их параллельно
+    (не больше concurrency одновременно), неудачные повторяет с
+    экспоненциальной задержкой, а после max_attempts переводит в dead.
+    """
+
+    def __init__(
+        self,
+        telegram_notifier: TelegramNotifier,
+        interval: float = 2.0,
+        batch_size: int = 50,
+        concurrency: int = 10,
+        max_attempts: int = 8,
+        retry_base: float = 5.0,
+        retry_max: float = 900.0,
+        lease: int = 120,
+        admin_digest: Optional[AdminDigest] = None
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+        self.handlers: Dict[str, Callable[..., Awaitable[bool]]] = {
+            "admin_purchase": admin_digest.purchase if admin_digest else telegram_notifier.notify_purchase_success,
+            "user_purchase": telegram_notifier.notify_user_purchase
+        }
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Outbox dispatcher started")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        """Новые события записаны - доставить, не дожидаясь interval"""
+        self._wakeup.set()
+
+    async def stats(self) -> Dict:
+        return {
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+            "by_status": await async_db.read(get_outbox_stats)
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.dispatch() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"❌ Outbox dispatch failed: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def dispatch(self) -> int:
+        """Один проход по готовым событиям. Возвращает их количество"""
+        events = await async_db.write(claim_outbox_events, self.batch_size, self.lease)
+        if events:
+            await asyncio.gather(*(self._deliver(event) for event in events))
+        return len(events)
+
+    async def _deliver(self, event: Dict):
+        handler = self.handlers.get(event["kind"])
+        error = None
+
+        async with self._semaphore:
+            try:
+                if handler is None:
+                    error = f"Unknown event kind: {event['kind']}"
+                elif not await handler(**event["payload"]):
+                    error = "Delivery rejected"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+        if error is None:
+            await async_db.write(mark_outbox_sent, event["id"])
+            self.delivered += 1
+            return
+
+        if handler is None or event["attempts"] >= self.max_attempts:
+            await async_db.write(mark_outbox_failed, event["id"], error, retry_in=None)
+            self.dead += 1
+            logger.error(
+                f"💀 Outbox event #{event['id']} ({event['kind']}, order #{event['order_id']}) "
+                f"dead after {event['attempts']} attempts: {error}"
+            )
+            return
+
+        retry_in = min(self.retry_base * 2 ** (event["attempts"] - 1), self.retry_max)
+        await async_db.write(mark_outbox_failed, event["id"], error, retry_in=retry_in)
+        self.retried += 1
+        logger.warning(
+            f"⚠️ Outbox event #{event['id']} ({event['kind']}) failed: {error}, retry in {retry_in:.0f}s"
+        )
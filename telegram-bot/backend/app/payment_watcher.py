@@ -0,0 +1,260 @@
+import time
+import base64
+import secrets
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from pytoniq_core import begin_cell
+
+from app.database import get_state, set_state, get_order_by_payment_comment, record_payment_issue
+from app.db_async import async_db
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_COMMENT_PREFIX = "stars-"
+
+
+def new_payment_comment() -> str:
+    """Уникальный комментарий, по которому платеж связывается с заказом"""
+    return f"{PAYMENT_COMMENT_PREFIX}{secrets.token_hex(5)}"
+
+
+def comment_payload(comment: str) -> str:
+    """Base64 BOC текстового комментария (op=0) для TonConnect"""
+    cell = begin_cell().store_uint(0, 32).store_snake_string(comment).end_cell()
+    return base64.b64encode(cell.to_boc()).decode()
+
+
+class PaymentWatcher:
+    """
+    Входящие платежи на кошелек магазина (settings.wallet_address).
+
+    Читает транзакции адреса из tonapi инкрементально: курсор по logical
+    time хранится в БД, каждый проход берет только транзакции после него
+    (страницами по возрастанию lt). Ожидаемые платежи лежат в словаре
+    комментарий -> заказ, поэтому каждый перевод сопоставляется с заказом
+    за O(1). Заказы без оплаты дольше payment_timeout закрываются.
+
+    Перевод на заказ, которого нет в словаре этого процесса (его создал
+    другой процесс или он пережил рестарт), засчитывается, если заказ
+    в БД все еще ждет оплату.
+
+    Ожидание снимается только после успешного обработчика: если он упал,
+    курсор остается перед транзакцией и она обрабатывается повторно.
+    Деньги, которые нельзя засчитать заказу (недоплата, оплата после
+    таймаута, повторная оплата), записываются в payment_issues для
+    возврата оператором.
+    """
+
+    CURSOR_KEY = "payment_watcher_lt"
+
+    def __init__(
+        self,
+        api_key: str,
+        address: str,
+        base_url: str = "https://tonapi.io",
+        interval: float = 5.0,
+        page_size: int = 100,
+        payment_timeout: float = 1800.0,
+        request_timeout: float = 10.0
+    ):
+        self.api_key = api_key
+        self.address = address
+        self.base_url = base_url
+        self.interval = interval
+        self.page_size = page_size
+        self.payment_timeout = payment_timeout
+        self.request_timeout = request_timeout
+        # комментарий -> (order_id, ожидаемая сумма в nano, время создания)
+        self.expected: Dict[str, Tuple[int, int, float]] = {}
+        # False из on_paid - заказ уже не ждет оплату
+        self.on_paid: Optional[Callable[[int, str, int], Awaitable[Optional[bool]]]] = None
+        self.on_failed: Optional[Callable[[int, str], Awaitable[None]]] = None
+        self.cursor_lt: Optional[int] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self.requests = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.expired = 0
+        self.issues = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.request_timeout
+            )
+
+        cursor = await async_db.read(get_state, self.CURSOR_KEY)
+        self.cursor_lt = int(cursor) if cursor else None
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"✅ Payment watcher started (lt cursor={self.cursor_lt})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def expect(self, order_id: int, comment: str, amount_nano: int, created_at: Optional[float] = None):
+        self.expected[comment] = (order_id, amount_nano, created_at or time.time())
+
+    def stats(self) -> Dict:
+        return {
+            "awaiting": len(self.expected),
+            "cursor_lt": self.cursor_lt,
+            "matched": self.matched,
+            "unmatched": self.unmatched,
+            "expired": self.expired,
+            "issues": self.issues,
+            "requests": self.requests
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+                await self._expire()
+            except Exception as e:
+                logger.error(f"❌ Payment watcher poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _fetch_page(self, after_lt: Optional[int]) -> List[Dict]:
+        params = {"limit": self.page_size, "sort_order": "asc" if after_lt else "desc"}
+        if after_lt:
+            params["after_lt"] = after_lt
+
+        response = await self._client.get(f"/v2/blockchain/accounts/{self.address}/transactions", params=params)
+        self.requests += 1
+        response.raise_for_status()
+        return response.json().get("transactions", [])
+
+    async def poll(self):
+        """Обрабатывает все транзакции после курсора"""
+        if self.cursor_lt is None:
+            # Первый запуск: начинаем с последней транзакции, историю не сканируем
+            latest = await self._fetch_page(None)
+            await self._save_cursor(latest[0]["lt"] if latest else 0)
+            return
+
+        while True:
+            transactions = await self._fetch_page(self.cursor_lt)
+
+            processed_lt = None
+            for tx in transactions:
+                try:
+                    await self._process(tx)
+                except Exception as e:
+                    # Курсор остается перед этой транзакцией - повтор на следующем проходе
+                    logger.error(f"❌ Payment tx {tx.get('hash', '')} not processed, will retry: {e}")
+                    if processed_lt is not None:
+                        await self._save_cursor(processed_lt)
+                    return
+                processed_lt = tx["lt"]
+
+            if transactions:
+                await self._save_cursor(transactions[-1]["lt"])
+
+            if len(transactions) < self.page_size:
+                break
+
+    async def _save_cursor(self, lt: int):
+        self.cursor_lt = int(lt)
+        await async_db.write(set_state, self.CURSOR_KEY, str(self.cursor_lt))
+
+    async def _process(self, tx: Dict):
+        """Исключение из обработчика не снимает ожидание - транзакция будет обработана снова"""
+        in_msg = tx.get("in_msg") or {}
+        if in_msg.get("msg_type") != "int_msg" or not tx.get("success", True):
+            return
+
+        comment = ((in_msg.get("decoded_body") or {}).get("text") or "").strip()
+        value = int(in_msg.get("value", 0))
+        tx_hash = tx.get("hash", "")
+
+        expected = self.expected.get(comment) if comment else None
+        if expected is None:
+            if comment.startswith(PAYMENT_COMMENT_PREFIX):
+                await self._unexpected_payment(comment, tx_hash, value)
+            else:
+                self.unmatched += 1
+            return
+
+        order_id, amount_nano, _ = expected
+        await self._match(comment, order_id, amount_nano, tx_hash, value)
+        self.expected.pop(comment, None)
+
+    async def _match(self, comment: str, order_id: int, amount_nano: int, tx_hash: str, value: int):
+        """Засчитывает перевод заказу (или фиксирует недоплату)"""
+        if value < amount_nano:
+            logger.error(
+                f"❌ Order #{order_id}: underpaid {value / 1_000_000_000:.4f} TON "
+                f"of {amount_nano / 1_000_000_000:.4f} TON (tx {tx_hash})"
+            )
+            await self._record_issue(order_id, tx_hash, value, amount_nano, "underpaid")
+            if self.on_failed:
+                await self.on_failed(order_id, "Payment amount is too low")
+        else:
+            logger.info(f"💎 Order #{order_id}: payment {value / 1_000_000_000:.4f} TON received (tx {tx_hash})")
+            if self.on_paid and await self.on_paid(order_id, tx_hash, value) is False:
+                await self._unexpected_payment(comment, tx_hash, value, credit=False)
+            else:
+                self.matched += 1
+
+    async def _unexpected_payment(self, comment: str, tx_hash: str, value: int, credit: bool = True):
+        """Перевод с комментарием заказа, которого нет среди ожидаемых этого процесса"""
+        order = await async_db.read(get_order_by_payment_comment, comment)
+        if order is None:
+            self.unmatched += 1
+            return
+
+        # Повторная обработка уже засчитанного платежа (например, после рестарта)
+        if order["payment_tx_hash"] == tx_hash:
+            return
+
+        # expected - в памяти процесса, а курсор общий в БД: заказ мог создать
+        # другой процесс. Пробуем засчитать - on_paid переводит заказ
+        # из awaiting_payment в queued только если он все еще ждет оплату
+        if credit and not order["payment_tx_hash"]:
+            await self._match(comment, order["id"], int(order["payment_amount_nano"] or 0), tx_hash, value)
+            return
+
+        # Заказ не был оплачен (истек/закрыт) или оплачен другой транзакцией
+        reason = "duplicate_payment" if order["payment_tx_hash"] else "late_payment"
+        logger.error(
+            f"❌ Order #{order['id']}: {reason.replace('_', ' ')} {value / 1_000_000_000:.4f} TON "
+            f"in status {order['status']} (tx {tx_hash})"
+        )
+        await self._record_issue(order["id"], tx_hash, value, int(order["payment_amount_nano"] or 0), reason)
+
+    async def _record_issue(self, order_id: int, tx_hash: str, value: int, expected_nano: int, reason: str):
+        if await async_db.write(record_payment_issue, order_id, tx_hash, value, expected_nano, reason):
+            self.issues += 1
+            logger.warning(f"💸 Order #{order_id}: payment recorded for refund review ({reason})")
+
+    async def _expire(self):
+        deadline = time.time() - self.payment_timeout
+        for comment, (order_id, _, created_at) in list(self.expected.items()):
+            if created_at >= deadline:
+                continue
+
+            logger.warning(f"⌛ Order #{order_id}: payment not received in {self.payment_timeout:.0f}s")
+            try:
+                if self.on_failed:
+                    await self.on_failed(order_id, "Payment not received")
+            except Exception as e:
+                # Ожидание остается - повтор на следующем проходе
+                logger.error(f"❌ Order #{order_id}: payment handler failed: {e}")
+                continue
+
+            self.expected.pop(comment, None)
+            self.expired += 1
@@ -0,0 +1,496 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.fragment.client import FragmentClient
+from app.fragment.transaction import TonTransaction
+from app.fragment.confirmation import ConfirmationTracker
+from app.payment_watcher import PaymentWatcher
+from app.outbox import OutboxDispatcher
+from app.admin_digest import AdminDigest
+from app.db_async import async_db
+from app.database import (
+    get_order,
+    get_inflight_orders,
+    transition_order,
+    complete_order,
+    claim_order_send,
+    record_payment_issue
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OrderStatus:
+    """
+    Состояния заказа:
+    [awaiting_payment →] queued → recipient_resolved → req_id_obtained → buy_link_obtained
+    → tx_sent → confirmed, из любой незавершенной стадии → failed.
+    awaiting_payment - заказ с оплатой TON ждет входящий платеж.
+    needs_review - отправка TON начиналась, но ее исход неизвестен: заказ
+    не закрывается как failed (TON мог уйти) и разбирается вручную.
+    """
+    AWAITING_PAYMENT = "awaiting_payment"
+    QUEUED = "queued"
+    RECIPIENT_RESOLVED = "recipient_resolved"
+    REQ_ID_OBTAINED = "req_id_obtained"
+    BUY_LINK_OBTAINED = "buy_link_obtained"
+    TX_SENT = "tx_sent"
+    CONFIRMED = "confirmed"
+    FAILED = "failed"
+    NEEDS_REVIEW = "needs_review"
+
+    FINAL = (CONFIRMED, FAILED, NEEDS_REVIEW)
+
+
+class PurchaseQueue:
+    """
+    Очередь покупок с ограниченным пулом воркеров.
+
+    /api/purchase только создает заказ и ставит его в очередь, а воркеры
+    проходят Fragment → TON. Подтвержденный заказ, покупка и уведомления
+    записываются одной транзакцией, уведомления доставляет OutboxDispatcher.
+    Пропускная способность ограничена числом воркеров, а не открытыми
+    HTTP соединениями.
+    """
+
+    def __init__(
+        self,
+        fragment_client: FragmentClient,
+        ton_transaction: TonTransaction,
+        outbox: Optional[OutboxDispatcher] = None,
+        workers: int = 4,
+        max_size: int = 1000,
+        confirmation_tracker: Optional[ConfirmationTracker] = None,
+        payment_watcher: Optional[PaymentWatcher] = None,
+        admin_digest: Optional[AdminDigest] = None
+    ):
+        self.fragment_client = fragment_client
+        self.ton_transaction = ton_transaction
+        self.outbox = outbox
+        self.admin_digest = admin_digest
+        # Без трекера заказ считается подтвержденным сразу после отправки
+        self.confirmation_tracker = confirmation_tracker
+        if confirmation_tracker:
+            confirmation_tracker.on_confirmed = self._on_confirmed
+            confirmation_tracker.on_failed = self._on_failed
+            confirmation_tracker.on_unresolved = self._on_unresolved
+        self.payment_watcher = payment_watcher
+        if payment_watcher:
+            payment_watcher.on_paid = self._on_paid
+            payment_watcher.on_failed = self._on_payment_failed
+        self.workers_count = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._workers: List[asyncio.Task] = []
+        self._requeue_task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.failed = 0
+        self.needs_review = 0
+
+    async def start(self):
+        for n in range(self.workers_count):
+            self._workers.append(asyncio.create_task(self._worker(n)))
+        logger.info(f"✅ Purchase queue started ({self.workers_count} workers)")
+
+    async def stop(self):
+        tasks = self._workers + ([self._requeue_task] if self._requeue_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        self._requeue_task = None
+        logger.info("👋 Purchase queue stopped")
+
+    def submit(self, order_id: int) -> bool:
+        """Ставит заказ в очередь. False - очередь переполнена"""
+        try:
+            self.queue.put_nowait(order_id)
+            return True
+        except asyncio.QueueFull:
+            logger.error(f"❌ Purchase queue is full, order #{order_id} rejected")
+            return False
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self.queue.qsize(),
+            "max_size": self.queue.maxsize,
+            "workers": self.workers_count,
+            "processed": self.processed,
+            "failed": self.failed,
+            "needs_review": self.needs_review
+        }
+
+    async def _worker(self, n: int):
+        while True:
+            order_id = await self.queue.get()
+            try:
+                order = await async_db.read(get_order, order_id)
+                if not order:
+                    logger.error(f"❌ Order #{order_id} not found")
+                    continue
+
+                await self.process_order(order)
+                self.processed += 1
+            except Exception as e:
+                logger.error(f"❌ Worker {n} failed on order #{order_id}: {e}")
+                try:
+                    await self._abort(order_id, str(e))
+                except Exception as abort_error:
+                    logger.error(f"❌ Could not close order #{order_id} after failure: {abort_error}")
+            finally:
+                self.queue.task_done()
+
+    async def _abort(self, order_id: int, error: str):
+        """Закрывает заказ после исключения - из его текущего состояния"""
+        order = await async_db.read(get_order, order_id)
+        if not order or order["status"] in OrderStatus.FINAL:
+            return
+
+        # После claim_order_send TON мог уйти: не failed и без возврата резерва
+        if order["status"] == OrderStatus.TX_SENT or order["send_attempted_at"]:
+            await self._needs_review(order, error)
+        else:
+            await self._fail(order, error)
+
+    async def _fail(self, order: Dict, error: str):
+        failed = await async_db.write(transition_order, order["id"], order["status"], OrderStatus.FAILED, error=error)
+        self.ton_transaction.ledger.release(order["id"])
+
+        # Покупатель уже заплатил TON - оплата уходит на возврат
+        if failed and order.get("payment_tx_hash"):
+            payment_nano = int(order["payment_amount_nano"] or 0)
+            if await async_db.write(
+                record_payment_issue,
+                order["id"], order["payment_tx_hash"], payment_nano, payment_nano, "order_failed"
+            ):
+                logger.warning(f"💸 Order #{order['id']}: paid order failed, payment recorded for refund")
+        self.failed += 1
+        if self.admin_digest:
+            self.admin_digest.failure(order["id"], error)
+
+    async def _needs_review(self, order: Dict, error: str):
+        """
+        Исход отправки TON неизвестен. Резерв не возвращается: если перевод
+        ушел, баланс уже меньше, а зависший резерв снимет сверка ledger по ttl.
+        """
+        if not await async_db.write(
+            transition_order, order["id"], order["status"], OrderStatus.NEEDS_REVIEW,
+            error=f"{error} - check wallet manually"
+        ):
+            return
+
+        logger.error(f"🔎 [#{order['id']}] Moved to manual review: {error}")
+        self.needs_review += 1
+        if self.admin_digest:
+            self.admin_digest.failure(order["id"], f"Needs manual review: {error}")
+
+    async def recover(self):
+        """
+        Восстановление незавершенных заказов после рестарта.
+
+        Заказы до отправки TON продолжаются со своей стадии. Если отправка
+        уже начиналась (send_attempted_at), но tx_sent не записан - мы не
+        знаем, ушла ли транзакция, поэтому заказ уходит на ручную проверку
+        без повторной отправки TON. Заказам, ожидающим отправки, заново
+        резервируется баланс, а ожидающие оплату снова передаются PaymentWatcher.
+        Не поместившиеся в очередь заказы дописываются в фоне по мере
+        освобождения места.
+        """
+        orders = get_inflight_orders(OrderStatus.FINAL)
+        resumed = abandoned = 0
+        deferred: List[int] = []
+
+        for order in orders:
+            if order["status"] == OrderStatus.AWAITING_PAYMENT:
+                if self.payment_watcher:
+                    created_at = datetime.strptime(order["created_at"], "%Y-%m-%d %H:%M:%S")
+                    self.payment_watcher.expect(
+                        order["id"],
+                        order["payment_comment"],
+                        int(order["payment_amount_nano"]),
+                        created_at.replace(tzinfo=timezone.utc).timestamp()
+                    )
+                continue
+
+            if order["status"] == OrderStatus.BUY_LINK_OBTAINED and order["send_attempted_at"]:
+                await self._needs_review(order, "Interrupted during TON send")
+                abandoned += 1
+                continue
+
+            if order["status"] == OrderStatus.BUY_LINK_OBTAINED:
+                if not await self.ton_transaction.reserve_balance(order["id"], int(order["amount_nano"])):
+                    await self._fail(order, "Insufficient hot wallet balance")
+                    abandoned += 1
+                    continue
+
+            if self.submit(order["id"]):
+                resumed += 1
+            else:
+                deferred.append(order["id"])
+
+        if orders:
+            logger.info(f"♻️ Recovery: {resumed} orders resumed, {abandoned} abandoned, {len(deferred)} deferred")
+        if deferred:
+            logger.warning(f"⏳ Purchase queue is full, {len(deferred)} recovered orders will be queued as it drains")
+            self._requeue_task = asyncio.create_task(self._requeue(deferred))
+
+    async def _requeue(self, order_ids: List[int]):
+        """Ставит отложенные при восстановлении заказы, ожидая места в очереди"""
+        for order_id in order_ids:
+            await self.queue.put(order_id)
+        logger.info(f"♻️ Recovery: {len(order_ids)} deferred orders queued")
+
+    async def payment_received(self, order_id: int, payment_tx_hash: str) -> bool:
+        """Оплата подтверждена: заказ переходит в очередь покупок"""
+        if not await async_db.write(
+            transition_order,
+            order_id, OrderStatus.AWAITING_PAYMENT, OrderStatus.QUEUED,
+            payment_tx_hash=payment_tx_hash
+        ):
+            return False
+
+        # Оплата уже получена - ждем места в очереди, а не отклоняем заказ
+        await self.queue.put(order_id)
+        return True
+
+    async def _on_paid(self, order_id: int, payment_tx_hash: str, amount_nano: int) -> bool:
+        return await self.payment_received(order_id, payment_tx_hash)
+
+    async def _on_payment_failed(self, order_id: int, error: str):
+        order = await async_db.read(get_order, order_id)
+        if order and order["status"] == OrderStatus.AWAITING_PAYMENT:
+            await self._fail(order, error)
+
+    async def process_order(self, order: Dict):
+        """Проводит заказ по состояниям, начиная с текущего"""
+        handlers = {
+            OrderStatus.QUEUED: self._resolve_recipient,
+            OrderStatus.RECIPIENT_RESOLVED: self._obtain_req_id,
+            OrderStatus.REQ_ID_OBTAINED: self._obtain_buy_link,
+            OrderStatus.BUY_LINK_OBTAINED: self._send_transaction,
+            OrderStatus.TX_SENT: self._await_confirmation if self.confirmation_tracker else self._finalize,
+        }
+
+        while order and order["status"] in handlers:
+            advanced = await handlers[order["status"]](order)
+            if not advanced:
+                return
+            order = await async_db.read(get_order, order["id"])
+
+    async def _resolve_recipient(self, order: Dict) -> bool:
+        order_id = order["id"]
+        username = order["recipient_username"]
+
+        # Проверяем пользователя
+        logger.info(f"1️⃣ [#{order_id}] Checking recipient in Fragment...")
+        recipient = await self.fragment_client.fetch_recipient(username)
+
+        if not recipient:
+            await self._fail(order, f"User @{username} not found in Fragment")
+            return False
+
+        return await async_db.write(
+            transition_order,
+            order_id, order["status"], OrderStatus.RECIPIENT_RESOLVED,
+            recipient=recipient
+        )
+
+    async def _obtain_req_id(self, order: Dict) -> bool:
+        order_id = order["id"]
+
+        # Получаем request ID
+        logger.info(f"2️⃣ [#{order_id}] Getting request ID from Fragment...")
+        req_id = await self.fragment_client.fetch_req_id(order["recipient"], order["amount"])
+
+        if not req_id:
+            await self._fail(order, "Failed to initialize purchase request")
+            return False
+
+        return await async_db.write(
+            transition_order,
+            order_id, order["status"], OrderStatus.REQ_ID_OBTAINED,
+            req_id=req_id
+        )
+
+    async def _obtain_buy_link(self, order: Dict) -> bool:
+        order_id = order["id"]
+
+        # Получаем параметры транзакции
+        logger.info(f"3️⃣ [#{order_id}] Fetching transaction parameters...")
+        address, amount_nano, payload = await self.fragment_client.fetch_buy_link(
+            order["recipient"], order["req_id"], order["amount"]
+        )
+
+        if not address or not amount_nano or not payload:
+            await self._fail(order, "Failed to get transaction parameters")
+            return False
+
+        # Резервируем сумму: заказ без покрытия не принимаем
+        if not await self.ton_transaction.reserve_balance(order_id, int(amount_nano)):
+            logger.error(f"❌ [#{order_id}] Not enough free hot wallet balance for {int(amount_nano) / 1_000_000_000:.4f} TON")
+            await self._fail(order, "Insufficient hot wallet balance")
+            return False
+
+        advanced = await async_db.write(
+            transition_order,
+            order_id, order["status"], OrderStatus.BUY_LINK_OBTAINED,
+            tx_address=address,
+            amount_nano=str(amount_nano),
+            payload=payload
+        )
+        if not advanced:
+            self.ton_transaction.ledger.release(order_id)
+        return advanced
+
+    async def _send_transaction(self, order: Dict) -> bool:
+        order_id = order["id"]
+
+        # Отправка уже начиналась - повторно TON не шлем
+        if order["send_attempted_at"]:
+            logger.error(f"❌ [#{order_id}] TON send was already attempted, skipping resend")
+            await self._needs_review(order, "TON send was already attempted")
+            return False
+
+        # Фиксируем попытку ДО отправки: после рестарта заказ не отправится второй раз
+        if not await async_db.write(claim_order_send, order_id, order["status"], datetime.now().isoformat()):
+            return False
+
+        # Конвертируем amount из nano в TON
+        amount_ton = float(order["amount_nano"]) / 1_000_000_000
+        logger.info(f"✅ [#{order_id}] Transaction params: {amount_ton:.4f} TON → {order['tx_address']}")
+
+        # Отправляем транзакцию
+        logger.info(f"4️⃣ [#{order_id}] Sending TON transaction...")
+        try:
+            success, tx_hash, error, sent_from = await self.ton_transaction.send_ton_transaction(
+                recipient=order["tx_address"],
+                amount_ton=amount_ton,
+                payload=order["payload"],
+                stars=order["amount"]
+            )
+        except Exception as e:
+            # Перевод уже передан кошельку и мог уйти в сеть - резерв не возвращаем
+            logger.error(f"❌ [#{order_id}] TON send outcome unknown: {e}")
+            await self._needs_review(order, f"TON send outcome unknown: {e}")
+            return False
+
+        # Отклонен до отправки (нет кошелька, сумма, баланс) - TON не ушел
+        if not success or not tx_hash:
+            await self._fail(order, error or "Transaction failed")
+            return False
+
+        wallet_address, seqno = sent_from or (None, None)
+
+        # Баланс кошелька уже уменьшен - резерв переходит в in flight до подтверждения
+        self.ton_transaction.ledger.commit(order_id, wallet_address, int(order["amount_nano"]))
+
+        # tx_hash может быть bytes или str
+        if isinstance(tx_hash, str):
+            tx_hash_hex = tx_hash
+        else:
+            tx_hash_hex = tx_hash.hex()
+
+        # TON Viewer принимает просто hex, без base64
+        ton_viewer_link = f"https://tonviewer.com/transaction/{tx_hash_hex}"
+        logger.info(f"🔗 [#{order_id}] TON Viewer: {ton_viewer_link}")
+
+        return await async_db.write(
+            transition_order,
+            order_id, order["status"], OrderStatus.TX_SENT,
+            wallet_address=wallet_address,
+            seqno=seqno,
+            tx_hash=tx_hash_hex,
+            ton_viewer_link=ton_viewer_link
+        )
+
+    async def _await_confirmation(self, order: Dict) -> bool:
+        """Передает заказ трекеру; дальше его ведут _on_confirmed/_on_failed"""
+        logger.info(f"5️⃣ [#{order['id']}] Waiting for on-chain confirmation...")
+        self.confirmation_tracker.track(
+            order_id=order["id"],
+            tx_hash=order["tx_hash"],
+            wallet_address=order["wallet_address"],
+            seqno=order["seqno"],
+            sent_at=datetime.fromisoformat(order["send_attempted_at"]).timestamp()
+        )
+        return False
+
+    async def _on_confirmed(self, order_id: int, tx: Dict):
+        self.ton_transaction.ledger.settle(order_id)
+        order = await async_db.read(get_order, order_id)
+        if order and order["status"] == OrderStatus.TX_SENT:
+            await self._finalize(order)
+
+    async def _on_failed(self, order_id: int, error: str):
+        self.ton_transaction.ledger.settle(order_id)
+        order = await async_db.read(get_order, order_id)
+        if order and order["status"] == OrderStatus.TX_SENT:
+            await self._fail(order, error)
+
+    async def _on_unresolved(self, order_id: int, reason: str):
+        order = await async_db.read(get_order, order_id)
+        if order and order["status"] == OrderStatus.TX_SENT:
+            await self._needs_review(order, reason)
+
+    async def _finalize(self, order: Dict) -> bool:
+        confirmed = await async_db.write(
+            complete_order,
+            order["id"],
+            order["status"],
+            OrderStatus.CONFIRMED,
+            purchase=self._purchase_record(order),
+            events=self._outbox_events(order)
+        )
+        if confirmed and self.outbox:
+            self.outbox.wake()
+        return confirmed
+
+    @staticmethod
+    def _purchase_record(order: Dict) -> Optional[Dict]:
+        """Поля для таблицы purchases (история покупателя)"""
+        if not order["user_id"]:
+            logger.warning("⚠️ Buyer ID not provided - purchase not linked to user. Make sure to open Mini-App through Telegram bot.")
+            return None
+
+        return {
+            "user_id": order["user_id"],
+            "recipient_username": order["recipient_username"],
+            "amount": order["amount"],
+            "payment_method": order["payment_method"],
+            "tx_hash": order["tx_hash"],
+            "ton_viewer_link": order["ton_viewer_link"],
+            "ip_address": order["ip_address"],
+            "username": order["username"],
+            "first_name": order["first_name"],
+            "user_agent": order["user_agent"]
+        }
+
+    def _outbox_events(self, order: Dict) -> List[tuple]:
+        """Уведомления в Telegram: админу и покупателю"""
+        if not self.outbox:
+            return []
+
+        buyer_id = order["user_id"]
+        events = [("admin_purchase", {
+            "buyer_id": buyer_id,
+            "buyer_username": order["username"],
+            "buyer_first_name": order["first_name"] or "User",
+            "recipient_username": order["recipient_username"],
+            "amount": order["amount"],
+            "tx_hash": order["tx_hash"],
+            "ton_viewer_link": order["ton_viewer_link"]
+        })]
+
+        if buyer_id:
+            events.append(("user_purchase", {
+                "user_id": buyer_id,
+                "recipient_username": order["recipient_username"],
+                "amount": order["amount"],
+                "tx_hash": order["tx_hash"],
+                "ton_viewer_link": order["ton_viewer_link"],
+                "web_app_url": settings.web_app_url
+            }))
+
+        return events
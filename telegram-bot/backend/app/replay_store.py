@@ -0,0 +1,69 @@
+import time
+import logging
+from typing import Dict, Set
+
+from app.database import record_processed_transaction, prune_processed_transactions
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayStore:
+    """
+    Защита от повторного использования платежных сообщений.
+
+    В памяти - пара ротируемых множеств: хэши последних window секунд
+    (не больше max_entries в каждом поколении), проверка без обращения к БД.
+    Источник истины - таблица processed_transactions с уникальным индексом:
+    он переживает рестарт и общий для всех воркеров uvicorn. Записи старше
+    retention_days удаляются при ротации, поэтому таблица тоже не растет.
+    """
+
+    def __init__(self, window: float = 3600.0, max_entries: int = 100_000, retention_days: int = 30):
+        self.window = window
+        self.max_entries = max_entries
+        self.retention_days = retention_days
+        self._current: Set[str] = set()
+        self._previous: Set[str] = set()
+        self._rotated_at = time.monotonic()
+        self.replays = 0
+
+    def _rotate(self):
+        # Поколение живет от window/2 до window секунд
+        if (
+            time.monotonic() - self._rotated_at < self.window / 2
+            and len(self._current) < self.max_entries
+        ):
+            return
+
+        self._previous = self._current
+        self._current = set()
+        self._rotated_at = time.monotonic()
+
+        try:
+            pruned = prune_processed_transactions(self.retention_days)
+            if pruned:
+                logger.info(f"🧹 Pruned {pruned} processed transactions older than {self.retention_days} days")
+        except Exception as e:
+            logger.error(f"Failed to prune processed transactions: {e}")
+
+    def add(self, tx_hash: str) -> bool:
+        """Отмечает хэш обработанным. False - он уже был (повтор)"""
+        self._rotate()
+
+        if tx_hash in self._current or tx_hash in self._previous:
+            self.replays += 1
+            return False
+
+        is_new = record_processed_transaction(tx_hash)
+        self._current.add(tx_hash)
+
+        if not is_new:
+            self.replays += 1
+        return is_new
+
+    def stats(self) -> Dict:
+        return {
+            "in_memory": len(self._current) + len(self._previous),
+            "window": self.window,
+            "replays": self.replays
+        }
@@ -4,9 +4,126 @@ from datetime import datetime
 from typing import Optional, List, Dict
 from pathlib import Path
 
+from app.migrations import Migration, run_migrations
+
 logger = logging.getLogger(__name__)
 
 
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description="base schema",
+        statements=(
+            # Таблица транзакций
+            '''
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE NOT NULL,
+                    buyer_telegram_id INTEGER,
+                    buyer_username TEXT,
+                    buyer_first_name TEXT,
+                    recipient_username TEXT NOT NULL,
+                    amount_stars INTEGER NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    tx_hash TEXT,
+                    ton_viewer_link TEXT,
+                    status TEXT NOT NULL,
+                    error_message TEXT,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Таблица действий пользователей (логи)
+            '''
+                CREATE TABLE IF NOT EXISTS user_actions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER,
+                    username TEXT,
+                    action_type TEXT NOT NULL,
+                    endpoint TEXT,
+                    request_data TEXT,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    status_code INTEGER,
+                    error_message TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Таблица для rate limiting
+            '''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    action_type TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''',
+            # Индексы для быстрого поиска
+            'CREATE INDEX IF NOT EXISTS idx_transactions_buyer ON transactions(buyer_telegram_id)',
+            'CREATE INDEX IF NOT EXISTS idx_transactions_idempotency ON transactions(idempotency_key)',
+            'CREATE INDEX IF NOT EXISTS idx_user_actions_telegram_id ON user_actions(telegram_id)',
+            'CREATE INDEX IF NOT EXISTS idx_rate_limits_telegram_id ON rate_limits(telegram_id)',
+            'CREATE INDEX IF NOT EXISTS idx_rate_limits_ip ON rate_limits(ip_address)',
+        )
+    ),
+    Migration(
+        version=2,
+        description="composite indexes for hot queries",
+        statements=(
+            # get_user_transactions: buyer_telegram_id = ? ORDER BY created_at DESC
+            'CREATE INDEX IF NOT EXISTS idx_transactions_buyer_created ON transactions(buyer_telegram_id, created_at)',
+            'DROP INDEX IF EXISTS idx_transactions_buyer',
+            # idempotency_key UNIQUE - у SQLite уже есть свой индекс
+            'DROP INDEX IF EXISTS idx_transactions_idempotency',
+            # check_rate_limit: счетчик по (telegram_id | ip_address, action_type) за окно created_at
+            'CREATE INDEX IF NOT EXISTS idx_rate_limits_telegram_action ON rate_limits(telegram_id, action_type, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_rate_limits_ip_action ON rate_limits(ip_address, action_type, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_rate_limits_created ON rate_limits(created_at)',
+            'DROP INDEX IF EXISTS idx_rate_limits_telegram_id',
+            'DROP INDEX IF EXISTS idx_rate_limits_ip',
+        )
+    ),
+    Migration(
+        version=3,
+        description="incremental statistics counters",
+        statements=(
+            # Счетчики для get_statistics, обновляются вместе с log_transaction
+            '''
+                CREATE TABLE IF NOT EXISTS transaction_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            ''',
+            # Точное множество покупателей для unique_users
+            '''
+                CREATE TABLE IF NOT EXISTS transaction_buyers (
+                    buyer_telegram_id INTEGER PRIMARY KEY
+                )
+            ''',
+            # Однократный пересчет по уже накопленным транзакциям
+            '''
+                INSERT OR IGNORE INTO transaction_buyers (buyer_telegram_id)
+                SELECT DISTINCT buyer_telegram_id FROM transactions
+                WHERE buyer_telegram_id IS NOT NULL
+            ''',
+            '''
+                INSERT OR REPLACE INTO transaction_counters (name, value)
+                SELECT 'total_transactions', COUNT(*) FROM transactions
+                UNION ALL SELECT 'successful_transactions', COUNT(*) FROM transactions WHERE status = 'success'
+                UNION ALL SELECT 'total_stars', COALESCE(SUM(amount_stars), 0) FROM transactions WHERE status = 'success'
+                UNION ALL SELECT 'unique_users', COUNT(*) FROM transaction_buyers
+            ''',
+        )
+    ),
+]
+
+# Ключи get_statistics() = имена строк transaction_counters
+STATISTICS_COUNTERS = ('total_transactions', 'successful_transactions', 'total_stars', 'unique_users')
+
+
 class Database:
     
     def __init__(self, db_path: str = "data/transactions.db"):
@@ -20,70 +137,13 @@ class Database:
         return sqlite3.connect(self.db_path)
     
     def _create_tables(self):
-        """Создает таблицы если их нет"""
+        """Применяет миграции схемы"""
         conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Таблица транзакций
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                idempotency_key TEXT UNIQUE NOT NULL,
-                buyer_telegram_id INTEGER,
-                buyer_username TEXT,
-                buyer_first_name TEXT,
-                recipient_username TEXT NOT NULL,
-                amount_stars INTEGER NOT NULL,
-                payment_method TEXT NOT NULL,
-                tx_hash TEXT,
-                ton_viewer_link TEXT,
-                status TEXT NOT NULL,
-                error_message TEXT,
-                ip_address TEXT,
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица действий пользователей (логи)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_actions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER,
-                username TEXT,
-                action_type TEXT NOT NULL,
-                endpoint TEXT,
-                request_data TEXT,
-                ip_address TEXT,
-                user_agent TEXT,
-                status_code INTEGER,
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица для rate limiting
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rate_limits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER NOT NULL,
-                ip_address TEXT NOT NULL,
-                action_type TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Индексы для быстрого поиска
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_buyer ON transactions(buyer_telegram_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_idempotency ON transactions(idempotency_key)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_telegram_id ON user_actions(telegram_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_telegram_id ON rate_limits(telegram_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_ip ON rate_limits(ip_address)")
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Database tables created/verified")
+        try:
+            version = run_migrations(conn, MIGRATIONS)
+        finally:
+            conn.close()
+        logger.info(f"✅ Database tables created/verified (schema v{version})")
     
     def log_transaction(
         self,
@@ -118,6 +178,27 @@ class Database:
             ))
             
             transaction_id = cursor.lastrowid
+            
+            # Счетчики статистики - в той же транзакции
+            new_buyer = 0
+            if buyer_telegram_id is not None:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO transaction_buyers (buyer_telegram_id) VALUES (?)",
+                    (buyer_telegram_id,)
+                )
+                new_buyer = cursor.rowcount
+            success = status == 'success'
+            deltas = {
+                'total_transactions': 1,
+                'successful_transactions': int(success),
+                'total_stars': amount_stars if success else 0,
+                'unique_users': new_buyer
+            }
+            cursor.executemany("""
+                INSERT INTO transaction_counters (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            """, [(name, delta) for name, delta in deltas.items() if delta])
+            
             conn.commit()
             logger.info(f"✅ Transaction logged: ID={transaction_id}")
             return transaction_id
@@ -195,7 +276,7 @@ class Database:
         # Очищаем старые записи
         cursor.execute("""
             DELETE FROM rate_limits 
-            WHERE datetime(created_at) < datetime('now', '-' || ? || ' minutes')
+            WHERE created_at < datetime('now', '-' || ? || ' minutes')
         """, (window_minutes,))
         
         # Считаем текущие запросы
@@ -203,13 +284,13 @@ class Database:
             cursor.execute("""
                 SELECT COUNT(*) FROM rate_limits
                 WHERE telegram_id = ? AND action_type = ?
-                AND datetime(created_at) >= datetime('now', '-' || ? || ' minutes')
+                AND created_at >= datetime('now', '-' || ? || ' minutes')
             """, (telegram_id, action_type, window_minutes))
         else:
             cursor.execute("""
                 SELECT COUNT(*) FROM rate_limits
                 WHERE ip_address = ? AND action_type = ?
-                AND datetime(created_at) >= datetime('now', '-' || ? || ' minutes')
+                AND created_at >= datetime('now', '-' || ? || ' minutes')
             """, (ip_address, action_type, window_minutes))
         
         count = cursor.fetchone()[0]
@@ -247,26 +328,16 @@ class Database:
         return [dict(zip(columns, row)) for row in rows]
     
     def get_statistics(self) -> Dict:
+        """Статистика из transaction_counters, без агрегатов по transactions"""
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        stats = {}
-        
-        # Всего транзакций
-        cursor.execute("SELECT COUNT(*) FROM transactions")
-        stats['total_transactions'] = cursor.fetchone()[0]
-        
-        # Успешных транзакций
-        cursor.execute("SELECT COUNT(*) FROM transactions WHERE status = 'success'")
-        stats['successful_transactions'] = cursor.fetchone()[0]
-        
-        # Сумма Stars
-        cursor.execute("SELECT SUM(amount_stars) FROM transactions WHERE status = 'success'")
-        stats['total_stars'] = cursor.fetchone()[0] or 0
-        
-        # Уникальных пользователей
-        cursor.execute("SELECT COUNT(DISTINCT buyer_telegram_id) FROM transactions")
-        stats['unique_users'] = cursor.fetchone()[0]
+        placeholders = ', '.join('?' for _ in STATISTICS_COUNTERS)
+        cursor.execute(
+            f"SELECT name, value FROM transaction_counters WHERE name IN ({placeholders})",
+            STATISTICS_COUNTERS
+        )
+        counters = dict(cursor.fetchall())
         
         conn.close()
-        return stats
+        return {name: counters.get(name, 0) for name in STATISTICS_COUNTERS}
@@ -1,46 +1,271 @@
+import time
+import heapq
+import asyncio
 import httpx
 import logging
-from typing import Optional
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Set, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+class TokenBucket:
+    """Токены пополняются со скоростью rate в секунду, не больше capacity"""
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def delay(self) -> float:
+        """Секунд до появления токена (0 - можно отправлять)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+    
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class SendJob:
+    chat_id: int
+    payload: Dict
+    future: asyncio.Future
+    attempts: int = 0
+
+
+@dataclass
+class ChatState:
+    bucket: TokenBucket
+    queue: Deque[SendJob] = field(default_factory=deque)
+    blocked_until: float = 0.0
+    scheduled: bool = False
+    
+    def ready_at(self) -> float:
+        return max(time.monotonic() + self.bucket.delay(), self.blocked_until)
+
+
 class TelegramNotifier:
+    """
+    Отправка сообщений через Bot API с учетом лимитов Telegram.
+    
+    send_message ставит сообщение в очередь чата и ждет результата.
+    Планировщик выпускает сообщения по общему token bucket (global_rate
+    в секунду на бота) и по bucket каждого чата (chat_rate в секунду):
+    чаты упорядочены в куче по времени готовности, поэтому занятый чат
+    не задерживает остальные. Ответ 429 возвращает сообщение в начало
+    очереди его чата на retry_after секунд. HTTP клиент один на все отправки.
+    """
     
-    def __init__(self, bot_token: str, admin_id: int):
+    def __init__(
+        self,
+        bot_token: str,
+        admin_id: int,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        max_queue: int = 10000,
+        max_retries: int = 5,
+        request_timeout: float = 10.0
+    ):
         self.bot_token = bot_token
         self.admin_id = admin_id
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        self.chat_rate = chat_rate
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[int, ChatState] = {}
+        # (время готовности, порядковый номер, chat_id)
+        self._ready: List[Tuple[float, int, int]] = []
+        self._seq = 0
+        self._queued = 0
+        self._wakeup = asyncio.Event()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.rejected = 0
+    
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.request_timeout)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        
+        # Дожидаемся уже начатых запросов, остальные сообщения не отправлены
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        for chat in self._chats.values():
+            for job in chat.queue:
+                if not job.future.done():
+                    job.future.set_result(False)
+        self._chats.clear()
+        self._ready.clear()
+        self._queued = 0
+        
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queued,
+            "chats_waiting": sum(1 for chat in self._chats.values() if chat.queue),
+            "in_flight": len(self._sending),
+            "sent": self.sent,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "rejected": self.rejected
+        }
     
     async def send_message(self, chat_id: int, text: str, parse_mode: str = "HTML", reply_markup: dict = None):
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode,
+            "disable_web_page_preview": True
+        }
+        
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        
+        if self._task is None:
+            await self.start()
+        
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            logger.error(f"❌ Telegram send queue is full ({self._queued}), message to {chat_id} dropped")
+            return False
+        
+        job = SendJob(chat_id=chat_id, payload=payload, future=asyncio.get_running_loop().create_future())
+        self._enqueue(job)
+        return await job.future
+    
+    def _chat(self, chat_id: int) -> ChatState:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatState(bucket=TokenBucket(self.chat_rate))
+        return chat
+    
+    def _enqueue(self, job: SendJob, front: bool = False):
+        chat = self._chat(job.chat_id)
+        if front:
+            chat.queue.appendleft(job)
+        else:
+            chat.queue.append(job)
+        self._queued += 1
+        self._schedule(job.chat_id, chat)
+    
+    def _schedule(self, chat_id: int, chat: ChatState):
+        if chat.scheduled or not chat.queue:
+            return
+        chat.scheduled = True
+        self._seq += 1
+        heapq.heappush(self._ready, (chat.ready_at(), self._seq, chat_id))
+        self._wakeup.set()
+    
+    async def _wait(self, timeout: Optional[float]):
+        self._wakeup.clear()
         try:
-            payload = {
-                "chat_id": chat_id,
-                "text": text,
-                "parse_mode": parse_mode,
-                "disable_web_page_preview": True
-            }
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._prune()
+                await self._wait(None)
+                continue
             
-            if reply_markup:
-                payload["reply_markup"] = reply_markup
+            ready_at, _, chat_id = self._ready[0]
+            delay = max(ready_at - time.monotonic(), self._global.delay())
+            if delay > 0:
+                # Новое сообщение может оказаться готовым раньше - ждем и его
+                await self._wait(delay)
+                continue
             
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/sendMessage",
-                    json=payload
-                )
+            heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            chat.scheduled = False
+            
+            # После 429 чат мог быть заблокирован уже стоя в куче
+            if chat.ready_at() > time.monotonic():
+                self._schedule(chat_id, chat)
+                continue
+            
+            job = chat.queue.popleft()
+            self._queued -= 1
+            self._global.take()
+            chat.bucket.take()
+            self._schedule(chat_id, chat)
+            
+            task = asyncio.create_task(self._send(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+    
+    def _prune(self):
+        """Убирает простаивающие чаты с полным bucket - их лимит уже восстановился"""
+        idle = [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.queue and chat.bucket.full and chat.blocked_until <= time.monotonic()
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+    
+    async def _send(self, job: SendJob):
+        result = False
+        try:
+            response = await self._client.post(f"{self.base_url}/sendMessage", json=job.payload)
+            
+            if response.status_code == 429 and job.attempts < self.max_retries:
+                retry_after = (response.json().get("parameters") or {}).get("retry_after", 1)
+                job.attempts += 1
+                self.throttled += 1
+                logger.warning(f"⏳ Telegram 429 for chat {job.chat_id}, retry in {retry_after}s (attempt {job.attempts})")
+                
+                self._chat(job.chat_id).blocked_until = time.monotonic() + retry_after
+                self._enqueue(job, front=True)
+                return
+            
+            if response.status_code == 200:
+                logger.info(f"✅ Message sent to {job.chat_id}")
+                result = True
+            else:
+                logger.error(f"❌ Failed to send message: {response.text}")
                 
-                if response.status_code == 200:
-                    logger.info(f"✅ Message sent to {chat_id}")
-                    return True
-                else:
-                    logger.error(f"❌ Failed to send message: {response.text}")
-                    return False
-                    
         except Exception as e:
             logger.error(f"❌ Error sending message: {e}")
-            return False
+        
+        if result:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if not job.future.done():
+            job.future.set_result(result)
     
     async def notify_purchase_success(
         self,
@@ -91,6 +316,17 @@ class TelegramNotifier:
         
         return success
     
+    async def notify_low_balance(self, balance: float, threshold: float):
+        
+        admin_message = (
+            "🪫 <b>НИЗКИЙ БАЛАНС КОШЕЛЬКА</b>\n\n"
+            f"💰 Баланс: <b>{balance:.4f} TON</b>\n"
+            f"⚠️ Порог: {threshold} TON\n\n"
+            f"🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        
+        return await self.send_message(self.admin_id, admin_message)
+    
     async def notify_user_purchase(
         self,
         user_id: int,
@@ -0,0 +1,98 @@
+"""
+Бенчмарк локального разбора tx_boc (parse_signed_message): сколько
+подписанных сообщений TonConnect в секунду проверяется без tonapi.
+
+Сообщения подписываются локально кошельками WalletV4R2 и WalletV5R1
+(как их отдает sendTransaction): перевод на адрес магазина с комментарием
+заказа. Перед замером скрипт проверяет, что адрес, сумма и комментарий
+разобраны верно, а канонический хэш не зависит от кодировки BOC
+(base64 / hex / с индексом и crc32) и от приложенного state_init.
+
+Запуск из telegram-bot/backend:
+    python -m benchmarks.bench_boc_parse --messages 5000
+"""
+import argparse
+import base64
+import time
+
+from pytoniq_core import Address, begin_cell
+from tonutils.client import TonapiClient
+from tonutils.wallet import WalletV4R2, WalletV5R1
+
+from app.fragment.boc import parse_signed_message
+from app.payment_watcher import new_payment_comment
+
+
+SHOP_ADDRESS = "UQB-09E7MDYhYmkuubv0gsOL0Zpll4MwbuKfu5TB4XOG_dn3"
+
+
+def build_messages(count: int):
+    client = TonapiClient(api_key="offline")
+    wallets = [WalletV4R2.create(client)[0], WalletV5R1.create(client)[0]]
+    shop = Address(SHOP_ADDRESS)
+
+    messages = []
+    for i in range(count):
+        wallet = wallets[i % len(wallets)]
+        comment = new_payment_comment()
+        amount_nano = 350_000_000 + i
+        body = begin_cell().store_uint(0, 32).store_snake_string(comment).end_cell()
+        internal = wallet.create_wallet_internal_message(destination=shop, value=amount_nano, body=body)
+        signed = wallet.raw_create_transfer_msg(private_key=wallet.private_key, messages=[internal], seqno=i + 1)
+        state_init = wallet.state_init if i % 7 == 0 else None
+        external = wallet.create_external_msg(dest=wallet.address, body=signed, state_init=state_init)
+        messages.append((external, comment, amount_nano))
+    return messages
+
+
+def check(messages):
+    shop = Address(SHOP_ADDRESS)
+    for external, comment, amount_nano in messages[:200]:
+        cell = external.serialize()
+        encodings = [
+            base64.b64encode(cell.to_boc()).decode(),
+            cell.to_boc().hex(),
+            base64.b64encode(cell.to_boc(has_idx=True, hash_crc32=True)).decode(),
+        ]
+        parsed = [parse_signed_message(boc) for boc in encodings]
+
+        assert len({p.message_hash for p in parsed}) == 1, "canonical hash depends on encoding"
+        transfer = parsed[0].transfers[0]
+        assert transfer.destination == shop
+        assert transfer.amount_nano == amount_nano
+        assert transfer.comment == comment
+
+    # state_init не меняет канонический хэш
+    external, _, _ = messages[0]
+    with_init = parse_signed_message(base64.b64encode(external.serialize().to_boc()).decode())
+    external.init = None
+    without_init = parse_signed_message(base64.b64encode(external.serialize().to_boc()).decode())
+    assert with_init.message_hash == without_init.message_hash, "state_init changes canonical hash"
+
+
+def main(count: int, rounds: int):
+    messages = build_messages(count)
+    check(messages)
+    print("✅ destination, amount, comment and canonical hash verified")
+
+    bocs = [base64.b64encode(external.serialize().to_boc()).decode() for external, _, _ in messages]
+
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for boc in bocs:
+            parse_signed_message(boc)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"messages={count} best={best * 1000:.1f} ms")
+    print(f"throughput: {count / best:,.0f} BOC/s ({best / count * 1e6:.1f} us/BOC)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.messages, args.rounds)
@@ -0,0 +1,94 @@
+"""
+Микро-бенчмарк decode_payload: старая версия (генератор по байтам +
+re.sub + re.search с компиляцией шаблона на каждый вызов) против
+bytes.translate + split/join + кэшированного маркера.
+
+Корпус - payload в формате Fragment (BOC ячейки с op=0 и текстом
+"N Telegram Stars ... Ref#..."), плюс случайные байты. Перед замером
+скрипт проверяет, что обе версии дают одинаковый результат.
+
+Запуск из telegram-bot/backend:
+    python -m benchmarks.bench_decode_payload --payloads 20000
+"""
+import argparse
+import base64
+import random
+import re
+import string
+import time
+
+from pytoniq_core import begin_cell
+
+from app.fragment.transaction import decode_payload_text, fix_base64_padding
+
+
+def legacy_decode(encoded_payload: str, stars: int) -> str:
+    decoded_bytes = base64.b64decode(fix_base64_padding(encoded_payload))
+    decoded_text = ''.join(
+        chr(b) if 32 <= b < 127 else ' '
+        for b in decoded_bytes
+    )
+    clean_text = re.sub(r'\s+', ' ', decoded_text).strip()
+    match = re.search(rf"{stars} Telegram Stars.*", clean_text)
+    return match.group(0) if match else clean_text
+
+
+def fragment_payload(rnd: random.Random, stars: int) -> str:
+    ref = "".join(rnd.choices(string.ascii_letters + string.digits, k=rnd.randint(6, 40)))
+    text = rnd.choice([
+        f"{stars} Telegram Stars \n\nRef#{ref}",
+        f"{stars} Telegram Stars for @{ref.lower()}\n\nRef#{ref}",
+        f"Telegram Premium {stars}\t\tRef#{ref}",
+        f"\x00\x01{stars} Telegram Stars  \r\n Ref#{ref} ✨",
+    ])
+    cell = begin_cell().store_uint(0, 32).store_snake_string(text).end_cell()
+    return base64.b64encode(cell.to_boc()).decode().rstrip("=")
+
+
+def random_payload(rnd: random.Random) -> str:
+    data = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 300)))
+    return base64.b64encode(data).decode()
+
+
+def build_corpus(count: int, seed: int = 42):
+    rnd = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        stars = rnd.choice([50, 100, 250, 500, 1000, 2500, 10000, rnd.randint(50, 1_000_000)])
+        payload = random_payload(rnd) if i % 10 == 9 else fragment_payload(rnd, stars)
+        corpus.append((payload, stars))
+    return corpus
+
+
+def measure(func, corpus) -> float:
+    start = time.perf_counter()
+    for payload, stars in corpus:
+        func(payload, stars)
+    return time.perf_counter() - start
+
+
+def main(payloads: int, rounds: int):
+    corpus = build_corpus(payloads)
+
+    mismatches = [
+        (payload, stars) for payload, stars in corpus
+        if legacy_decode(payload, stars) != decode_payload_text(payload, stars)
+    ]
+    assert not mismatches, f"{len(mismatches)} payloads decoded differently, first: {mismatches[0]}"
+    print(f"✅ {payloads} payloads decoded identically")
+
+    legacy = min(measure(legacy_decode, corpus) for _ in range(rounds))
+    current = min(measure(decode_payload_text, corpus) for _ in range(rounds))
+
+    print(f"legacy:    {legacy * 1000:8.1f} ms ({legacy / payloads * 1e6:.2f} us/payload)")
+    print(f"translate: {current * 1000:8.1f} ms ({current / payloads * 1e6:.2f} us/payload)")
+    print(f"speedup:   {legacy / current:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.payloads, args.rounds)
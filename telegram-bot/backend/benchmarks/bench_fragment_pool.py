@@ -0,0 +1,154 @@
+"""
+Бенчмарк: задержка одной покупки (3 последовательных запроса к Fragment)
+с новым httpx.AsyncClient на каждый запрос и с общим пулом FragmentClient.
+
+Запуск из telegram-bot/backend:
+    python -m benchmarks.bench_fragment_pool --purchases 200 --handshake-ms 30
+
+Fragment заменен локальным stub-сервером. Стоимость установки соединения
+(TCP + TLS до fragment.com) эмулируется задержкой --handshake-ms на каждое
+новое подключение, так как stub работает по обычному HTTP.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from app.fragment.client import FragmentClient
+
+
+RESPONSES = {
+    "searchStarsRecipient": {"found": {"recipient": "stub_recipient", "name": "Stub"}},
+    "initBuyStarsRequest": {"req_id": "stub_req_id"},
+    "getBuyStarsLink": {
+        "ok": True,
+        "transaction": {
+            "messages": [{"address": "EQstub", "amount": "1000000", "payload": "AAAA"}]
+        }
+    },
+}
+
+
+class StubFragmentServer:
+    """Минимальный HTTP/1.1 keep-alive сервер, отвечающий как Fragment API"""
+
+    def __init__(self, handshake_ms: float):
+        self.handshake = handshake_ms / 1000
+        self.connections = 0
+        self.server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        # Эмуляция TCP/TLS рукопожатия
+        await asyncio.sleep(self.handshake)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = (await reader.readexactly(length)).decode() if length else ""
+
+                method = next(
+                    (name for name in RESPONSES if f"method={name}" in body),
+                    "searchStarsRecipient"
+                )
+                payload = json.dumps(RESPONSES[method]).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(payload)).encode() + b"\r\n"
+                    b"Connection: keep-alive\r\n\r\n" + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def purchase_per_call_clients(url: str):
+    """Поведение до пула: новый AsyncClient на каждый шаг покупки"""
+    for data in (
+        {"query": "durov", "method": "searchStarsRecipient"},
+        {"recipient": "stub_recipient", "quantity": 100, "method": "initBuyStarsRequest"},
+        {"id": "stub_req_id", "method": "getBuyStarsLink"},
+    ):
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(url, data=data)
+            response.json()
+
+
+async def purchase_pooled(client: FragmentClient):
+    recipient = await client.fetch_recipient("durov")
+    req_id = await client.fetch_req_id(recipient, 100)
+    await client.fetch_buy_link(recipient, req_id, 100)
+
+
+def report(name: str, samples: list, connections: int):
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(
+        f"{name:<22} mean={statistics.mean(samples_ms):7.2f} ms  "
+        f"p50={statistics.median(samples_ms):7.2f} ms  p95={p95:7.2f} ms  "
+        f"connections={connections}"
+    )
+    return statistics.mean(samples_ms)
+
+
+async def main(purchases: int, handshake_ms: float):
+    stub = StubFragmentServer(handshake_ms)
+    base_url = await stub.start()
+
+    # 1. Новый клиент на каждый запрос
+    samples = []
+    for _ in range(purchases):
+        start = time.perf_counter()
+        await purchase_per_call_clients(f"{base_url}/api?hash=bench")
+        samples.append(time.perf_counter() - start)
+    before = report("per-call AsyncClient", samples, stub.connections)
+
+    # 2. Общий пул FragmentClient
+    stub.connections = 0
+    client = FragmentClient(
+        fragment_hash="bench",
+        fragment_data={},
+        fragment_address="",
+        fragment_publickey="",
+        fragment_wallets="",
+        base_url=base_url,
+        cache_ttl=0  # измеряем только пул, без кэша searchStarsRecipient
+    )
+    await client.start()
+    samples = []
+    for _ in range(purchases):
+        start = time.perf_counter()
+        await purchase_pooled(client)
+        samples.append(time.perf_counter() - start)
+    await client.close()
+    after = report("pooled FragmentClient", samples, stub.connections)
+
+    print(f"\nSaved per purchase: {before - after:.2f} ms ({(1 - after / before) * 100:.1f}%)")
+    await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.purchases, args.handshake_ms))
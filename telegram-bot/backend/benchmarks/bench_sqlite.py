@@ -0,0 +1,92 @@
+"""
+Бенчмарк слоя SQLite: прежний get_db (новое соединение на каждый вызов,
+журнал rollback) против ConnectionManager (долгоживущие соединения, WAL,
+synchronous=NORMAL, кэш выражений, отдельное соединение для чтения).
+
+Замеряются вставки log_user_activity (их делает middleware на каждый
+запрос) и чтения get_order. Каждый режим работает со своей временной БД.
+
+Запуск из telegram-bot/backend:
+    python -m benchmarks.bench_sqlite --inserts 5000 --reads 20000
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import app.database as db
+
+
+@contextmanager
+def legacy_get_db():
+    conn = sqlite3.connect(db.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def run(label: str, inserts: int, reads: int):
+    order_id = db.create_order(
+        user_id=1, username="bench", first_name="Bench", recipient_username="recipient",
+        amount=50, payment_method="ton", ip_address="127.0.0.1", user_agent="bench"
+    )
+
+    start = time.perf_counter()
+    for i in range(inserts):
+        db.log_user_activity(
+            action="api_request", endpoint="/api/check_user", method="POST",
+            ip_address="127.0.0.1", user_agent="bench", user_id=i,
+            response_status=200, response_time=0.01
+        )
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(reads):
+        assert db.get_order(order_id)["id"] == order_id
+    read_time = time.perf_counter() - start
+
+    print(
+        f"{label:<8} inserts: {inserts / insert_time:>9,.0f}/s   "
+        f"reads: {reads / read_time:>9,.0f}/s"
+    )
+    return inserts / insert_time, reads / read_time
+
+
+def main(inserts: int, reads: int):
+    logging.disable(logging.CRITICAL)
+    current_get_db, current_get_read_db = db.get_db, db.get_read_db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, "legacy.db")
+        db.get_db = db.get_read_db = legacy_get_db
+        # Прежний режим журнала (WAL сохраняется в файле БД)
+        with legacy_get_db() as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        db.init_database()
+        before = run("before", inserts, reads)
+
+        db.DATABASE_PATH = os.path.join(tmp, "wal.db")
+        db.get_db, db.get_read_db = current_get_db, current_get_read_db
+        db.init_database()
+        after = run("after", inserts, reads)
+        db.close_database()
+
+    print(f"speedup  inserts: x{after[0] / before[0]:.1f}   reads: x{after[1] / before[1]:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inserts", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args()
+
+    main(args.inserts, args.reads)
@@ -0,0 +1,125 @@
+"""
+Проверка планов горячих запросов: каждая схема (app.database и
+app.security.database) создается миграциями в пустой временной БД, для
+запросов снимается EXPLAIN QUERY PLAN. Полный просмотр таблицы
+("SCAN <table>" без индекса) или сортировка во временном B-дереве
+("USE TEMP B-TREE") считаются ошибкой - значит, запросу не хватает
+индекса.
+
+Запуск из telegram-bot/backend:
+    python -m benchmarks.check_query_plans
+"""
+import importlib.util
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+
+import app.database as db
+from app.migrations import run_migrations
+
+
+def load_security_db():
+    # app/security/__init__.py импортирует отсутствующий app.security.middleware,
+    # поэтому модуль схемы грузится напрямую из файла
+    path = os.path.join(os.path.dirname(db.__file__), "security", "database.py")
+    spec = importlib.util.spec_from_file_location("security_database", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# (название, SQL, параметры) - те же выражения, что в функциях модулей
+APP_QUERIES = [
+    ("get_order", "SELECT * FROM orders WHERE id = ?", (1,)),
+    ("get_user_purchases",
+     "SELECT * FROM purchases WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (1, 50)),
+    ("get_purchase_user_ids",
+     "SELECT user_id FROM purchase_users WHERE user_id > ? ORDER BY user_id LIMIT ?", (0, 200)),
+    ("count_purchase_users", "SELECT value FROM stats_counters WHERE name = 'unique_users'", ()),
+    ("get_statistics",
+     f"SELECT name, value FROM stats_counters WHERE name IN ({', '.join('?' * len(db.STATISTICS_COUNTERS))})",
+     db.STATISTICS_COUNTERS),
+    ("get_user_activity(user_id)",
+     "SELECT * FROM user_activity_logs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (1, 100)),
+    ("get_user_activity(ip_address)",
+     "SELECT * FROM user_activity_logs WHERE ip_address = ? ORDER BY created_at DESC LIMIT ?", ("127.0.0.1", 100)),
+    ("get_user_activity()",
+     "SELECT * FROM user_activity_logs ORDER BY created_at DESC LIMIT ?", (100,)),
+    ("get_suspicious_activity",
+     "SELECT * FROM suspicious_activity ORDER BY created_at DESC LIMIT ?", (100,)),
+    ("get_broadcasts", "SELECT * FROM broadcasts WHERE status = ? ORDER BY id", ("running",)),
+    ("claim_outbox_events",
+     "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= datetime('now') "
+     "ORDER BY next_attempt_at LIMIT ?", (50,)),
+    ("get_order_by_payment_comment", "SELECT * FROM orders WHERE payment_comment = ?", ("stars-0",)),
+    ("get_payment_issues",
+     "SELECT * FROM payment_issues WHERE status = ? ORDER BY id DESC LIMIT ?", ("open", 100)),
+    ("prune_processed_transactions",
+     "DELETE FROM processed_transactions WHERE created_at < datetime('now', ?)", ("-30 days",)),
+]
+
+SECURITY_QUERIES = [
+    ("get_transaction_by_idempotency_key",
+     "SELECT * FROM transactions WHERE idempotency_key = ?", ("key",)),
+    ("get_user_transactions",
+     "SELECT * FROM transactions WHERE buyer_telegram_id = ? ORDER BY created_at DESC LIMIT ?", (1, 10)),
+    ("get_statistics",
+     "SELECT name, value FROM transaction_counters WHERE name IN (?, ?, ?, ?)",
+     ("total_transactions", "successful_transactions", "total_stars", "unique_users")),
+    ("check_rate_limit(cleanup)",
+     "DELETE FROM rate_limits WHERE created_at < datetime('now', '-' || ? || ' minutes')", (1,)),
+    ("check_rate_limit(telegram_id)",
+     "SELECT COUNT(*) FROM rate_limits WHERE telegram_id = ? AND action_type = ? "
+     "AND created_at >= datetime('now', '-' || ? || ' minutes')", (1, "purchase", 1)),
+    ("check_rate_limit(ip_address)",
+     "SELECT COUNT(*) FROM rate_limits WHERE ip_address = ? AND action_type = ? "
+     "AND created_at >= datetime('now', '-' || ? || ' minutes')", ("127.0.0.1", "purchase", 1)),
+]
+
+
+def problems(plan):
+    found = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            found.append(detail)
+        if "USE TEMP B-TREE" in detail:
+            found.append(detail)
+    return found
+
+
+def check(conn: sqlite3.Connection, queries) -> int:
+    failures = 0
+    for name, sql, params in queries:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        bad = problems(plan)
+        failures += bool(bad)
+        print(f"{'FAIL' if bad else 'ok':<4}  {name:<36} {' | '.join(plan)}")
+    return failures
+
+
+def main() -> int:
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, "app.db")
+        db.init_database()
+        conn = sqlite3.connect(db.DATABASE_PATH)
+        print("app.database:")
+        failures = check(conn, APP_QUERIES)
+        conn.close()
+        db.close_database()
+
+        conn = sqlite3.connect(os.path.join(tmp, "transactions.db"))
+        run_migrations(conn, load_security_db().MIGRATIONS)
+        print("\napp.security.database:")
+        failures += check(conn, SECURITY_QUERIES)
+        conn.close()
+
+    print(f"\n{failures} queries without a suitable index" if failures else "\nall plans use indexes")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Стресс-проверка WalletSender: N параллельных покупок через
+TonTransaction.send_ton_transaction на фейковых кошельках.
+Два прогона: без пакетной отправки (одна покупка = одно внешнее
+сообщение, каждое со своим seqno) и с пакетами до --batch-max-messages.
+--wallets N раскидывает покупки по пулу из N горячих кошельков.
+
+Фейковая сеть принимает сообщение только с текущим seqno кошелька
+и применяет его с задержкой (как блокчейн). Скрипт падает, если два
+сообщения ушли с одним seqno или какое-то сообщение было отвергнуто.
+Проверка уникальности seqno содержательна в прогоне без пакетов: там
+число внешних сообщений равно числу покупок.
+
+Запуск из telegram-bot/backend:
+    python -m benchmarks.stress_wallet_sender --purchases 100 --wallets 3
+"""
+import argparse
+import asyncio
+import base64
+import time
+
+from app.fragment.transaction import TonTransaction
+
+
+FRAGMENT_ADDRESS = "EQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAM9c"
+
+
+class FakeAddress:
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def to_str(self) -> str:
+        return self.name
+
+
+class FakeChainWallet:
+    """Кошелек + сеть: seqno растет через block_time после принятого сообщения"""
+
+    def __init__(self, name: str, block_time: float):
+        self.client = None
+        self.address = FakeAddress(name)
+        self.block_time = block_time
+        self.chain_seqno = 0
+        self.sent_seqnos = []
+        self.rejected = []
+
+    async def get_seqno(self, client, address) -> int:
+        await asyncio.sleep(0.001)
+        return self.chain_seqno
+
+    async def _apply(self, seqno: int):
+        await asyncio.sleep(self.block_time)
+        if seqno == self.chain_seqno:
+            self.chain_seqno += 1
+        else:
+            self.rejected.append(seqno)
+
+    async def batch_transfer(self, data_list, seqno: int) -> str:
+        await asyncio.sleep(0.002)
+        self.sent_seqnos.append(seqno)
+        asyncio.get_running_loop().create_task(self._apply(seqno))
+        return f"{seqno:064x}"
+
+
+async def run(purchases: int, wallets: int, block_time: float, batch_max_messages: int, batch_window_ms: float):
+    ton = TonTransaction(
+        api_key="",
+        mnemonic=[],
+        poll_interval=block_time / 4,
+        batch_max_messages=batch_max_messages,
+        batch_window=batch_window_ms / 1000
+    )
+    chain = [FakeChainWallet(f"fake-wallet-{n}", block_time) for n in range(wallets)]
+    for wallet in chain:
+        hot = await ton.add_wallet(wallet)
+        ton.pool.update_balance(hot, 10_000 * 1_000_000_000)
+    ton.wallet = chain[0]
+    ton.balance_updated_at = time.time()
+
+    payload = base64.b64encode(b"\x00\x00\x00\x00100 Telegram Stars Ref#stress").decode()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        ton.send_ton_transaction(recipient=FRAGMENT_ADDRESS, amount_ton=0.5, payload=payload, stars=100)
+        for _ in range(purchases)
+    ))
+    elapsed = time.perf_counter() - start
+
+    # Ждем применения последнего сообщения
+    await asyncio.sleep(block_time * 2)
+    await ton.close()
+
+    ok = sum(1 for success, _, _, _ in results if success)
+    print(f"batch_max_messages={batch_max_messages} purchases={purchases} ok={ok} elapsed={elapsed:.2f}s")
+
+    for wallet, hot in zip(chain, ton.pool.wallets):
+        unique = len(set(wallet.sent_seqnos))
+        print(f"[{hot.address}] sent={hot.sent} unique seqnos={unique} "
+              f"rejected by chain={len(wallet.rejected)} final seqno={wallet.chain_seqno}")
+        print(f"[{hot.address}] external messages={hot.sender.batches} "
+              f"avg batch size={hot.sender.stats()['avg_batch_size']}")
+
+        assert unique == len(wallet.sent_seqnos), "two sends shared a seqno"
+        assert not wallet.rejected, "chain rejected messages"
+        assert wallet.chain_seqno == hot.sender.batches
+
+    assert ok == purchases, "some sends failed"
+
+    if batch_max_messages == 1:
+        messages = sum(len(wallet.sent_seqnos) for wallet in chain)
+        assert messages == purchases, f"expected {purchases} external messages, got {messages}"
+        print(f"✅ {purchases} unbatched sends, no two shared a seqno")
+    else:
+        print("✅ batched sends, no two external messages shared a seqno")
+
+
+async def main(purchases: int, wallets: int, block_time: float, batch_max_messages: int, batch_window_ms: float):
+    await run(purchases, wallets, block_time, 1, batch_window_ms)
+    if batch_max_messages > 1:
+        print()
+        await run(purchases, wallets, block_time, batch_max_messages, batch_window_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=100)
+    parser.add_argument("--wallets", type=int, default=1)
+    parser.add_argument("--block-time", type=float, default=0.02)
+    parser.add_argument("--batch-max-messages", type=int, default=100)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.purchases, args.wallets, args.block_time, args.batch_max_messages, args.batch_window_ms))